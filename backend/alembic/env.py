@@ -18,11 +18,11 @@ from app.config import settings
 
 # Import all models to ensure they're registered with Base
 from app.models.user import User
-from app.models.file import File
+from app.models.file import Blob, File, FileManifest
 from app.models.session import Session
 from app.models.audit import AuditLog
 from app.models.scheduler import ScheduledTask, TaskExecutionHistory
-from app.models.sync import SyncLog, UploadChunk
+from app.models.sync import SyncLog, UploadSession, UploadStat
 from app.models.settings import SystemSetting
 
 # Alembic Config object
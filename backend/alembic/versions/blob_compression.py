@@ -0,0 +1,30 @@
+"""Record the storage codec and compressed size of blobs
+
+Revision ID: blob_compression
+Revises: upload_reservations
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'blob_compression'
+down_revision: Union[str, None] = 'upload_reservations'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'blobs',
+        sa.Column('codec', sa.String(20), server_default='identity', nullable=False)
+    )
+    op.add_column('blobs', sa.Column('stored_size', sa.BigInteger, nullable=True))
+    op.add_column('blobs', sa.Column('compression_seconds', sa.Float, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('blobs', 'compression_seconds')
+    op.drop_column('blobs', 'stored_size')
+    op.drop_column('blobs', 'codec')
@@ -0,0 +1,42 @@
+"""Add content-addressed blobs referenced by files
+
+Revision ID: content_blobs
+Revises: upload_chunk_ledger
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = 'content_blobs'
+down_revision: Union[str, None] = 'upload_chunk_ledger'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create blobs table
+    op.create_table(
+        'blobs',
+        sa.Column('id', UUID(as_uuid=True), primary_key=True),
+        sa.Column('checksum', sa.String(64), nullable=False, unique=True),
+        sa.Column('storage_path', sa.String(500), nullable=False),
+        sa.Column('size', sa.BigInteger, nullable=False),
+        sa.Column('ref_count', sa.Integer, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False)
+    )
+    
+    # Existing files keep their own paths until re-uploaded
+    op.add_column(
+        'files',
+        sa.Column('blob_id', UUID(as_uuid=True), sa.ForeignKey('blobs.id'), nullable=True)
+    )
+    op.create_index('ix_files_blob_id', 'files', ['blob_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_blob_id', table_name='files')
+    op.drop_column('files', 'blob_id')
+    op.drop_table('blobs')
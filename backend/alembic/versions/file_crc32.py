@@ -0,0 +1,23 @@
+"""Store the CRC-32 of file content for precomputed archive layouts
+
+Revision ID: file_crc32
+Revises: blob_compression
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'file_crc32'
+down_revision: Union[str, None] = 'blob_compression'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('crc32', sa.BigInteger, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('files', 'crc32')
@@ -0,0 +1,38 @@
+"""Add chunk manifests and checksum verification flag
+
+Revision ID: file_manifests
+Revises: initial
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+
+# revision identifiers, used by Alembic.
+revision: str = 'file_manifests'
+down_revision: Union[str, None] = 'initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'files',
+        sa.Column('checksum_verified', sa.Boolean, server_default=sa.text('true'), nullable=False)
+    )
+    
+    # Create file_manifests table
+    op.create_table(
+        'file_manifests',
+        sa.Column('file_id', UUID(as_uuid=True), sa.ForeignKey('files.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('chunk_size', sa.BigInteger, nullable=False),
+        sa.Column('chunk_checksums', JSONB, nullable=False),
+        sa.Column('tree_hash', sa.String(64), nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('file_manifests')
+    op.drop_column('files', 'checksum_verified')
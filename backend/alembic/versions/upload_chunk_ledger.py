@@ -0,0 +1,43 @@
+"""Replace per-chunk upload rows with a ledger on upload sessions
+
+Revision ID: upload_chunk_ledger
+Revises: upload_sessions
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+# revision identifiers, used by Alembic.
+revision: str = 'upload_chunk_ledger'
+down_revision: Union[str, None] = 'upload_sessions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # In-flight uploads cannot be carried over; clients re-initialize them
+    op.execute('DELETE FROM upload_sessions')
+    op.add_column(
+        'upload_sessions',
+        sa.Column('chunk_checksums', ARRAY(sa.String(64)), nullable=False)
+    )
+    op.drop_table('upload_chunks')
+
+
+def downgrade() -> None:
+    op.create_table(
+        'upload_chunks',
+        sa.Column('id', UUID(as_uuid=True), primary_key=True),
+        sa.Column('upload_id', UUID(as_uuid=True), nullable=False, index=True),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('total_chunks', sa.Integer, nullable=False),
+        sa.Column('chunk_number', sa.Integer, nullable=False),
+        sa.Column('chunk_size', sa.BigInteger, nullable=False),
+        sa.Column('checksum', sa.String(64), nullable=False),
+        sa.Column('uploaded_at', sa.DateTime, nullable=False),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+        sa.Column('file_path', sa.String(500), nullable=False)
+    )
+    op.drop_column('upload_sessions', 'chunk_checksums')
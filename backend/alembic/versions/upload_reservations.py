@@ -0,0 +1,26 @@
+"""Track preallocation of upload files for disk-space reservations
+
+Revision ID: upload_reservations
+Revises: upload_stats
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'upload_reservations'
+down_revision: Union[str, None] = 'upload_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'upload_sessions',
+        sa.Column('preallocated', sa.Boolean, server_default=sa.text('false'), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('upload_sessions', 'preallocated')
@@ -0,0 +1,39 @@
+"""Add persistent upload sessions
+
+Revision ID: upload_sessions
+Revises: file_manifests
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = 'upload_sessions'
+down_revision: Union[str, None] = 'file_manifests'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create upload_sessions table
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', UUID(as_uuid=True), sa.ForeignKey('users.id'), nullable=False, index=True),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('mime_type', sa.String(100), nullable=True),
+        sa.Column('file_size', sa.BigInteger, nullable=False),
+        sa.Column('chunk_size', sa.BigInteger, nullable=False),
+        sa.Column('total_chunks', sa.Integer, nullable=False),
+        sa.Column('received_chunks', sa.LargeBinary, nullable=False),
+        sa.Column('bytes_received', sa.BigInteger, default=0, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('last_activity', sa.DateTime, nullable=False),
+        sa.Column('expires_at', sa.DateTime, nullable=False, index=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('upload_sessions')
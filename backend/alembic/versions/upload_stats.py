@@ -0,0 +1,44 @@
+"""Add upload throughput stats and client link speed hints
+
+Revision ID: upload_stats
+Revises: content_blobs
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = 'upload_stats'
+down_revision: Union[str, None] = 'content_blobs'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'upload_sessions',
+        sa.Column('link_speed', sa.BigInteger, nullable=True)
+    )
+    
+    # Create upload_stats table
+    op.create_table(
+        'upload_stats',
+        sa.Column('id', UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', UUID(as_uuid=True), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('file_size', sa.BigInteger, nullable=False),
+        sa.Column('chunk_size', sa.BigInteger, nullable=False),
+        sa.Column('total_chunks', sa.Integer, nullable=False),
+        sa.Column('link_speed', sa.BigInteger, nullable=True),
+        sa.Column('duration_seconds', sa.Float, nullable=False),
+        sa.Column('throughput', sa.BigInteger, nullable=True),
+        sa.Column('completed_at', sa.DateTime, nullable=False)
+    )
+    op.create_index('ix_upload_stats_completed_at', 'upload_stats', ['completed_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_upload_stats_completed_at', table_name='upload_stats')
+    op.drop_table('upload_stats')
+    op.drop_column('upload_sessions', 'link_speed')
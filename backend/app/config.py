@@ -21,12 +21,28 @@ class Settings(BaseSettings):
     PASSWORD_MIN_LENGTH: int = 12
     MAX_LOGIN_ATTEMPTS: int = 5
     ACCOUNT_LOCKOUT_MINUTES: int = 30
+    TRUSTED_PROXIES: list = []  # Proxy addresses or networks whose X-Forwarded-For is believed
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024 * 1024  # 10 GB
-    CHUNK_SIZE: int = 50 * 1024 * 1024  # 50 MB
-    MAX_CONCURRENT_UPLOADS: int = 3
-    MAX_CONCURRENT_DOWNLOADS: int = 5
+    CHUNK_SIZE: int = 50 * 1024 * 1024  # 50 MB, cap while upload throughput is unknown
+    MIN_CHUNK_SIZE: int = 1 * 1024 * 1024  # 1 MB
+    MAX_CHUNK_SIZE: int = 256 * 1024 * 1024  # 256 MB
+    UPLOAD_TARGET_CHUNKS: int = 32  # Chunks per upload when file size alone decides
+    UPLOAD_CHUNK_SECONDS: int = 30  # Target transfer time of a single chunk
+    UPLOAD_BUSY_SESSIONS: int = 20  # Active uploads at which chunk sizes are halved
+    UPLOAD_BLOCK_SIZE: int = 1024 * 1024  # 1 MB read/hash/write unit per chunk
+    HASH_WINDOW_SIZE: int = 8 * 1024 * 1024  # 8 MB memory-map window when hashing files
+    IO_POOL_WORKERS: int = 0  # Hashing and file I/O threads; 0 picks from the CPU count
+    MAX_CONCURRENT_UPLOADS: int = 3  # Per user
+    MAX_CONCURRENT_DOWNLOADS: int = 5  # Per user
+    MAX_GLOBAL_UPLOADS: int = 30
+    MAX_GLOBAL_DOWNLOADS: int = 50
+    MAX_INFLIGHT_UPLOAD_BYTES: int = 1024 * 1024 * 1024  # 1 GB of chunk bodies in flight
+    MAX_INFLIGHT_DOWNLOAD_BYTES: int = 1024 * 1024 * 1024  # 1 GB of downloads held in memory: small-file cache loads and read-ahead blocks
+    ADMISSION_QUEUE_LENGTH: int = 20  # Requests waiting for a slot before 429s
+    ADMISSION_WAIT_SECONDS: float = 2.0
+    UPLOAD_DISK_HEADROOM: int = 1024 * 1024 * 1024  # 1 GB always kept free by upload reservations
     
     # File Storage
     STORAGE_PATH: str = "/data"
@@ -35,6 +51,29 @@ class Settings(BaseSettings):
     TEMP_FILES_PATH: str = "/data/temp"
     BACKUP_PATH: str = "/data/backups"
     LOGS_PATH: str = "/data/logs"
+    STORAGE_COMPRESSION: bool = True  # Compress stored content of compressible types
+    COMPRESSION_LEVEL: int = 3  # zlib level; low levels keep ingest fast
+    COMPRESSION_FRAME_SIZE: int = 1024 * 1024  # 1 MB independently compressed frames
+    COMPRESSION_MAX_RATIO: float = 0.9  # Store raw unless compression saves at least 10%
+    COMPRESSION_MIN_SIZE: int = 64 * 1024  # Smaller files are stored raw
+    ARCHIVE_COMPRESSION_LEVEL: int = 6  # zlib level for bulk-download archives
+    ARCHIVE_PARALLEL_BLOCKS: int = 0  # Blocks per archive member deflated at once; 0 uses the I/O pool size
+    ARCHIVE_CACHE_SIZE: int = 20 * 1024 * 1024 * 1024  # 20 GB of finished archives kept under TEMP_FILES_PATH
+    ARCHIVE_JOB_TTL_MINUTES: int = 60  # Finished archive jobs are forgotten after this
+    MAX_CONCURRENT_ARCHIVE_BUILDS: int = 2  # Archives one user may have building at once per worker
+    MAX_GLOBAL_ARCHIVE_BUILDS: int = 4  # Archives building at once per worker
+    ARCHIVE_RETRY_AFTER_SECONDS: int = 30  # Retry-After sent when an archive build is refused
+    DOWNLOAD_OFFLOAD: str = ""  # "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd); empty serves from the app
+    DOWNLOAD_OFFLOAD_PREFIX: str = "/protected-files"  # Internal proxy location mapped to ACTIVE_FILES_PATH
+    DOWNLOAD_RATE_LIMIT: int = 0  # Bytes/second for all downloads per worker; 0 is unlimited
+    DOWNLOAD_USER_RATE_LIMIT: int = 0  # Bytes/second for one user's downloads; 0 is unlimited
+    DOWNLOAD_BURST_SECONDS: float = 0.5  # Burst allowance of each shaped transfer at its rate
+    SMALL_FILE_CACHE_SIZE: int = 256 * 1024 * 1024  # 256 MB of small files kept in memory per worker; 0 disables
+    SMALL_FILE_CACHE_MAX_FILE_SIZE: int = 1024 * 1024  # 1 MB, largest file cached
+    SMALL_FILE_CACHE_TTL_SECONDS: float = 60.0  # Bounds staleness after changes made by other workers
+    FILE_LOCATION_CACHE_ENTRIES: int = 10000  # File locations remembered per worker; 0 disables
+    SIGNED_URL_DEFAULT_SECONDS: int = 3600  # Lifetime of a signed download URL unless requested otherwise
+    SIGNED_URL_MAX_SECONDS: int = 7 * 24 * 3600  # Longest lifetime a signed download URL may be given
     
     # Sync Settings
     SYNC_ENABLED: bool = True
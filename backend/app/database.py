@@ -4,6 +4,7 @@ from sqlalchemy.orm import declarative_base
 from typing import AsyncGenerator
 
 from app.config import settings
+from app.utils.db_pool import InstrumentedPool
 
 # Create async engine
 engine = create_async_engine(
@@ -11,7 +12,8 @@ engine = create_async_engine(
     echo=settings.DEBUG,
     pool_pre_ping=True,
     pool_size=20,
-    max_overflow=0
+    max_overflow=0,
+    poolclass=InstrumentedPool
 )
 
 # Create async session factory
@@ -40,6 +42,20 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Finish a session's work and hand its connection back to the pool
+    
+    Called before returning a streaming response. With the pinned FastAPI,
+    ``get_db`` is already closed before the body is sent, so this only
+    moves the commit earlier; it keeps a slow download from holding a
+    pooled connection should a FastAPI upgrade run dependency teardown
+    after the response instead. The session stays usable; its next query
+    checks a connection out again.
+    """
+    await session.commit()
+
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
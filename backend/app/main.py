@@ -6,6 +6,8 @@ from contextlib import asynccontextmanager
 from app.config import settings
 from app.database import init_db
 from app.scheduler.manager import scheduler_manager
+from app.utils.io_pool import io_pool
+from app.utils.archive_jobs import archive_jobs
 
 
 @asynccontextmanager
@@ -26,6 +28,8 @@ async def lifespan(app: FastAPI):
     # Shutdown
     scheduler_manager.shutdown()
     print("Scheduler shut down")
+    await archive_jobs.shutdown()
+    io_pool.shutdown()
     print("Shutting down application")
 
 
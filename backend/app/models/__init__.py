@@ -2,9 +2,9 @@
 # Import all models to ensure they are registered with SQLAlchemy
 from app.models.user import User, UserRole
 from app.models.session import Session
-from app.models.file import File, SyncStatus
+from app.models.file import Blob, File, FileManifest, SyncStatus
 from app.models.audit import AuditLog
-from app.models.sync import SyncLog, SyncType, SyncLogStatus
+from app.models.sync import SyncLog, SyncType, SyncLogStatus, UploadSession, UploadStat
 from app.models.settings import SystemSetting
 from app.models.scheduler import ScheduledTask, TaskExecutionHistory, TaskStatus
 
@@ -12,12 +12,16 @@ __all__ = [
     "User",
     "UserRole",
     "Session",
+    "Blob",
     "File",
+    "FileManifest",
     "SyncStatus",
     "AuditLog",
     "SyncLog",
     "SyncType",
     "SyncLogStatus",
+    "UploadSession",
+    "UploadStat",
     "SystemSetting",
     "ScheduledTask",
     "TaskExecutionHistory",
@@ -1,8 +1,8 @@
 """File model"""
 import uuid
 from datetime import datetime
-from sqlalchemy import BigInteger, Boolean, Column, DateTime, Enum, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, String, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 import enum
 
@@ -26,7 +26,10 @@ class File(Base):
     filepath = Column(String(500), nullable=False)
     size = Column(BigInteger, nullable=False)
     checksum = Column(String(64), nullable=False)  # SHA-256
+    crc32 = Column(BigInteger, nullable=True)  # For archive layouts computed upfront
+    checksum_verified = Column(Boolean, default=True, server_default=text("true"), nullable=False)
     mime_type = Column(String(100), nullable=True)
+    blob_id = Column(UUID(as_uuid=True), ForeignKey("blobs.id"), nullable=True, index=True)
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     upload_date = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     is_deleted = Column(Boolean, default=False, nullable=False, index=True)
@@ -38,6 +41,46 @@ class File(Base):
     uploader = relationship("User", back_populates="uploaded_files", foreign_keys=[uploaded_by])
     deleter = relationship("User", back_populates="deleted_files", foreign_keys=[deleted_by])
     audit_logs = relationship("AuditLog", back_populates="target_file")
+    manifest = relationship("FileManifest", back_populates="file", uselist=False, passive_deletes=True)
+    blob = relationship("Blob", back_populates="files")
 
     def __repr__(self):
         return f"<File {self.filename}>"
+
+
+class FileManifest(Base):
+    """Per-chunk SHA-256 digests and their tree hash for an uploaded file"""
+    __tablename__ = "file_manifests"
+
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    chunk_size = Column(BigInteger, nullable=False)
+    chunk_checksums = Column(JSONB, nullable=False)  # Ordered list of hex digests
+    tree_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    file = relationship("File", back_populates="manifest")
+
+    def __repr__(self):
+        return f"<FileManifest {self.file_id}>"
+
+
+class Blob(Base):
+    """Content-addressed file content shared by every File with the same SHA-256"""
+    __tablename__ = "blobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    checksum = Column(String(64), nullable=False, unique=True)  # SHA-256
+    storage_path = Column(String(500), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    codec = Column(String(20), nullable=False, default="identity", server_default="identity")  # See app.utils.compression
+    stored_size = Column(BigInteger, nullable=True)  # Bytes on disk
+    compression_seconds = Column(Float, nullable=True)  # CPU time spent compressing
+    ref_count = Column(Integer, nullable=False, default=1)  # Active and soft-deleted files
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    files = relationship("File", back_populates="blob")
+
+    def __repr__(self):
+        return f"<Blob {self.checksum}>"
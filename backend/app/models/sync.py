@@ -1,8 +1,8 @@
 """Sync models"""
 import uuid
 from datetime import datetime
-from sqlalchemy import BigInteger, Column, DateTime, Enum, Integer, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, LargeBinary, String, Text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 import enum
 
 from app.database import Base
@@ -39,20 +39,48 @@ class SyncLog(Base):
         return f"<SyncLog {self.sync_type} - {self.status}>"
 
 
-class UploadChunk(Base):
-    """Upload chunk model for chunked file uploads"""
-    __tablename__ = "upload_chunks"
+class UploadSession(Base):
+    """
+    Upload session model tracking a chunked upload and its received chunks
+    
+    A single row per upload is the whole chunk ledger: received chunks are
+    recorded by flipping a bit and filling an array slot in one UPDATE.
+    """
+    __tablename__ = "upload_sessions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    upload_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     filename = Column(String(255), nullable=False)
+    mime_type = Column(String(100), nullable=True)
+    file_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(BigInteger, nullable=False)
     total_chunks = Column(Integer, nullable=False)
-    chunk_number = Column(Integer, nullable=False)
+    received_chunks = Column(LargeBinary, nullable=False)  # Bitmap, see app.utils.bitmap
+    chunk_checksums = Column(ARRAY(String(64)), nullable=False)  # SHA-256 per chunk, NULL until received
+    bytes_received = Column(BigInteger, default=0, nullable=False)
+    link_speed = Column(BigInteger, nullable=True)  # Client's bytes/s hint
+    preallocated = Column(Boolean, default=False, nullable=False)  # Upload file's blocks are allocated
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_activity = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<UploadSession {self.id} - {self.bytes_received}/{self.file_size}>"
+
+
+class UploadStat(Base):
+    """Throughput of a completed chunked upload, for tuning chunk sizes"""
+    __tablename__ = "upload_stats"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    file_size = Column(BigInteger, nullable=False)
     chunk_size = Column(BigInteger, nullable=False)
-    checksum = Column(String(64), nullable=False)
-    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    expires_at = Column(DateTime, nullable=False)
-    file_path = Column(String(500), nullable=False)
+    total_chunks = Column(Integer, nullable=False)
+    link_speed = Column(BigInteger, nullable=True)  # Client's bytes/s hint
+    duration_seconds = Column(Float, nullable=False)  # Init to last received chunk
+    throughput = Column(BigInteger, nullable=True)  # Bytes/s, NULL if too fast to measure
+    completed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     def __repr__(self):
-        return f"<UploadChunk {self.upload_id} - {self.chunk_number}/{self.total_chunks}>"
+        return f"<UploadStat {self.file_size} bytes @ {self.throughput} B/s>"
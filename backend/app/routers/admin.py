@@ -15,11 +15,19 @@ from app.schemas.user import (
     UserResponse,
     UserListResponse
 )
+from app.schemas.file import DownloadBandwidthLimits
 from app.services.auth_service import AuthService
 from app.routers.dependencies import get_current_admin_user
 from app.models.user import User, UserRole
 from app.models.file import File
 from app.models.session import Session
+from app.models.sync import UploadStat
+from app.utils.admission import upload_admission, download_admission
+from app.utils.io_pool import io_pool
+from app.utils.archive_jobs import archive_jobs
+from app.utils.bandwidth import download_bandwidth
+from app.utils.file_cache import file_locations, small_file_cache
+from app.utils.db_pool import db_pool_monitor
 from app.config import settings
 
 router = APIRouter()
@@ -376,6 +384,45 @@ async def get_storage_info(
     }
 
 
+@router.get("/upload-stats")
+async def get_upload_stats(
+    days: int = Query(7, ge=1, le=365),
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get upload throughput per chunk size, for tuning chunk sizes (admin only)"""
+    since = datetime.utcnow() - timedelta(days=days)
+    result = await db.execute(
+        select(
+            UploadStat.chunk_size,
+            func.count(UploadStat.id),
+            func.avg(UploadStat.file_size),
+            func.avg(UploadStat.total_chunks),
+            func.avg(UploadStat.throughput),
+            func.max(UploadStat.throughput)
+        )
+        .where(UploadStat.completed_at >= since)
+        .group_by(UploadStat.chunk_size)
+        .order_by(UploadStat.chunk_size)
+    )
+    
+    return {
+        "days": days,
+        "by_chunk_size": [
+            {
+                "chunk_size_bytes": chunk_size,
+                "chunk_size_mb": chunk_size / (1024**2),
+                "uploads": uploads,
+                "avg_file_size_bytes": int(avg_file_size or 0),
+                "avg_chunks": round(float(avg_chunks or 0), 1),
+                "avg_throughput_bytes_per_sec": int(avg_throughput or 0),
+                "max_throughput_bytes_per_sec": max_throughput or 0
+            }
+            for chunk_size, uploads, avg_file_size, avg_chunks, avg_throughput, max_throughput in result.all()
+        ]
+    }
+
+
 @router.get("/system-health")
 async def get_system_health(
     current_user: User = Depends(get_current_admin_user),
@@ -413,6 +460,16 @@ async def get_system_health(
             "read_count": disk_io.read_count if disk_io else 0,
             "write_count": disk_io.write_count if disk_io else 0
         },
+        "admission": {
+            "uploads": upload_admission.stats(),
+            "downloads": download_admission.stats()
+        },
+        "io_pool": io_pool.stats(),
+        "archive_jobs": archive_jobs.stats(),
+        "download_bandwidth": download_bandwidth.stats(),
+        "small_file_cache": small_file_cache.stats(),
+        "file_location_cache": file_locations.stats(),
+        "db_pool": db_pool_monitor.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -429,6 +486,10 @@ async def get_settings(
             "max_upload_size_gb": settings.MAX_UPLOAD_SIZE / (1024**3),
             "chunk_size_bytes": settings.CHUNK_SIZE,
             "chunk_size_mb": settings.CHUNK_SIZE / (1024**2),
+            "min_chunk_size_bytes": settings.MIN_CHUNK_SIZE,
+            "max_chunk_size_bytes": settings.MAX_CHUNK_SIZE,
+            "target_chunks": settings.UPLOAD_TARGET_CHUNKS,
+            "target_chunk_seconds": settings.UPLOAD_CHUNK_SECONDS,
             "max_concurrent_uploads": settings.MAX_CONCURRENT_UPLOADS,
             "max_concurrent_downloads": settings.MAX_CONCURRENT_DOWNLOADS
         },
@@ -449,3 +510,26 @@ async def get_settings(
             "scheduler_enabled": settings.SCHEDULER_ENABLED
         }
     }
+
+
+@router.get("/bandwidth")
+async def get_bandwidth(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get download rate limits and the current rate of each transfer (admin only)"""
+    return download_bandwidth.stats()
+
+
+@router.put("/bandwidth")
+async def update_bandwidth(
+    limits: DownloadBandwidthLimits,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Change download rate limits (admin only)
+    
+    Applies to running transfers straight away and lasts until restart;
+    each worker process holds its own limits.
+    """
+    download_bandwidth.set_limits(limits.global_rate, limits.user_rate)
+    return download_bandwidth.stats()
@@ -1,11 +1,15 @@
-"""Authentication dependencies"""
-from typing import Optional
-from fastapi import Depends, HTTPException, status, Header
+"""Authentication and admission dependencies"""
+import ipaddress
+import uuid
+from typing import AsyncIterator, Optional
+from fastapi import Depends, HTTPException, Request, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.database import get_db
 from app.models.user import User, UserRole
 from app.services.auth_service import AuthService
+from app.utils.admission import AdmissionController, AdmissionRejected, AdmissionSlot, upload_admission
 
 
 async def get_current_user(
@@ -78,3 +82,69 @@ def get_client_ip(x_forwarded_for: Optional[str] = Header(None)) -> str:
         # Get first IP if multiple proxies
         return x_forwarded_for.split(',')[0].strip()
     return "unknown"
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES)
+
+
+def get_client_address(request: Request) -> str:
+    """
+    Client IP address that cannot be forged through request headers
+    
+    The connection's peer address, unless it is one of
+    ``TRUSTED_PROXIES``: then ``X-Forwarded-For`` is walked from the right,
+    past further trusted proxies, to the first address a proxy recorded.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(address):
+        return address
+    
+    forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
+
+
+async def admit(
+    controller: AdmissionController,
+    user_id: uuid.UUID,
+    nbytes: int = 0
+) -> AdmissionSlot:
+    """Admit a request or fail fast with 429 and Retry-After"""
+    try:
+        return await controller.acquire(user_id, nbytes)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Server busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+async def upload_slot(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+) -> AsyncIterator[AdmissionSlot]:
+    """
+    Dependency holding an upload admission slot while the endpoint runs
+    
+    The request body counts against the in-flight byte budget by its
+    Content-Length, or the largest chunk size when it is not declared.
+    """
+    try:
+        nbytes = int(request.headers.get("content-length", ""))
+    except ValueError:
+        nbytes = settings.MAX_CHUNK_SIZE
+    
+    slot = await admit(upload_admission, current_user.id, nbytes)
+    try:
+        yield slot
+    finally:
+        await slot.release()
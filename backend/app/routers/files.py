@@ -1,30 +1,201 @@
 """File management router"""
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File as FastAPIFile, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, status, UploadFile, File as FastAPIFile, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List, Tuple
+from datetime import datetime
+import hashlib
+import json
 import os
-import zipfile
-import io
+import time
 import uuid
+from functools import partial
 
-from app.database import get_db
+from app.database import get_db, release_connection
 from app.schemas.file import (
     FileUploadInit,
     FileUploadInitResponse,
+    UploadStatusResponse,
     FileUploadChunk,
     FileUploadComplete,
+    FileManifestResponse,
+    FileStorageResponse,
     FileResponse,
     FileListResponse,
     FileRenameRequest,
-    BulkDownloadRequest
+    BulkDownloadRequest,
+    ArchiveJobResponse,
+    SignedUrlResponse
 )
-from app.services.file_service import FileService
-from app.routers.dependencies import get_current_active_user
+from app.services.file_service import FileService, InsufficientStorageError
+from app.scheduler.jobs import backfill_crc32s, compress_blob, verify_file_checksum
+from app.routers.dependencies import get_current_active_user, get_client_address, get_client_ip, admit, upload_slot
+from app.services.audit_service import AuditService
+from app.utils.admission import AdmissionSlot, download_admission
+from app.utils.archive_jobs import (
+    JOB_COMPLETED,
+    ArchiveBuildRejected,
+    ArchiveSource,
+    ArchiveSpaceExhausted,
+    archive_jobs
+)
+from app.utils.bandwidth import download_bandwidth
 from app.models.user import User
+from app.utils.bitmap import count_bits, missing_ranges
+from app.utils.compression import CODEC_IDENTITY, is_compressible_type, iter_stored_file
+from app.utils.file_cache import CachedFile, FileLocation, file_locations, load_file, small_file_cache
+from app.utils.file_responses import SendfileResponse, offload_headers
+from app.utils.delta import MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
+from app.utils.http_utils import (
+    MultipartByteranges,
+    RangeNotSatisfiable,
+    content_disposition,
+    content_range,
+    http_date,
+    if_range_matches,
+    is_not_modified,
+    parse_range_header,
+    weak_etag
+)
+from app.utils.io_pool import io_pool
+from app.utils.security import sign_download, verify_download_signature
+from app.utils.zip_stream import StoredMember, StoredZipLayout, ZipMember, stream_zip
+from app.config import settings
 
 router = APIRouter()
 
+# Files per bulk download
+MAX_BULK_FILES = 100
+
+# Seconds to wait before retrying a stored bulk download whose CRC-32s are being computed
+CRC32_RETRY_AFTER = 60
+
+# Responses need authentication: browsers may keep them but must revalidate
+CACHE_CONTROL = "private, no-cache"
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    return is_not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        etag,
+        last_modified
+    )
+
+
+def _metadata_response(request: Request, model: BaseModel) -> Response:
+    """
+    JSON metadata with a weak ETag, or 304 if the client's copy is current
+    
+    The tag is weak because it covers the serialized JSON rather than the
+    stored content, so equivalent responses need not be byte-identical.
+    """
+    body = model.model_dump_json().encode()
+    headers = {"ETag": weak_etag(body), "Cache-Control": CACHE_CONTROL}
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _requested_ranges(
+    request: Request,
+    size: int,
+    etag: str,
+    last_modified: datetime
+) -> Optional[List[Tuple[int, int]]]:
+    """Byte ranges to serve, or None for the whole representation"""
+    # A stale If-Range validator means the client gets the whole file
+    range_header = request.headers.get("range")
+    if not range_header or not if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        return None
+    try:
+        return parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+
+def _partial_response(
+    ranges: List[Tuple[int, int]],
+    size: int,
+    media_type: str,
+    read_range,
+    headers: dict,
+    background: BackgroundTask,
+    user_id: uuid.UUID,
+    label: str
+) -> StreamingResponse:
+    """206 response for one range, or multipart/byteranges for several, shaped to the user's bandwidth share"""
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return StreamingResponse(
+            download_bandwidth.shape(read_range(start, end + 1), user_id, label),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": content_range(start, end, size),
+                "Content-Length": str(end - start + 1)
+            },
+            background=background
+        )
+    
+    body = MultipartByteranges(ranges, size, media_type, read_range)
+    return StreamingResponse(
+        download_bandwidth.shape(body, user_id, label),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=body.content_type,
+        headers={**headers, "Content-Length": str(body.content_length)},
+        background=background
+    )
+
+
+def _streamed_bytes(size: int) -> int:
+    """Bytes a response read through the app holds at once: one frame or block"""
+    return min(size, settings.COMPRESSION_FRAME_SIZE)
+
+
+def _raw_file_response(
+    path: str,
+    size: int,
+    ranges: Optional[List[Tuple[int, int]]],
+    media_type: str,
+    headers: dict,
+    background: BackgroundTask,
+    user_id: uuid.UUID,
+    label: str
+) -> Response:
+    """Whole file or ranges of an uncompressed file, sent with sendfile where possible"""
+    if ranges is not None and len(ranges) > 1:
+        def read_range(start: int, end: int):
+            return iter_stored_file(path, CODEC_IDENTITY, start, end, settings.COMPRESSION_FRAME_SIZE)
+        return _partial_response(ranges, size, media_type, read_range, headers, background, user_id, label)
+    
+    if ranges is None:
+        start, end = 0, size
+        status_code = status.HTTP_200_OK
+    else:
+        start, end = ranges[0][0], ranges[0][1] + 1
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers = {**headers, "Content-Range": content_range(start, end - 1, size)}
+    return SendfileResponse(
+        path,
+        start,
+        end,
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+        background=background,
+        block_size=settings.COMPRESSION_FRAME_SIZE,
+        user_id=user_id,
+        label=label
+    )
+
 
 @router.post("/upload/init", response_model=FileUploadInitResponse)
 async def initialize_upload(
@@ -33,19 +204,47 @@ async def initialize_upload(
     db: AsyncSession = Depends(get_db)
 ):
     """Initialize a chunked file upload"""
-    upload_id, chunk_size = await FileService.initialize_upload(
-        db=db,
-        filename=upload_data.filename,
-        file_size=upload_data.file_size,
-        total_chunks=upload_data.total_chunks,
-        user_id=current_user.id,
-        mime_type=upload_data.mime_type
-    )
+    if upload_data.checksum:
+        file_record = await FileService.instant_upload(
+            db=db,
+            filename=upload_data.filename,
+            file_size=upload_data.file_size,
+            checksum=upload_data.checksum,
+            user_id=current_user.id,
+            mime_type=upload_data.mime_type
+        )
+        if file_record:
+            return FileUploadInitResponse(
+                chunk_size=upload_data.file_size,
+                total_chunks=0,
+                instant=True,
+                file_id=file_record.id
+            )
+    
+    try:
+        upload_id, chunk_size = await FileService.initialize_upload(
+            db=db,
+            filename=upload_data.filename,
+            file_size=upload_data.file_size,
+            user_id=current_user.id,
+            mime_type=upload_data.mime_type,
+            link_speed=upload_data.link_speed
+        )
+    except InsufficientStorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     return FileUploadInitResponse(
         upload_id=upload_id,
         chunk_size=chunk_size,
-        total_chunks=upload_data.total_chunks
+        total_chunks=(upload_data.file_size + chunk_size - 1) // chunk_size
     )
 
 
@@ -58,26 +257,32 @@ async def upload_chunk(
     total_chunks: int = Query(..., gt=0),
     chunk_file: UploadFile = FastAPIFile(...),
     current_user: User = Depends(get_current_active_user),
+    slot: AdmissionSlot = Depends(upload_slot),
     db: AsyncSession = Depends(get_db)
 ):
     """Upload a file chunk"""
-    # Read chunk data
-    chunk_data = await chunk_file.read()
-    
     try:
         upload_uuid = uuid.UUID(upload_id)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid upload ID")
     
-    success = await FileService.upload_chunk(
-        db=db,
-        upload_id=upload_uuid,
-        chunk_number=chunk_number,
-        chunk_data=chunk_data,
-        filename=filename,
-        total_chunks=total_chunks,
-        checksum=checksum
-    )
+    # The chunk is streamed to its offset in bounded blocks rather than read whole
+    try:
+        success = await FileService.upload_chunk(
+            db=db,
+            upload_id=upload_uuid,
+            chunk_number=chunk_number,
+            chunk_data=chunk_file,
+            filename=filename,
+            total_chunks=total_chunks,
+            checksum=checksum,
+            user_id=current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     return {
         "success": success,
@@ -86,25 +291,72 @@ async def upload_chunk(
     }
 
 
+@router.put("/upload/{upload_id}/chunks/{chunk_number}")
+async def put_chunk(
+    upload_id: uuid.UUID,
+    chunk_number: int,
+    request: Request,
+    x_chunk_checksum: str = Header(..., min_length=64, max_length=64),
+    current_user: User = Depends(get_current_active_user),
+    slot: AdmissionSlot = Depends(upload_slot),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload a file chunk as a raw application/octet-stream body
+    
+    The body is hashed and written straight from the request stream, without
+    multipart parsing or spooling to a temporary file. The chunk's SHA-256
+    is sent in the X-Chunk-Checksum header.
+    """
+    if chunk_number < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chunk number")
+    
+    content_type = request.headers.get("content-type", "")
+    if content_type.split(";")[0].strip() != "application/octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Chunk body must be application/octet-stream"
+        )
+    
+    try:
+        success = await FileService.upload_chunk(
+            db=db,
+            upload_id=upload_id,
+            chunk_number=chunk_number,
+            chunk_data=request.stream(),
+            filename=None,
+            total_chunks=None,
+            checksum=x_chunk_checksum,
+            user_id=current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "success": success,
+        "chunk_number": chunk_number,
+        "message": f"Chunk {chunk_number + 1} uploaded successfully"
+    }
+
+
 @router.post("/upload/complete", response_model=FileResponse)
 async def complete_upload(
     upload_data: FileUploadComplete,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Complete a chunked file upload"""
-    # Get first chunk to get filename
-    from app.models.sync import UploadChunk
-    from sqlalchemy import select
-    
-    result = await db.execute(
-        select(UploadChunk)
-        .where(UploadChunk.upload_id == upload_data.upload_id)
-        .limit(1)
+    upload_session = await FileService.get_upload_session(
+        db=db,
+        upload_id=upload_data.upload_id,
+        user_id=current_user.id
     )
-    chunk = result.scalar_one_or_none()
     
-    if not chunk:
+    if not upload_session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Upload not found"
@@ -114,10 +366,9 @@ async def complete_upload(
         file_record = await FileService.complete_upload(
             db=db,
             upload_id=upload_data.upload_id,
-            filename=chunk.filename,
             final_checksum=upload_data.final_checksum,
             user_id=current_user.id,
-            mime_type=None
+            tree_hash=upload_data.tree_hash
         )
     except ValueError as e:
         raise HTTPException(
@@ -125,6 +376,12 @@ async def complete_upload(
             detail=str(e)
         )
     
+    # Chunks arrived out of order: confirm the full-file checksum after responding
+    if not file_record.checksum_verified:
+        background_tasks.add_task(verify_file_checksum, file_record.id)
+    elif file_record.blob_id is not None:
+        background_tasks.add_task(compress_blob, file_record.blob_id)
+    
     return FileResponse(
         id=file_record.id,
         filename=file_record.filename,
@@ -151,7 +408,17 @@ async def cancel_upload(
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid upload ID")
     
-    success = await FileService.cancel_upload(db=db, upload_id=upload_uuid)
+    try:
+        success = await FileService.cancel_upload(
+            db=db,
+            upload_id=upload_uuid,
+            user_id=current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     
     return {
         "success": success,
@@ -159,8 +426,45 @@ async def cancel_upload(
     }
 
 
+@router.get("/upload/{upload_id}", response_model=UploadStatusResponse)
+async def get_upload_status(
+    upload_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the received and missing chunks of an upload, for resuming it"""
+    upload_session = await FileService.get_upload_session(
+        db=db,
+        upload_id=upload_id,
+        user_id=current_user.id
+    )
+    
+    if not upload_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    
+    return UploadStatusResponse(
+        upload_id=upload_session.id,
+        filename=upload_session.filename,
+        file_size=upload_session.file_size,
+        chunk_size=upload_session.chunk_size,
+        total_chunks=upload_session.total_chunks,
+        received_chunks=count_bits(upload_session.received_chunks),
+        bytes_received=upload_session.bytes_received,
+        missing_ranges=[
+            [first, last]
+            for first, last in missing_ranges(upload_session.received_chunks, upload_session.total_chunks)
+        ],
+        last_activity=upload_session.last_activity,
+        expires_at=upload_session.expires_at
+    )
+
+
 @router.get("", response_model=FileListResponse)
 async def list_files(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(100, ge=1, le=100),
     sort_by: str = Query("upload_date", regex="^(filename|size|upload_date)$"),
@@ -209,18 +513,19 @@ async def list_files(
     
     total_pages = (total + page_size - 1) // page_size
     
-    return FileListResponse(
+    return _metadata_response(request, FileListResponse(
         items=items,
         total=total,
         page=page,
         page_size=page_size,
         total_pages=total_pages
-    )
+    ))
 
 
 @router.get("/{file_id}", response_model=FileResponse)
 async def get_file(
     file_id: uuid.UUID,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -243,7 +548,7 @@ async def get_file(
     uploader = result.scalar_one_or_none()
     uploader_username = uploader.username if uploader else "Unknown"
     
-    return FileResponse(
+    return _metadata_response(request, FileResponse(
         id=file_record.id,
         filename=file_record.filename,
         size=file_record.size,
@@ -254,34 +559,549 @@ async def get_file(
         upload_date=file_record.upload_date,
         is_deleted=file_record.is_deleted,
         sync_status=file_record.sync_status.value
-    )
+    ))
 
 
-@router.get("/{file_id}/download")
-async def download_file(
+@router.get("/{file_id}/manifest", response_model=FileManifestResponse)
+async def get_file_manifest(
     file_id: uuid.UUID,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Download a single file"""
+    """Get the per-chunk checksums and tree hash of a file"""
     file_record = await FileService.get_file(db=db, file_id=file_id)
+    manifest = await FileService.get_manifest(db=db, file_id=file_id)
     
-    if not file_record:
+    if not file_record or not manifest:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Manifest not found"
+        )
+    
+    return _metadata_response(request, FileManifestResponse(
+        file_id=file_record.id,
+        chunk_size=manifest.chunk_size,
+        chunk_checksums=manifest.chunk_checksums,
+        tree_hash=manifest.tree_hash,
+        checksum_verified=file_record.checksum_verified
+    ))
+
+
+@router.get("/{file_id}/storage", response_model=FileStorageResponse)
+async def get_file_storage(
+    file_id: uuid.UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get how a file is stored: codec, stored size, compression ratio and CPU cost"""
+    storage = await FileService.get_storage_info(db=db, file_id=file_id)
+    
+    if not storage:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
     
-    if not os.path.exists(file_record.filepath):
+    return _metadata_response(request, FileStorageResponse(**storage))
+
+
+@router.get("/{file_id}/signature")
+async def get_file_signature(
+    file_id: uuid.UUID,
+    block_size: Optional[int] = Query(None, ge=MIN_BLOCK_SIZE, le=MAX_BLOCK_SIZE),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the rsync-style block signature of a file, for uploading a delta against it"""
+    try:
+        signature = await FileService.get_signature(db=db, file_id=file_id, block_size=block_size)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found on disk"
+            detail=str(e)
+        )
+    
+    return Response(content=signature, media_type="application/octet-stream")
+
+
+@router.post("/{file_id}/delta", response_model=FileResponse)
+async def upload_delta(
+    file_id: uuid.UUID,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    filename: str = Query(..., min_length=1, max_length=255),
+    mime_type: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_active_user),
+    slot: AdmissionSlot = Depends(upload_slot),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload a new file as a delta against an existing one
+    
+    The body is a delta in the format of ``app.utils.delta``, sent as
+    application/octet-stream and applied while it streams in.
+    """
+    if ".." in filename or "/" in filename or "\\" in filename or "\x00" in filename:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename")
+    
+    base_file = await FileService.get_file(db=db, file_id=file_id)
+    if not base_file or base_file.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
         )
     
+    try:
+        file_record = await FileService.apply_delta(
+            db=db,
+            base_file_id=file_id,
+            delta=request.stream(),
+            filename=filename,
+            user_id=current_user.id,
+            mime_type=mime_type
+        )
+    except InsufficientStorageError as e:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    background_tasks.add_task(compress_blob, file_record.blob_id)
+    
     return FileResponse(
-        path=file_record.filepath,
+        id=file_record.id,
         filename=file_record.filename,
-        media_type=file_record.mime_type or "application/octet-stream"
+        size=file_record.size,
+        checksum=file_record.checksum,
+        mime_type=file_record.mime_type,
+        uploaded_by=file_record.uploaded_by,
+        uploader_username=current_user.username,
+        upload_date=file_record.upload_date,
+        is_deleted=file_record.is_deleted,
+        sync_status=file_record.sync_status.value
+    )
+
+
+async def _locate_file(db: AsyncSession, file_id: uuid.UUID) -> FileLocation:
+    """A file's stored location, from the location cache or the database"""
+    location = file_locations.get(file_id)
+    if location is not None and not os.path.exists(location.filepath):
+        # Moved since, as when its blob was compressed in another worker
+        file_locations.invalidate(file_id)
+        location = None
+    if location is None:
+        file_record = await FileService.get_file(db=db, file_id=file_id)
+        # Deleted files are never cached, and deleting a file drops its entry
+        if not file_record or file_record.is_deleted:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found"
+            )
+        location = FileLocation(
+            file_id=file_record.id,
+            filepath=file_record.filepath,
+            codec=await FileService.get_storage_codec(db, file_record),
+            filename=file_record.filename,
+            mime_type=file_record.mime_type,
+            checksum=file_record.checksum,
+            size=file_record.size,
+            upload_date=file_record.upload_date
+        )
+        file_locations.put(location)
+    
+    if not os.path.exists(location.filepath):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found on disk"
+        )
+    return location
+
+
+async def _admit_download(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    audit: Optional[Callable[[], Awaitable[None]]] = None,
+    nbytes: int = 0
+) -> AdmissionSlot:
+    """
+    Admit a download, then audit it
+    
+    ``nbytes`` is what the response buffers in memory, charged against the
+    in-flight byte budget. The connection goes back to the pool while the
+    request waits for a slot. A refused download is never audited, and the
+    slot is released again if the audit fails.
+    """
+    await release_connection(db)
+    slot = await admit(download_admission, user_id, nbytes)
+    try:
+        if audit is not None:
+            await audit()
+            await release_connection(db)
+    except BaseException:
+        await slot.release()
+        raise
+    return slot
+
+
+async def _serve_download(
+    request: Request,
+    db: AsyncSession,
+    file_id: uuid.UUID,
+    user_id: uuid.UUID,
+    audit: Optional[Callable[[bool], Awaitable[None]]] = None,
+    checksum: Optional[str] = None
+) -> Response:
+    """
+    Conditional, ranged or offloaded response for a single file
+    
+    ``audit`` is awaited with whether the download was offloaded once it
+    is certain to be sent. Given a ``checksum``, a file whose content no
+    longer matches it is gone.
+    """
+    cached = small_file_cache.get(file_id)
+    if cached is not None:
+        location, content = None, cached.content
+        filename, mime_type, file_checksum = cached.filename, cached.mime_type, cached.checksum
+        size, upload_date = cached.size, cached.upload_date
+    else:
+        location, content = await _locate_file(db, file_id), None
+        filename, mime_type, file_checksum = location.filename, location.mime_type, location.checksum
+        size, upload_date = location.size, location.upload_date
+    
+    if checksum is not None and checksum != file_checksum:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="File has changed since the link was created"
+        )
+    
+    media_type = mime_type or "application/octet-stream"
+    etag = f'"{file_checksum}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_date(upload_date),
+        "Cache-Control": CACHE_CONTROL,
+        "Content-Disposition": content_disposition(filename)
+    }
+    
+    if _not_modified(request, etag, upload_date):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if request.method == "HEAD":
+        return Response(media_type=media_type, headers={**headers, "Content-Length": str(size)})
+    
+    # The proxy evaluates Range itself on the file it is pointed at
+    offload = offload_headers(location.filepath) if location and location.codec == CODEC_IDENTITY else None
+    ranges = None if offload else _requested_ranges(request, size, etag, upload_date)
+    
+    if offload:
+        if audit is not None:
+            await audit(True)
+        await release_connection(db)
+        # nginx paces the offloaded response at the share a transfer would get here
+        rate = download_bandwidth.fair_rate(user_id)
+        if rate and "X-Accel-Redirect" in offload:
+            offload["X-Accel-Limit-Rate"] = str(rate)
+        return Response(media_type=media_type, headers={**headers, **offload})
+    
+    # A cache hit is already held by the cache; a miss small enough to
+    # cache is read whole; anything else streams a frame at a time
+    load = content is None and small_file_cache.admits(size)
+    if content is not None:
+        nbytes = 0
+    elif load:
+        nbytes = size
+    else:
+        nbytes = _streamed_bytes(size)
+    slot = await _admit_download(db, user_id, partial(audit, False) if audit is not None else None, nbytes)
+    background = BackgroundTask(slot.release)
+    
+    if load:
+        try:
+            content = await io_pool.run(load_file, location.filepath, location.codec)
+        except BaseException:
+            await slot.release()
+            raise
+        small_file_cache.put(CachedFile(file_id, file_checksum, filename, mime_type, upload_date, content))
+    
+    if content is not None:
+        async def read_range(start: int, end: int):
+            yield content[start:end]
+    elif location.codec == CODEC_IDENTITY:
+        return _raw_file_response(
+            location.filepath, size, ranges, media_type, headers, background, user_id, filename
+        )
+    else:
+        def read_range(start: int, end: int):
+            # Compressed content is decompressed frame by frame as it is sent
+            return iter_stored_file(location.filepath, location.codec, start, end, settings.COMPRESSION_FRAME_SIZE)
+    
+    if ranges is None:
+        return StreamingResponse(
+            download_bandwidth.shape(read_range(0, size), user_id, filename),
+            media_type=media_type,
+            headers={**headers, "Content-Length": str(size)},
+            background=background
+        )
+    
+    return _partial_response(
+        ranges, size, media_type, read_range, headers, background, user_id, filename
+    )
+
+
+@router.api_route("/{file_id}/download", methods=["GET", "HEAD"])
+async def download_file(
+    file_id: uuid.UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    client_ip: str = Depends(get_client_ip),
+    user_agent: Optional[str] = Header(None)
+):
+    """
+    Download a single file
+    
+    Honours ``Range`` requests, including multiple ranges, with the file's
+    SHA-256 as the ``If-Range`` validator, so interrupted downloads resume
+    and download managers can fetch segments in parallel. The same strong
+    ETag answers ``If-None-Match`` with 304, and ``HEAD`` returns the
+    headers alone.
+    
+    With ``DOWNLOAD_OFFLOAD`` set, raw files are handed to the reverse
+    proxy by internal redirect once the request is authorized and audited;
+    otherwise they are sent with sendfile where the server supports it.
+    Either way the transfer is paced at the user's bandwidth share, and
+    the database connection goes back to the pool before it starts.
+
+    Small files are kept in memory, so repeat downloads of popular ones
+    skip the file lookup and disk reads.
+    """
+    async def audit(offloaded: bool):
+        await AuditService.log_action(
+            db=db,
+            user_id=current_user.id,
+            action="download",
+            ip_address=client_ip,
+            user_agent=user_agent,
+            target_file_id=file_id,
+            details={
+                "offloaded": offloaded,
+                "range": request.headers.get("range")
+            }
+        )
+    
+    return await _serve_download(request, db, file_id, current_user.id, audit=audit)
+
+
+@router.post("/{file_id}/signed-url", response_model=SignedUrlResponse)
+async def create_signed_url(
+    file_id: uuid.UUID,
+    request: Request,
+    expires_in: int = Query(settings.SIGNED_URL_DEFAULT_SECONDS, ge=1, le=settings.SIGNED_URL_MAX_SECONDS),
+    bind_ip: bool = Query(False),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    client_ip: str = Depends(get_client_ip),
+    user_agent: Optional[str] = Header(None)
+):
+    """
+    Create a download URL that works without authentication until it expires
+    
+    The URL is signed for the file's current content and made on behalf of
+    the current user, whose bandwidth share it is paced at. With
+    ``bind_ip``, only the requesting client's IP address may use it, taken
+    from ``X-Forwarded-For`` only behind a trusted proxy. The signing is
+    audited; downloads through the URL are not.
+    """
+    file_record = await FileService.get_file(db=db, file_id=file_id)
+    if not file_record or file_record.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    expires = int(time.time()) + expires_in
+    ip = get_client_address(request) if bind_ip else None
+    params = {
+        "checksum": file_record.checksum,
+        "user": str(current_user.id),
+        "expires": str(expires),
+        "signature": sign_download(file_id, file_record.checksum, current_user.id, expires, ip)
+    }
+    if ip:
+        params["ip"] = ip
+    
+    await AuditService.log_action(
+        db=db,
+        user_id=current_user.id,
+        action="sign_download",
+        ip_address=client_ip,
+        user_agent=user_agent,
+        target_file_id=file_id,
+        details={"expires": expires, "bound_ip": ip}
+    )
+    await db.commit()
+    
+    url = request.url_for("download_signed", file_id=str(file_id)).include_query_params(**params)
+    return SignedUrlResponse(url=str(url), expires_at=datetime.utcfromtimestamp(expires), bound_ip=ip)
+
+
+@router.api_route("/{file_id}/signed", methods=["GET", "HEAD"])
+async def download_signed(
+    file_id: uuid.UUID,
+    request: Request,
+    checksum: str = Query(...),
+    user: uuid.UUID = Query(...),
+    expires: int = Query(...),
+    signature: str = Query(...),
+    ip: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    client_address: str = Depends(get_client_address)
+):
+    """
+    Download a single file through a signed URL
+    
+    The signature is checked without touching the database, and the file
+    is found through the location and small-file caches, so a repeat
+    download need not query it at all. Otherwise served like an
+    authenticated download.
+    """
+    if not verify_download_signature(
+        signature, file_id, checksum, user, expires, ip, client_address
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired download link"
+        )
+    
+    return await _serve_download(request, db, file_id, user, checksum=checksum)
+
+
+async def _audit_bulk_download(
+    db: AsyncSession,
+    current_user: User,
+    client_ip: str,
+    user_agent: Optional[str],
+    file_ids: List[uuid.UUID],
+    mode: str
+) -> None:
+    await AuditService.log_action(
+        db=db,
+        user_id=current_user.id,
+        action="bulk_download",
+        ip_address=client_ip,
+        user_agent=user_agent,
+        details={"file_ids": [str(file_id) for file_id in file_ids], "mode": mode}
+    )
+
+
+@router.get("/download/bulk")
+async def bulk_download_stored(
+    request: Request,
+    file_ids: List[uuid.UUID] = Query(...),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    client_ip: str = Depends(get_client_ip),
+    user_agent: Optional[str] = Header(None)
+):
+    """
+    Download multiple files as an uncompressed, resumable ZIP archive
+    
+    The archive is laid out from file sizes and CRC-32s before sending, so
+    it has a Content-Length and honours ``Range`` requests; the same files
+    always give the same bytes, validated by the archive's ETag.
+    
+    Files stored before CRC-32s were recorded would have to be read in
+    full first. Instead their CRC-32s are computed in the background and
+    the client is told to retry, or to use the streaming POST download.
+    """
+    if len(file_ids) > MAX_BULK_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BULK_FILES} files per download"
+        )
+    
+    members = []
+    missing_crc32 = []
+    validator = hashlib.sha256()
+    last_modified = None
+    for file_id in file_ids:
+        file_record = await FileService.get_file(db=db, file_id=file_id)
+        if not file_record or not os.path.exists(file_record.filepath):
+            continue
+        if file_record.crc32 is None:
+            missing_crc32.append(file_record.id)
+            continue
+        codec = await FileService.get_storage_codec(db, file_record)
+        crc32 = file_record.crc32
+        members.append(StoredMember(
+            name=file_record.filename,
+            modified=file_record.upload_date,
+            size=file_record.size,
+            crc32=crc32,
+            read_range=partial(
+                iter_stored_file,
+                file_record.filepath,
+                codec,
+                block_size=settings.COMPRESSION_FRAME_SIZE
+            )
+        ))
+        validator.update(
+            f"{file_record.filename}\0{file_record.size}\0{crc32}\0"
+            f"{file_record.checksum}\0{file_record.upload_date.isoformat()}\n".encode()
+        )
+        if last_modified is None or file_record.upload_date > last_modified:
+            last_modified = file_record.upload_date
+    
+    if missing_crc32:
+        return JSONResponse(
+            {"detail": "Preparing files for download; retry later or use POST /download/bulk"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(CRC32_RETRY_AFTER)},
+            background=BackgroundTask(backfill_crc32s, missing_crc32)
+        )
+    
+    if not members:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No files found"
+        )
+    
+    layout = StoredZipLayout(members)
+    etag = f'"{validator.hexdigest()}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": CACHE_CONTROL,
+        "Content-Disposition": "attachment; filename=files.zip"
+    }
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    ranges = _requested_ranges(request, layout.size, etag, last_modified)
+    slot = await _admit_download(
+        db,
+        current_user.id,
+        partial(_audit_bulk_download, db, current_user, client_ip, user_agent, file_ids, "stored"),
+        _streamed_bytes(layout.size)
+    )
+    background = BackgroundTask(slot.release)
+    
+    if ranges is None:
+        return StreamingResponse(
+            download_bandwidth.shape(layout.iter_range(), current_user.id, "files.zip"),
+            media_type="application/zip",
+            headers={**headers, "Content-Length": str(layout.size)},
+            background=background
+        )
+    return _partial_response(
+        ranges, layout.size, "application/zip", layout.iter_range, headers, background, current_user.id, "files.zip"
     )
 
 
@@ -289,7 +1109,9 @@ async def download_file(
 async def bulk_download(
     download_request: BulkDownloadRequest,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client_ip: str = Depends(get_client_ip),
+    user_agent: Optional[str] = Header(None)
 ):
     """Download multiple files as a ZIP archive"""
     # Get all files
@@ -297,7 +1119,7 @@ async def bulk_download(
     for file_id in download_request.file_ids:
         file_record = await FileService.get_file(db=db, file_id=file_id)
         if file_record and os.path.exists(file_record.filepath):
-            files.append(file_record)
+            files.append((file_record, await FileService.get_storage_codec(db, file_record)))
     
     if not files:
         raise HTTPException(
@@ -305,18 +1127,191 @@ async def bulk_download(
             detail="No files found"
         )
     
-    # Create ZIP in memory
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_record in files:
-            zip_file.write(file_record.filepath, file_record.filename)
+    # Blocks read ahead for parallel deflate are held until they are sent
+    depth = settings.ARCHIVE_PARALLEL_BLOCKS or io_pool.max_workers
+    slot = await _admit_download(
+        db,
+        current_user.id,
+        partial(_audit_bulk_download, db, current_user, client_ip, user_agent, download_request.file_ids, "stream"),
+        depth * settings.COMPRESSION_FRAME_SIZE
+    )
     
-    zip_buffer.seek(0)
+    members = [
+        ZipMember(
+            name=file_record.filename,
+            modified=file_record.upload_date,
+            read=partial(
+                iter_stored_file,
+                file_record.filepath,
+                codec,
+                block_size=settings.COMPRESSION_FRAME_SIZE
+            ),
+            # Already-compressed formats are stored without sampling
+            compress=is_compressible_type(file_record.mime_type)
+        )
+        for file_record, codec in files
+    ]
     
+    archive = stream_zip(
+        members,
+        level=settings.ARCHIVE_COMPRESSION_LEVEL,
+        max_ratio=settings.COMPRESSION_MAX_RATIO,
+        depth=depth
+    )
     return StreamingResponse(
-        zip_buffer,
+        download_bandwidth.shape(archive, current_user.id, "files.zip"),
         media_type="application/zip",
-        headers={"Content-Disposition": "attachment; filename=files.zip"}
+        headers={"Content-Disposition": "attachment; filename=files.zip"},
+        background=BackgroundTask(slot.release)
+    )
+
+
+def _get_archive_job(job_id: uuid.UUID, current_user: User):
+    job = archive_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Archive job not found"
+        )
+    return job
+
+
+@router.post("/archives", response_model=ArchiveJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_archive(
+    download_request: BulkDownloadRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    client_ip: str = Depends(get_client_ip),
+    user_agent: Optional[str] = Header(None)
+):
+    """
+    Start building a ZIP archive of multiple files
+    
+    Returns a job to poll, or follow through its events, until the
+    archive can be downloaded. Archives are cached by their members'
+    checksums, so repeating a request completes straight away. New builds
+    are capped per user and per worker (429 with Retry-After) and must fit
+    in the temp volume's free space (507).
+    """
+    sources = []
+    for file_id in download_request.file_ids:
+        file_record = await FileService.get_file(db=db, file_id=file_id)
+        if file_record and os.path.exists(file_record.filepath):
+            sources.append(ArchiveSource(
+                name=file_record.filename,
+                modified=file_record.upload_date,
+                path=file_record.filepath,
+                codec=await FileService.get_storage_codec(db, file_record),
+                size=file_record.size,
+                checksum=file_record.checksum,
+                mime_type=file_record.mime_type
+            ))
+    
+    if not sources:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No files found"
+        )
+    
+    space_available = await FileService.archive_space_available(db)
+    try:
+        job = archive_jobs.submit(current_user.id, sources, space_available)
+    except ArchiveBuildRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ArchiveSpaceExhausted as e:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail=str(e)
+        )
+    
+    await _audit_bulk_download(db, current_user, client_ip, user_agent, download_request.file_ids, "archive")
+    return ArchiveJobResponse(**job.to_dict())
+
+
+@router.get("/archives/{job_id}", response_model=ArchiveJobResponse)
+async def get_archive_job(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the progress of an archive job"""
+    job = _get_archive_job(job_id, current_user)
+    return ArchiveJobResponse(**job.to_dict())
+
+
+@router.get("/archives/{job_id}/events")
+async def archive_job_events(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Follow an archive job's progress as server-sent events until it finishes"""
+    job = _get_archive_job(job_id, current_user)
+    await release_connection(db)
+    
+    async def events():
+        while True:
+            payload = ArchiveJobResponse(**job.to_dict()).model_dump(mode="json")
+            yield f"data: {json.dumps(payload)}\n\n"
+            if job.finished:
+                break
+            await job.build.wait_changed(timeout=15)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/archives/{job_id}/download")
+async def download_archive(
+    job_id: uuid.UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download a finished archive, with ``Range`` support for resuming"""
+    job = _get_archive_job(job_id, current_user)
+    await release_connection(db)
+    if job.status != JOB_COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Archive is {job.status}"
+        )
+    
+    path = archive_jobs.open_archive(job)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Archive expired from the cache; create it again"
+        )
+    
+    try:
+        size = os.path.getsize(path)
+        etag = f'"{job.key}"'
+        last_modified = job.build.finished_at
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified),
+            "Content-Disposition": "attachment; filename=files.zip"
+        }
+        ranges = _requested_ranges(request, size, etag, last_modified)
+        slot = await admit(download_admission, current_user.id, _streamed_bytes(size))
+    except BaseException:
+        archive_jobs.release(job)
+        raise
+    
+    async def release():
+        archive_jobs.release(job)
+        await slot.release()
+    
+    return _raw_file_response(
+        path, size, ranges, "application/zip", headers, BackgroundTask(release), current_user.id, "files.zip"
     )
 
 
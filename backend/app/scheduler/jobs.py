@@ -46,6 +46,135 @@ async def cleanup_deleted_files():
             return {"success": False, "error": str(e)}
 
 
+async def verify_file_checksum(file_id):
+    """Verify the full-file checksum of a completed upload"""
+    async with AsyncSessionLocal() as db:
+        try:
+            verified = await FileService.verify_checksum(db, file_id)
+            if not verified:
+                logger.error(f"Checksum mismatch for file {file_id}")
+            return {"success": True, "verified": verified}
+        except Exception as e:
+            logger.error(f"Error verifying checksum of file {file_id}: {e}")
+            return {"success": False, "error": str(e)}
+
+
+async def verify_pending_checksums():
+    """Verify checksums of uploads completed without a full-file digest"""
+    async with AsyncSessionLocal() as db:
+        try:
+            file_ids = await FileService.list_unverified_files(db)
+        except Exception as e:
+            logger.error(f"Error listing unverified files: {e}")
+            return {"success": False, "error": str(e)}
+    
+    failed = 0
+    for file_id in file_ids:
+        result = await verify_file_checksum(file_id)
+        if not result.get("verified"):
+            failed += 1
+    
+    logger.info(f"Verified checksums of {len(file_ids)} files ({failed} failed)")
+    return {"success": True, "count": len(file_ids), "failed": failed}
+
+
+# Files given a CRC-32 per backfill run
+CRC32_BACKFILL_BATCH = 500
+
+# Backfills already running in this process, so a file is not read twice at once
+_crc32_in_progress = set()
+
+
+async def compute_file_crc32(file_id):
+    """Compute a file's missing CRC-32"""
+    if file_id in _crc32_in_progress:
+        return {"success": True, "skipped": True}
+    _crc32_in_progress.add(file_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            crc32 = await FileService.compute_crc32(db, file_id)
+            return {"success": True, "computed": crc32 is not None}
+    except Exception as e:
+        logger.error(f"Error computing CRC-32 of file {file_id}: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        _crc32_in_progress.discard(file_id)
+
+
+async def backfill_crc32s(file_ids=None):
+    """
+    Compute CRC-32s of files stored before they were recorded
+    
+    Stored bulk downloads need every member's CRC-32 up front; given
+    ``file_ids``, only those files are filled in.
+    """
+    if file_ids is None:
+        async with AsyncSessionLocal() as db:
+            try:
+                file_ids = await FileService.list_files_missing_crc32(db, CRC32_BACKFILL_BATCH)
+            except Exception as e:
+                logger.error(f"Error listing files missing CRC-32: {e}")
+                return {"success": False, "error": str(e)}
+    
+    failed = 0
+    for file_id in file_ids:
+        result = await compute_file_crc32(file_id)
+        if not result.get("success"):
+            failed += 1
+    
+    logger.info(f"Computed CRC-32s of {len(file_ids)} files ({failed} failed)")
+    return {"success": True, "count": len(file_ids), "failed": failed}
+
+
+# Blobs considered for compression per sweep
+BLOB_COMPRESSION_BATCH = 100
+
+# Blobs being compressed in this process, so one is not compressed twice at once
+_compression_in_progress = set()
+
+
+async def compress_blob(blob_id):
+    """Compress a blob stored raw at upload"""
+    if blob_id in _compression_in_progress:
+        return {"success": True, "skipped": True}
+    _compression_in_progress.add(blob_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            compressed = await FileService.compress_blob(db, blob_id)
+            return {"success": True, "compressed": compressed}
+    except Exception as e:
+        logger.error(f"Error compressing blob {blob_id}: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        _compression_in_progress.discard(blob_id)
+
+
+async def compress_pending_blobs():
+    """
+    Compress blobs not yet considered for compression
+    
+    Catches verified out-of-order uploads and blobs whose compression after
+    upload was interrupted.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            blob_ids = await FileService.list_uncompressed_blobs(db, BLOB_COMPRESSION_BATCH)
+        except Exception as e:
+            logger.error(f"Error listing uncompressed blobs: {e}")
+            return {"success": False, "error": str(e)}
+    
+    compressed = failed = 0
+    for blob_id in blob_ids:
+        result = await compress_blob(blob_id)
+        if not result.get("success"):
+            failed += 1
+        elif result.get("compressed"):
+            compressed += 1
+    
+    logger.info(f"Considered {len(blob_ids)} blobs for compression ({compressed} compressed, {failed} failed)")
+    return {"success": True, "count": len(blob_ids), "compressed": compressed, "failed": failed}
+
+
 async def check_storage():
     """Check storage usage and alert if >80%"""
     try:
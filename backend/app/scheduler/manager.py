@@ -78,6 +78,33 @@ class SchedulerManager:
             replace_existing=True
         )
         
+        # Checksum verification of out-of-order uploads - every 30 minutes
+        self.scheduler.add_job(
+            jobs.verify_pending_checksums,
+            trigger=IntervalTrigger(minutes=30),
+            id="checksum_verification",
+            name="Checksum Verification",
+            replace_existing=True
+        )
+        
+        # CRC-32 backfill for stored bulk downloads - every 30 minutes
+        self.scheduler.add_job(
+            jobs.backfill_crc32s,
+            trigger=IntervalTrigger(minutes=30),
+            id="crc32_backfill",
+            name="CRC-32 Backfill",
+            replace_existing=True
+        )
+        
+        # Compression of blobs stored raw at upload - every 10 minutes
+        self.scheduler.add_job(
+            jobs.compress_pending_blobs,
+            trigger=IntervalTrigger(minutes=10),
+            id="blob_compression",
+            name="Blob Compression",
+            replace_existing=True
+        )
+        
         # Storage check - every 6 hours
         self.scheduler.add_job(
             jobs.check_storage,
@@ -123,7 +150,7 @@ class SchedulerManager:
             replace_existing=True
         )
         
-        logger.info("APScheduler initialized with 8 jobs")
+        logger.info("APScheduler initialized with 11 jobs")
         self._initialized = True
     
     def start(self):
@@ -9,8 +9,10 @@ class FileUploadInit(BaseModel):
     """Initialize chunked file upload"""
     filename: str = Field(..., min_length=1, max_length=255)
     file_size: int = Field(..., gt=0)
-    total_chunks: int = Field(..., gt=0)
+    total_chunks: Optional[int] = Field(None, gt=0)  # Ignored; the server decides the chunk layout
+    link_speed: Optional[int] = Field(None, gt=0)  # Client's upload speed estimate in bytes/s
     mime_type: Optional[str] = None
+    checksum: Optional[str] = Field(None, min_length=64, max_length=64)  # SHA-256, enables instant upload
     
     @field_validator('filename')
     @classmethod
@@ -24,10 +26,26 @@ class FileUploadInit(BaseModel):
 
 
 class FileUploadInitResponse(BaseModel):
-    """Response for upload initialization"""
+    """Response for upload initialization; clients must use its chunk layout"""
+    upload_id: Optional[uuid.UUID] = None
+    chunk_size: int
+    total_chunks: int
+    instant: bool = False  # Content already stored; no chunks to send
+    file_id: Optional[uuid.UUID] = None
+
+
+class UploadStatusResponse(BaseModel):
+    """Progress of a chunked upload, for resuming it"""
     upload_id: uuid.UUID
+    filename: str
+    file_size: int
     chunk_size: int
     total_chunks: int
+    received_chunks: int
+    bytes_received: int
+    missing_ranges: List[List[int]]  # Inclusive [first, last] chunk numbers
+    last_activity: datetime
+    expires_at: datetime
 
 
 class FileUploadChunk(BaseModel):
@@ -41,6 +59,27 @@ class FileUploadComplete(BaseModel):
     """Complete file upload"""
     upload_id: uuid.UUID
     final_checksum: str = Field(..., min_length=64, max_length=64)
+    tree_hash: Optional[str] = Field(None, min_length=64, max_length=64)
+
+
+class FileManifestResponse(BaseModel):
+    """Chunk manifest of a file"""
+    file_id: uuid.UUID
+    chunk_size: int
+    chunk_checksums: List[str]
+    tree_hash: str
+    checksum_verified: bool
+
+
+class FileStorageResponse(BaseModel):
+    """How a file's content is stored on disk"""
+    file_id: uuid.UUID
+    codec: str
+    size: int
+    stored_size: int
+    compression_ratio: float  # Stored/original size
+    compression_seconds: Optional[float]  # CPU time spent compressing
+    references: int  # Files sharing the stored content
 
 
 class FileResponse(BaseModel):
@@ -99,3 +138,31 @@ class FileRenameRequest(BaseModel):
 class BulkDownloadRequest(BaseModel):
     """Bulk download request"""
     file_ids: List[uuid.UUID] = Field(..., min_items=1, max_items=100)
+
+
+class SignedUrlResponse(BaseModel):
+    """Download URL usable without authentication until it expires"""
+    url: str
+    expires_at: datetime
+    bound_ip: Optional[str]
+
+
+class DownloadBandwidthLimits(BaseModel):
+    """Download rate limits in bytes per second; 0 is unlimited"""
+    global_rate: int = Field(..., ge=0)
+    user_rate: int = Field(..., ge=0)
+
+
+class ArchiveJobResponse(BaseModel):
+    """Progress of an archive build"""
+    job_id: uuid.UUID
+    status: str  # pending, running, completed or failed
+    file_count: int
+    total_bytes: int  # Original size of all members
+    processed_bytes: int
+    progress: float  # 0-100
+    archive_size: Optional[int]  # Set once completed
+    cached: bool  # Served from an archive built earlier
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
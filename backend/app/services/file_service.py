@@ -1,162 +1,1002 @@
 """File service for managing file uploads, downloads, and operations"""
 import os
+import asyncio
+import errno
 import uuid
 import shutil
+import hashlib
 import zipfile
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple, BinaryIO
-from sqlalchemy import select, and_, or_, func, desc
+from functools import partial
+from typing import Optional, List, Tuple, BinaryIO, Union, AsyncIterator, Dict
+from sqlalchemy import select, update, delete, and_, or_, func, desc, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import UploadFile
-import aiofiles
 
-from app.models.file import File, SyncStatus
-from app.models.sync import UploadChunk
+from app.models.file import Blob, File, FileManifest, SyncStatus
+from app.models.sync import UploadSession, UploadStat
 from app.models.user import User
 from app.utils.file_utils import (
-    calculate_checksum,
+    Crc32,
+    calculate_checksum_and_crc32,
+    compute_tree_hash,
     ensure_directory_exists,
-    is_safe_path
+    is_safe_path,
+    iter_blocks,
+    preallocate_file,
+    write_at,
+    fsync_file,
+    move_file,
+    link_file,
+    copy_range
 )
+from app.utils.delta import (
+    DeltaReader,
+    OP_COPY,
+    OP_END,
+    OP_LITERAL,
+    build_signature,
+    choose_block_size
+)
+from app.utils.compression import (
+    CODEC_IDENTITY,
+    CODEC_ZLIB,
+    compress_file,
+    crc32_stored_file,
+    is_compressible_type,
+    open_stored_file
+)
+from app.utils.archive_jobs import archive_jobs
+from app.utils.file_cache import invalidate_file
+from app.utils.io_pool import io_pool
+from app.utils.bitmap import new_bitmap, count_bits
 from app.config import settings
 
+# Idle time after which an unfinished upload session expires
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+# Uploads with a chunk received this recently count towards server load
+UPLOAD_ACTIVE_WINDOW = timedelta(minutes=5)
+
+# Completed uploads averaged for the throughput estimate
+UPLOAD_STATS_WINDOW = 50
+
+# Appended to a blob's path once its content is stored compressed
+COMPRESSED_BLOB_SUFFIX = ".z"
+
+# Advisory lock key serializing disk-space reservations across workers
+UPLOAD_RESERVATION_LOCK = 0x75706C64
+
+
+class InsufficientStorageError(ValueError):
+    """Raised when an upload's declared size cannot be reserved on disk"""
+
+
+class _RunningDigest:
+    """Full-file SHA-256 and CRC-32 advanced while chunks arrive in order"""
+    
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.crc32 = Crc32()
+        self.next_chunk = 0
+        self.chunk_checksums: List[str] = []
+        self.busy = False
+
+
+class _ChunkDigests:
+    """SHA-256 of each ``chunk_size`` piece of content hashed in order, with a hashlib-style ``update``"""
+    
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.checksums: List[str] = []
+        self._sha256 = hashlib.sha256()
+        self._filled = 0
+    
+    def update(self, data) -> None:
+        view = memoryview(data)
+        while len(view):
+            take = min(len(view), self.chunk_size - self._filled)
+            self._sha256.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == self.chunk_size:
+                self.checksums.append(self._sha256.hexdigest())
+                self._sha256 = hashlib.sha256()
+                self._filled = 0
+    
+    def finish(self) -> List[str]:
+        """Checksums of every chunk, the last one possibly short"""
+        if self._filled:
+            self.checksums.append(self._sha256.hexdigest())
+            self._sha256 = hashlib.sha256()
+            self._filled = 0
+        return self.checksums
+
+
+# Uploads whose full-file checksum is being computed in this process.
+# Only chunks streamed in order through the same worker advance the digest;
+# anything else falls back to background verification after completion.
+_running_digests: Dict[uuid.UUID, _RunningDigest] = {}
+
+
+def _close_after_write(fd: int, write: "asyncio.Future") -> None:
+    """Close a chunk's fd once a write left running by a cancelled request ends"""
+    if not write.cancelled():
+        write.exception()  # Retrieved, so it is not reported as never awaited
+    os.close(fd)
+
 
 class FileService:
     """Service for file management operations"""
     
+    @staticmethod
+    def get_upload_path(upload_id: uuid.UUID) -> str:
+        """Path of the preallocated file an upload's chunks are written into"""
+        return os.path.join(settings.TEMP_FILES_PATH, f"{upload_id}.part")
+    
+    @staticmethod
+    def get_blob_path(checksum: str) -> str:
+        """Content-addressed path of the blob holding content with ``checksum``"""
+        return os.path.join(settings.ACTIVE_FILES_PATH, "blobs", checksum[:2], checksum[2:4], checksum)
+    
+    @staticmethod
+    async def store_blob(
+        db: AsyncSession,
+        source_path: str,
+        checksum: str,
+        size: int
+    ) -> Tuple[uuid.UUID, str]:
+        """
+        Add a reference to the blob for ``checksum`` backed by ``source_path``
+        
+        The source file becomes the blob's content when no blob exists yet
+        and is discarded otherwise. New content is stored raw, so this
+        costs no more than a link; ``compress_blob`` may compress it later.
+        ``checksum`` must already be verified against the source. The
+        upsert keeps the blob row locked until the caller commits, so a
+        concurrent release cannot unlink it meanwhile.
+        
+        Returns:
+            Tuple of (blob_id, storage_path)
+        """
+        raw_path = FileService.get_blob_path(checksum)
+        result = await db.execute(
+            pg_insert(Blob)
+            .values(
+                id=uuid.uuid4(),
+                checksum=checksum,
+                storage_path=raw_path,
+                size=size,
+                ref_count=1,
+                created_at=datetime.utcnow()
+            )
+            .on_conflict_do_update(
+                index_elements=[Blob.checksum],
+                set_={"ref_count": Blob.ref_count + 1}
+            )
+            .returning(Blob.id, Blob.storage_path, Blob.ref_count)
+        )
+        blob_id, storage_path, ref_count = result.one()
+        
+        # A file at the path of a new blob is left over from a removed one
+        if ref_count == 1 and os.path.exists(storage_path):
+            os.remove(storage_path)
+        
+        # Also repairs a blob whose content went missing from disk, storing
+        # it raw again for every file sharing it
+        if not os.path.exists(storage_path):
+            await ensure_directory_exists(os.path.dirname(raw_path))
+            await link_file(source_path, raw_path)
+            if storage_path != raw_path:
+                await db.execute(
+                    update(File)
+                    .where(File.blob_id == blob_id)
+                    .values(filepath=raw_path)
+                    .execution_options(synchronize_session=False)
+                )
+                storage_path = raw_path
+            await db.execute(
+                update(Blob)
+                .where(Blob.id == blob_id)
+                .values(storage_path=raw_path, codec=CODEC_IDENTITY, stored_size=None, compression_seconds=None)
+                .execution_options(synchronize_session=False)
+            )
+        
+        if os.path.abspath(source_path) != os.path.abspath(storage_path):
+            os.remove(source_path)
+        
+        return blob_id, storage_path
+    
+    @staticmethod
+    async def compress_blob(db: AsyncSession, blob_id: uuid.UUID) -> bool:
+        """
+        Compress a blob stored raw, when the storage policy allows
+        
+        Blobs are stored raw at upload and have no ``stored_size`` until
+        this has considered them. The content is compressed next to the raw
+        file with no connection held; then, under a short lock on the blob
+        row, the compressed file is moved into place and the blob's codec,
+        stored size and path swapped with its files' paths, and the raw
+        file removed. Content not worth compressing is only marked as
+        considered.
+        
+        Returns:
+            True if the blob is now stored compressed
+        """
+        result = await db.execute(
+            select(Blob.storage_path, Blob.size, Blob.stored_size, File.mime_type)
+            .outerjoin(File, File.blob_id == Blob.id)
+            .where(Blob.id == blob_id)
+            .limit(1)
+        )
+        row = result.one_or_none()
+        if row is None or row.stored_size is not None or not os.path.exists(row.storage_path):
+            return False
+        storage_path, size = row.storage_path, row.size
+        await db.commit()
+        
+        compressed_path = storage_path + COMPRESSED_BLOB_SUFFIX
+        compressed = await FileService._compress_blob(storage_path, compressed_path, size, row.mime_type)
+        temp_path = compressed[0] if compressed else None
+        
+        try:
+            result = await db.execute(
+                select(Blob.storage_path, Blob.stored_size)
+                .where(Blob.id == blob_id)
+                .with_for_update()
+            )
+            current = result.one_or_none()
+            if current is None or current.storage_path != storage_path or current.stored_size is not None:
+                # Released, repaired or already considered meanwhile
+                await db.commit()
+                return False
+            
+            if compressed is None:
+                await db.execute(
+                    update(Blob)
+                    .where(Blob.id == blob_id)
+                    .values(stored_size=size)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                return False
+            
+            _, stored_size, compression_seconds = compressed
+            os.replace(temp_path, compressed_path)
+            temp_path = None
+            await db.execute(
+                update(Blob)
+                .where(Blob.id == blob_id)
+                .values(
+                    storage_path=compressed_path,
+                    codec=CODEC_ZLIB,
+                    stored_size=stored_size,
+                    compression_seconds=compression_seconds
+                )
+                .execution_options(synchronize_session=False)
+            )
+            result = await db.execute(
+                update(File)
+                .where(File.blob_id == blob_id)
+                .values(filepath=compressed_path)
+                .returning(File.id)
+                .execution_options(synchronize_session=False)
+            )
+            file_ids = list(result.scalars().all())
+            await db.commit()
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        for file_id in file_ids:
+            invalidate_file(file_id)
+        # Readers that opened the raw file keep reading it until they close it
+        if os.path.exists(storage_path):
+            os.remove(storage_path)
+        return True
+    
+    @staticmethod
+    async def _compress_blob(
+        source_path: str,
+        storage_path: str,
+        size: int,
+        mime_type: Optional[str]
+    ) -> Optional[Tuple[str, int, float]]:
+        """
+        Write blob content compressed beside ``storage_path`` when the storage policy allows
+        
+        Returns:
+            Tuple of (temporary path, stored size, CPU seconds spent
+            compressing), or None if the content should stay raw
+        """
+        if (
+            not settings.STORAGE_COMPRESSION
+            or size < settings.COMPRESSION_MIN_SIZE
+            or not is_compressible_type(mime_type)
+        ):
+            return None
+        
+        temp_path = f"{storage_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            result = await io_pool.run(
+                compress_file,
+                source_path,
+                temp_path,
+                settings.COMPRESSION_FRAME_SIZE,
+                settings.COMPRESSION_LEVEL,
+                settings.COMPRESSION_MAX_RATIO
+            )
+        except OSError:
+            # Compression is optional; stay raw rather than fail
+            return None
+        if result is None:
+            return None
+        
+        stored_size, compression_seconds = result
+        return temp_path, stored_size, compression_seconds
+    
+    @staticmethod
+    async def list_uncompressed_blobs(db: AsyncSession, limit: int) -> List[uuid.UUID]:
+        """IDs of up to ``limit`` blobs ``compress_blob`` has not considered yet"""
+        result = await db.execute(
+            select(Blob.id)
+            .where(Blob.stored_size.is_(None))
+            .order_by(Blob.created_at)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_storage_codec(db: AsyncSession, file_record: File) -> str:
+        """Codec of a file's stored content, for ``open_stored_file``"""
+        if file_record.blob_id is None:
+            return CODEC_IDENTITY
+        result = await db.execute(select(Blob.codec).where(Blob.id == file_record.blob_id))
+        return result.scalar_one_or_none() or CODEC_IDENTITY
+    
+    @staticmethod
+    async def compute_crc32(db: AsyncSession, file_id: uuid.UUID) -> Optional[int]:
+        """
+        Read a file to compute and store its missing CRC-32
+        
+        Files uploaded out of order get theirs at background verification;
+        older files are backfilled through this by a scheduled job. The
+        connection is released while the file is read.
+        
+        Returns:
+            The CRC-32, or None if the file is gone
+        """
+        file_record = await FileService.get_file(db, file_id)
+        if not file_record or not os.path.exists(file_record.filepath):
+            return None
+        if file_record.crc32 is not None:
+            return file_record.crc32
+        
+        codec = await FileService.get_storage_codec(db, file_record)
+        filepath = file_record.filepath
+        await db.commit()
+        
+        crc32 = await io_pool.run(crc32_stored_file, filepath, codec)
+        await db.execute(
+            update(File)
+            .where(and_(File.id == file_id, File.filepath == filepath))
+            .values(crc32=crc32)
+        )
+        await db.commit()
+        return crc32
+    
+    @staticmethod
+    async def list_files_missing_crc32(db: AsyncSession, limit: int) -> List[uuid.UUID]:
+        """IDs of up to ``limit`` files whose CRC-32 has not been computed yet"""
+        result = await db.execute(
+            select(File.id)
+            .where(and_(File.crc32.is_(None), File.is_deleted == False))
+            .order_by(File.upload_date.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_storage_info(db: AsyncSession, file_id: uuid.UUID) -> Optional[dict]:
+        """
+        How a file's content is stored on disk
+        
+        Returns:
+            Dictionary with codec, original and stored size, compression
+            ratio, CPU seconds spent compressing and the number of files
+            sharing the content, or None if the file does not exist
+        """
+        result = await db.execute(
+            select(File, Blob).outerjoin(Blob, File.blob_id == Blob.id).where(File.id == file_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return None
+        file_record, blob = row
+        
+        if blob is None:
+            codec, stored_size, compression_seconds, references = CODEC_IDENTITY, file_record.size, None, 1
+        else:
+            codec = blob.codec
+            stored_size = blob.stored_size if blob.stored_size is not None else blob.size
+            compression_seconds = blob.compression_seconds
+            references = blob.ref_count
+        
+        return {
+            "file_id": file_record.id,
+            "codec": codec,
+            "size": file_record.size,
+            "stored_size": stored_size,
+            "compression_ratio": round(stored_size / file_record.size, 4) if file_record.size else 1.0,
+            "compression_seconds": compression_seconds,
+            "references": references
+        }
+    
+    @staticmethod
+    async def release_blob(db: AsyncSession, blob_id: uuid.UUID) -> None:
+        """
+        Drop a reference to a blob, removing it with its last reference
+        
+        The file row holding the reference must already be deleted. The
+        content is unlinked before the caller commits, while the row lock
+        still blocks a concurrent upload from re-referencing it.
+        """
+        result = await db.execute(
+            update(Blob)
+            .where(Blob.id == blob_id)
+            .values(ref_count=Blob.ref_count - 1)
+            .returning(Blob.ref_count, Blob.storage_path)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        if row is None or row.ref_count > 0:
+            return
+        
+        await db.execute(
+            delete(Blob)
+            .where(Blob.id == blob_id)
+            .execution_options(synchronize_session=False)
+        )
+        if os.path.exists(row.storage_path):
+            os.remove(row.storage_path)
+    
+    @staticmethod
+    def choose_chunk_size(
+        file_size: int,
+        throughput: Optional[int] = None,
+        active_uploads: int = 0
+    ) -> int:
+        """
+        Pick the chunk size for an upload
+        
+        Aims for ``UPLOAD_TARGET_CHUNKS`` chunks, but no larger than what
+        the expected throughput moves in ``UPLOAD_CHUNK_SECONDS`` (or
+        ``CHUNK_SIZE`` if it is unknown), so a failed chunk stays cheap to
+        resend. That cap shrinks as concurrent uploads share the server.
+        The result is rounded up to whole MB and clamped to
+        ``MIN_CHUNK_SIZE``..``MAX_CHUNK_SIZE``.
+        
+        Args:
+            file_size: Declared file size in bytes
+            throughput: Expected upload speed in bytes per second
+            active_uploads: Uploads currently sending chunks
+        
+        Returns:
+            Chunk size in bytes
+        """
+        chunk_size = -(-file_size // settings.UPLOAD_TARGET_CHUNKS)
+        
+        if throughput:
+            cap = throughput * settings.UPLOAD_CHUNK_SECONDS
+        else:
+            cap = settings.CHUNK_SIZE
+        cap = int(cap / (1 + active_uploads / settings.UPLOAD_BUSY_SESSIONS))
+        chunk_size = min(chunk_size, cap)
+        
+        mb = 1024 * 1024
+        chunk_size = -(-chunk_size // mb) * mb
+        return max(settings.MIN_CHUNK_SIZE, min(chunk_size, settings.MAX_CHUNK_SIZE))
+    
+    @staticmethod
+    async def reserve_disk_space(db: AsyncSession, file_size: int) -> None:
+        """
+        Check that an upload of ``file_size`` bytes fits on disk
+        
+        Every live upload session holds a reservation until it completes,
+        is cancelled or expires. On the temp volume a preallocated upload
+        file already occupies its space, so only sparse ones still count
+        for their unreceived bytes. When the active volume is a different
+        filesystem, every session counts in full there, since completion
+        copies the file across. ``UPLOAD_DISK_HEADROOM`` is always kept
+        free. A transaction-level advisory lock serializes the check with
+        the session insert, so the lock is held until the caller commits.
+        Archives still being built under the temp directory count for the
+        space they may yet write; that part is known to this worker only.
+        
+        Raises:
+            InsufficientStorageError: If the reservation cannot fit
+        """
+        await db.execute(select(func.pg_advisory_xact_lock(UPLOAD_RESERVATION_LOCK)))
+        
+        await ensure_directory_exists(settings.TEMP_FILES_PATH)
+        await ensure_directory_exists(settings.ACTIVE_FILES_PATH)
+        
+        temp_reserved = await FileService._sparse_upload_reserved(db) + archive_jobs.reserved_bytes()
+        temp_free = shutil.disk_usage(settings.TEMP_FILES_PATH).free
+        if file_size + temp_reserved + settings.UPLOAD_DISK_HEADROOM > temp_free:
+            raise InsufficientStorageError("Not enough disk space for this upload")
+        
+        if os.stat(settings.ACTIVE_FILES_PATH).st_dev != os.stat(settings.TEMP_FILES_PATH).st_dev:
+            result = await db.execute(
+                select(func.coalesce(func.sum(UploadSession.file_size), 0))
+            )
+            active_reserved = result.scalar()
+            active_free = shutil.disk_usage(settings.ACTIVE_FILES_PATH).free
+            if file_size + active_reserved + settings.UPLOAD_DISK_HEADROOM > active_free:
+                raise InsufficientStorageError("Not enough disk space for this upload")
+    
+    @staticmethod
+    async def _sparse_upload_reserved(db: AsyncSession) -> int:
+        # Outstanding need of sparse upload files on the temp volume
+        result = await db.execute(
+            select(func.coalesce(func.sum(UploadSession.file_size - UploadSession.bytes_received), 0))
+            .where(UploadSession.preallocated == False)
+        )
+        return result.scalar()
+    
+    @staticmethod
+    async def archive_space_available(db: AsyncSession) -> int:
+        """
+        Free space on the temp volume left to archive builds
+        
+        Upload reservations are set aside and ``UPLOAD_DISK_HEADROOM`` kept
+        free, as in ``reserve_disk_space``; the job manager sets aside its
+        own running builds. Takes the same advisory lock, so the caller
+        should submit the build before committing.
+        """
+        await db.execute(select(func.pg_advisory_xact_lock(UPLOAD_RESERVATION_LOCK)))
+        await ensure_directory_exists(settings.TEMP_FILES_PATH)
+        
+        temp_reserved = await FileService._sparse_upload_reserved(db)
+        temp_free = shutil.disk_usage(settings.TEMP_FILES_PATH).free
+        return temp_free - temp_reserved - settings.UPLOAD_DISK_HEADROOM
+    
     @staticmethod
     async def initialize_upload(
         db: AsyncSession,
         filename: str,
         file_size: int,
-        total_chunks: int,
         user_id: uuid.UUID,
-        mime_type: Optional[str] = None
+        mime_type: Optional[str] = None,
+        link_speed: Optional[int] = None
     ) -> Tuple[uuid.UUID, int]:
         """
         Initialize a chunked file upload
         
+        The server chooses the chunk size (see ``choose_chunk_size``) from
+        the client's link speed hint, or recent upload throughput when no
+        hint is given, and the number of active uploads. The destination
+        file is preallocated at its declared size so that chunks can be
+        written straight to their final offsets. The declared size is
+        reserved against free disk space first (see ``reserve_disk_space``).
+        
+        Args:
+            link_speed: Client's estimate of its upload speed in bytes per second
+        
         Returns:
             Tuple of (upload_id, chunk_size)
         """
-        upload_id = uuid.uuid4()
-        chunk_size = settings.CHUNK_SIZE
+        if file_size > settings.MAX_UPLOAD_SIZE:
+            raise ValueError("File exceeds maximum upload size")
         
-        # Create upload directory
-        upload_dir = os.path.join(settings.TEMP_FILES_PATH, str(upload_id))
-        await ensure_directory_exists(upload_dir)
+        now = datetime.utcnow()
+        result = await db.execute(
+            select(func.count(UploadSession.id))
+            .where(UploadSession.last_activity > now - UPLOAD_ACTIVE_WINDOW)
+        )
+        active_uploads = result.scalar()
+        
+        throughput = link_speed
+        if not throughput:
+            recent = (
+                select(UploadStat.throughput)
+                .order_by(UploadStat.completed_at.desc())
+                .limit(UPLOAD_STATS_WINDOW)
+                .subquery()
+            )
+            result = await db.execute(select(func.avg(recent.c.throughput)))
+            average = result.scalar()
+            throughput = int(average) if average else None
         
-        # Store upload metadata in chunks table
-        # Chunks will be added as they are uploaded
+        upload_id = uuid.uuid4()
+        chunk_size = FileService.choose_chunk_size(file_size, throughput, active_uploads)
+        total_chunks = (file_size + chunk_size - 1) // chunk_size
+        
+        # Reserve disk space; held until this transaction commits the session
+        await FileService.reserve_disk_space(db, file_size)
+        
+        # Preallocate the destination file
+        upload_path = FileService.get_upload_path(upload_id)
+        try:
+            preallocated = await preallocate_file(upload_path, file_size)
+        except OSError as e:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            if e.errno == errno.ENOSPC:
+                raise InsufficientStorageError("Not enough disk space for this upload")
+            raise
+        _running_digests[upload_id] = _RunningDigest()
+        
+        # Persist the upload session
+        upload_session = UploadSession(
+            id=upload_id,
+            user_id=user_id,
+            filename=filename,
+            mime_type=mime_type,
+            file_size=file_size,
+            chunk_size=chunk_size,
+            total_chunks=total_chunks,
+            received_chunks=new_bitmap(total_chunks),
+            chunk_checksums=[None] * total_chunks,
+            bytes_received=0,
+            link_speed=link_speed,
+            preallocated=preallocated,
+            created_at=now,
+            last_activity=now,
+            expires_at=now + UPLOAD_SESSION_TTL
+        )
+        db.add(upload_session)
+        await db.commit()
         
         return upload_id, chunk_size
     
+    @staticmethod
+    async def instant_upload(
+        db: AsyncSession,
+        filename: str,
+        file_size: int,
+        checksum: str,
+        user_id: uuid.UUID,
+        mime_type: Optional[str] = None
+    ) -> Optional[File]:
+        """
+        Create a file from stored content with the same SHA-256, if any
+        
+        Lets a client skip sending chunks for content the server already
+        holds. The new file takes a reference on the existing blob and
+        copies a chunk manifest from a file sharing it.
+        
+        Returns:
+            File record, or None if the content has to be uploaded
+        """
+        result = await db.execute(
+            select(Blob.id, Blob.storage_path)
+            .where(and_(Blob.checksum == checksum, Blob.size == file_size))
+        )
+        row = result.one_or_none()
+        if row is None or not os.path.exists(row.storage_path):
+            return None
+        
+        # Fails only if the last reference was released meanwhile
+        result = await db.execute(
+            update(Blob)
+            .where(Blob.id == row.id)
+            .values(ref_count=Blob.ref_count + 1)
+            .returning(Blob.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.scalar_one_or_none() is None:
+            return None
+        
+        result = await db.execute(
+            select(File.crc32)
+            .where(and_(File.blob_id == row.id, File.crc32.isnot(None)))
+            .limit(1)
+        )
+        
+        file_record = File(
+            id=uuid.uuid4(),
+            filename=filename,
+            filepath=row.storage_path,
+            size=file_size,
+            checksum=checksum,
+            crc32=result.scalar(),
+            checksum_verified=True,
+            mime_type=mime_type,
+            blob_id=row.id,
+            uploaded_by=user_id,
+            upload_date=datetime.utcnow(),
+            is_deleted=False,
+            sync_status=SyncStatus.PENDING
+        )
+        db.add(file_record)
+        
+        result = await db.execute(
+            select(FileManifest)
+            .join(File, File.id == FileManifest.file_id)
+            .where(File.blob_id == row.id)
+            .limit(1)
+        )
+        manifest = result.scalar_one_or_none()
+        if manifest:
+            db.add(FileManifest(
+                file_id=file_record.id,
+                chunk_size=manifest.chunk_size,
+                chunk_checksums=manifest.chunk_checksums,
+                tree_hash=manifest.tree_hash
+            ))
+        
+        await db.commit()
+        await db.refresh(file_record)
+        
+        return file_record
+    
+    @staticmethod
+    async def get_upload_session(
+        db: AsyncSession,
+        upload_id: uuid.UUID,
+        user_id: Optional[uuid.UUID] = None,
+        for_update: bool = False
+    ) -> Optional[UploadSession]:
+        """
+        Get an upload session
+        
+        Args:
+            upload_id: Upload session ID
+            user_id: If given, only return the session when owned by this user
+            for_update: Lock the row until the end of the transaction
+        """
+        query = select(UploadSession).where(UploadSession.id == upload_id)
+        if user_id is not None:
+            query = query.where(UploadSession.user_id == user_id)
+        if for_update:
+            query = query.with_for_update()
+        
+        result = await db.execute(query)
+        return result.scalar_one_or_none()
+    
     @staticmethod
     async def upload_chunk(
         db: AsyncSession,
         upload_id: uuid.UUID,
         chunk_number: int,
-        chunk_data: bytes,
-        filename: str,
-        total_chunks: int,
-        checksum: str
+        chunk_data: Union[bytes, UploadFile, AsyncIterator[bytes]],
+        filename: Optional[str],
+        total_chunks: Optional[int],
+        checksum: str,
+        user_id: Optional[uuid.UUID] = None
     ) -> bool:
         """
         Upload a file chunk
         
+        The chunk body is consumed in blocks of ``settings.UPLOAD_BLOCK_SIZE``:
+        each block updates the SHA-256 and is written with a positional
+        write at ``chunk_number * chunk_size`` in the preallocated upload
+        file, so memory per in-flight chunk stays bounded and chunks may
+        arrive in any order. Re-sending a chunk overwrites it in place and
+        replaces its checksum in the manifest. One the running full-file
+        digest has already taken in drops that digest, so completion falls
+        back to background verification; a chunk that fails its size or
+        checksum check after overwriting data is marked missing again.
+        
+        Args:
+            total_chunks: Client's view of the chunk count, checked against
+                the session when given
+        
         Returns:
             True if successful
         """
-        # Verify checksum
-        import hashlib
-        actual_checksum = hashlib.sha256(chunk_data).hexdigest()
-        if actual_checksum != checksum:
-            raise ValueError("Chunk checksum mismatch")
+        upload_session = await FileService.get_upload_session(db, upload_id, user_id)
+        if not upload_session:
+            raise ValueError("Upload not found")
         
-        # Save chunk to temp directory
-        upload_dir = os.path.join(settings.TEMP_FILES_PATH, str(upload_id))
-        chunk_path = os.path.join(upload_dir, f"chunk_{chunk_number}")
+        if total_chunks is not None and total_chunks != upload_session.total_chunks:
+            raise ValueError("Total chunks does not match the upload")
+        if chunk_number >= upload_session.total_chunks:
+            raise ValueError("Chunk number out of range")
         
-        async with aiofiles.open(chunk_path, 'wb') as f:
-            await f.write(chunk_data)
+        offset = chunk_number * upload_session.chunk_size
+        expected_size = min(upload_session.chunk_size, upload_session.file_size - offset)
         
-        # Store chunk metadata
-        expires_at = datetime.utcnow() + timedelta(hours=24)
-        chunk_record = UploadChunk(
-            upload_id=upload_id,
-            filename=filename,
-            total_chunks=total_chunks,
-            chunk_number=chunk_number,
-            chunk_size=len(chunk_data),
-            checksum=checksum,
-            expires_at=expires_at,
-            file_path=chunk_path
+        # Release the connection while the body streams in
+        await db.commit()
+        
+        upload_path = FileService.get_upload_path(upload_id)
+        try:
+            fd = os.open(upload_path, os.O_WRONLY)
+        except FileNotFoundError:
+            raise ValueError("Upload not found")
+        
+        pending = None
+        try:
+            # Feed the full-file digest too when this is the next chunk in order
+            running = _running_digests.get(upload_id)
+            file_sha256 = file_crc32 = None
+            if running and (chunk_number < running.next_chunk or (chunk_number == running.next_chunk and running.busy)):
+                # About to overwrite bytes the digest has taken in, or is taking in
+                _running_digests.pop(upload_id, None)
+                running = None
+            if running and running.next_chunk == chunk_number and not running.busy:
+                running.busy = True
+                file_sha256 = running.sha256.copy()
+                file_crc32 = running.crc32.copy()
+            
+            # Stream chunk into place while hashing
+            sha256 = hashlib.sha256()
+            chunk_size = 0
+            try:
+                async for block in iter_blocks(chunk_data, settings.UPLOAD_BLOCK_SIZE):
+                    if chunk_size + len(block) > expected_size:
+                        raise ValueError("Chunk exceeds expected size")
+                    hashers = (sha256,) if file_sha256 is None else (sha256, file_sha256, file_crc32)
+                    # Shielded so a cancelled request cannot lose track of a pwrite still in the pool
+                    pending = asyncio.ensure_future(write_at(fd, block, offset + chunk_size, hashers))
+                    await asyncio.shield(pending)
+                    chunk_size += len(block)
+                
+                if chunk_size != expected_size:
+                    raise ValueError(f"Chunk size mismatch: expected {expected_size} bytes, got {chunk_size}")
+                
+                # Verify checksum
+                if sha256.hexdigest() != checksum:
+                    raise ValueError("Chunk checksum mismatch")
+                
+                if file_sha256 is not None:
+                    running.sha256 = file_sha256
+                    running.crc32 = file_crc32
+                    running.chunk_checksums.append(checksum)
+                    running.next_chunk += 1
+            finally:
+                if file_sha256 is not None:
+                    running.busy = False
+        except ValueError:
+            if pending is not None:
+                await FileService._drop_chunk(db, upload_id, chunk_number, expected_size)
+            raise
+        finally:
+            if pending is not None and not pending.done():
+                # Closing now could let the fd number be reused under the write
+                pending.add_done_callback(partial(_close_after_write, fd))
+            else:
+                os.close(fd)
+        
+        # Mark the chunk as received: one atomic UPDATE of the ledger row
+        now = datetime.utcnow()
+        already_received = func.get_bit(UploadSession.received_chunks, chunk_number) == 1
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_id)
+            .values({
+                UploadSession.received_chunks: func.set_bit(UploadSession.received_chunks, chunk_number, 1),
+                UploadSession.chunk_checksums[chunk_number + 1]: checksum,
+                UploadSession.bytes_received: UploadSession.bytes_received + case(
+                    (already_received, 0),
+                    else_=chunk_size
+                ),
+                UploadSession.last_activity: now,
+                UploadSession.expires_at: now + UPLOAD_SESSION_TTL
+            })
+            .returning(UploadSession.id)
+            .execution_options(synchronize_session=False)
         )
+        if result.scalar_one_or_none() is None:
+            raise ValueError("Upload not found")
         
-        db.add(chunk_record)
         await db.commit()
         
         return True
     
+    @staticmethod
+    async def _drop_chunk(db: AsyncSession, upload_id: uuid.UUID, chunk_number: int, chunk_size: int) -> None:
+        """Mark a chunk whose data was partly overwritten as missing, so it must be sent again"""
+        was_received = func.get_bit(UploadSession.received_chunks, chunk_number) == 1
+        await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_id)
+            .values({
+                UploadSession.received_chunks: func.set_bit(UploadSession.received_chunks, chunk_number, 0),
+                UploadSession.chunk_checksums[chunk_number + 1]: None,
+                UploadSession.bytes_received: UploadSession.bytes_received - case(
+                    (was_received, chunk_size),
+                    else_=0
+                )
+            })
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    
     @staticmethod
     async def complete_upload(
         db: AsyncSession,
         upload_id: uuid.UUID,
-        filename: str,
         final_checksum: str,
         user_id: uuid.UUID,
-        mime_type: Optional[str] = None
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        tree_hash: Optional[str] = None
     ) -> File:
         """
-        Complete a chunked upload by assembling chunks into final file
+        Complete a chunked upload
+        
+        Chunks are already in place in the preallocated upload file and each
+        was verified against its SHA-256 on arrival, so completion checks the
+        session's received-chunk bitmap and chunk manifest (and the client's
+        tree hash, if given) instead of re-reading the file. The full-file
+        checksum is confirmed from the in-order running digest when
+        available; otherwise the file is stored with
+        ``checksum_verified=False`` for background verification.
+        
+        Args:
+            filename: Overrides the filename given at initialization
+            mime_type: Overrides the MIME type given at initialization
         
         Returns:
             File record
         """
-        # Get all chunks for this upload
-        result = await db.execute(
-            select(UploadChunk)
-            .where(UploadChunk.upload_id == upload_id)
-            .order_by(UploadChunk.chunk_number)
-        )
-        chunks = result.scalars().all()
-        
-        if not chunks:
-            raise ValueError("No chunks found for this upload")
+        upload_session = await FileService.get_upload_session(db, upload_id, user_id, for_update=True)
+        if not upload_session:
+            raise ValueError("Upload not found")
         
         # Verify all chunks are present
-        expected_chunks = chunks[0].total_chunks
-        if len(chunks) != expected_chunks:
-            raise ValueError(f"Expected {expected_chunks} chunks, found {len(chunks)}")
+        received = count_bits(upload_session.received_chunks)
+        if received != upload_session.total_chunks:
+            raise ValueError(f"Expected {upload_session.total_chunks} chunks, found {received}")
+        
+        filename = filename or upload_session.filename
+        mime_type = mime_type or upload_session.mime_type
+        
+        chunk_checksums = list(upload_session.chunk_checksums)
+        if len(chunk_checksums) != upload_session.total_chunks or None in chunk_checksums:
+            raise ValueError("Upload has missing chunk checksums")
+        
+        upload_path = FileService.get_upload_path(upload_id)
+        if not os.path.exists(upload_path):
+            raise ValueError("Upload file not found")
+        
+        file_size = upload_session.file_size
+        if upload_session.bytes_received != file_size:
+            raise ValueError("Uploaded chunks do not cover the whole file")
+        
+        # Verify the chunk manifest
+        actual_tree_hash = compute_tree_hash(chunk_checksums)
+        if tree_hash and tree_hash != actual_tree_hash:
+            raise ValueError("Tree hash mismatch")
+        
+        # Verify final checksum if it was computed while the chunks arrived
+        checksum_verified = False
+        crc32 = None
+        running = _running_digests.get(upload_id)
+        # A chunk re-sent through another worker changed the manifest under the digest
+        if (
+            running
+            and running.next_chunk == upload_session.total_chunks
+            and running.chunk_checksums == chunk_checksums
+        ):
+            if running.sha256.hexdigest() != final_checksum:
+                raise ValueError("Final file checksum mismatch")
+            checksum_verified = True
+            crc32 = running.crc32.value
         
-        # Create final file directory
         now = datetime.utcnow()
-        year_month = now.strftime("%Y/%m")
-        final_dir = os.path.join(settings.ACTIVE_FILES_PATH, year_month)
-        await ensure_directory_exists(final_dir)
-        
-        # Generate unique filename on disk
         file_id = uuid.uuid4()
-        file_ext = os.path.splitext(filename)[1]
-        disk_filename = f"{file_id}{file_ext}"
-        final_path = os.path.join(final_dir, disk_filename)
-        
-        # Assemble chunks into final file
-        async with aiofiles.open(final_path, 'wb') as final_file:
-            for chunk in chunks:
-                async with aiofiles.open(chunk.file_path, 'rb') as chunk_file:
-                    chunk_data = await chunk_file.read()
-                    await final_file.write(chunk_data)
-        
-        # Verify final checksum
-        actual_checksum = await calculate_checksum(final_path)
-        if actual_checksum != final_checksum:
-            # Delete assembled file
-            os.remove(final_path)
-            raise ValueError("Final file checksum mismatch")
-        
-        # Get file size
-        file_size = os.path.getsize(final_path)
+        await fsync_file(upload_path)
+        
+        if checksum_verified:
+            # Identical content already stored costs only a reference
+            blob_id, final_path = await FileService.store_blob(
+                db, upload_path, final_checksum, file_size
+            )
+        else:
+            # Kept under its own name until background verification adopts it
+            blob_id = None
+            year_month = now.strftime("%Y/%m")
+            final_dir = os.path.join(settings.ACTIVE_FILES_PATH, year_month)
+            await ensure_directory_exists(final_dir)
+            
+            file_ext = os.path.splitext(filename)[1]
+            final_path = os.path.join(final_dir, f"{file_id}{file_ext}")
+            await move_file(upload_path, final_path)
         
         # Create file record
         file_record = File(
@@ -165,7 +1005,10 @@ class FileService:
             filepath=final_path,
             size=file_size,
             checksum=final_checksum,
+            crc32=crc32,
+            checksum_verified=checksum_verified,
             mime_type=mime_type,
+            blob_id=blob_id,
             uploaded_by=user_id,
             upload_date=now,
             is_deleted=False,
@@ -173,15 +1016,29 @@ class FileService:
         )
         
         db.add(file_record)
-        
-        # Clean up chunks
-        upload_dir = os.path.join(settings.TEMP_FILES_PATH, str(upload_id))
-        if os.path.exists(upload_dir):
-            shutil.rmtree(upload_dir)
-        
-        # Delete chunk records
-        for chunk in chunks:
-            await db.delete(chunk)
+        db.add(FileManifest(
+            file_id=file_id,
+            chunk_size=upload_session.chunk_size,
+            chunk_checksums=chunk_checksums,
+            tree_hash=actual_tree_hash
+        ))
+        _running_digests.pop(upload_id, None)
+        
+        # Record throughput for tuning chunk sizes
+        duration = (upload_session.last_activity - upload_session.created_at).total_seconds()
+        db.add(UploadStat(
+            user_id=user_id,
+            file_size=file_size,
+            chunk_size=upload_session.chunk_size,
+            total_chunks=upload_session.total_chunks,
+            link_speed=upload_session.link_speed,
+            duration_seconds=duration,
+            throughput=int(file_size / duration) if duration > 0 else None,
+            completed_at=now
+        ))
+        
+        # The session row carries the whole chunk ledger
+        await db.delete(upload_session)
         
         await db.commit()
         await db.refresh(file_record)
@@ -191,26 +1048,245 @@ class FileService:
     @staticmethod
     async def cancel_upload(
         db: AsyncSession,
-        upload_id: uuid.UUID
+        upload_id: uuid.UUID,
+        user_id: Optional[uuid.UUID] = None
     ) -> bool:
-        """Cancel an upload and clean up chunks"""
-        # Get chunks
+        """Cancel an upload and clean up its partially written file"""
+        upload_session = await FileService.get_upload_session(db, upload_id, user_id)
+        if not upload_session:
+            raise ValueError("Upload not found")
+        await db.delete(upload_session)
+        
+        # Remove the partially written upload file
+        upload_path = FileService.get_upload_path(upload_id)
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+        _running_digests.pop(upload_id, None)
+        
+        await db.commit()
+        return True
+    
+    @staticmethod
+    async def get_manifest(
+        db: AsyncSession,
+        file_id: uuid.UUID
+    ) -> Optional[FileManifest]:
+        """Get the chunk manifest of a file"""
         result = await db.execute(
-            select(UploadChunk).where(UploadChunk.upload_id == upload_id)
+            select(FileManifest).where(FileManifest.file_id == file_id)
         )
-        chunks = result.scalars().all()
+        return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def get_signature(
+        db: AsyncSession,
+        file_id: uuid.UUID,
+        block_size: Optional[int] = None
+    ) -> bytes:
+        """
+        Compute the rsync-style block signature of a file for delta uploads
         
-        # Delete chunk records
-        for chunk in chunks:
-            await db.delete(chunk)
+        Args:
+            block_size: Bytes per block; chosen from the file size if omitted
+        
+        Returns:
+            Signature bytes (see ``app.utils.delta``)
+        """
+        file_record = await FileService.get_file(db, file_id)
+        if not file_record or file_record.is_deleted:
+            raise ValueError("File not found")
+        if not os.path.exists(file_record.filepath):
+            raise ValueError("File not found on disk")
         
-        # Clean up temp directory
-        upload_dir = os.path.join(settings.TEMP_FILES_PATH, str(upload_id))
-        if os.path.exists(upload_dir):
-            shutil.rmtree(upload_dir)
+        filepath = file_record.filepath
+        codec = await FileService.get_storage_codec(db, file_record)
+        block_size = block_size or choose_block_size(file_record.size)
         
+        # Release the connection while the file is hashed
         await db.commit()
-        return True
+        
+        return await io_pool.run(build_signature, filepath, block_size, codec)
+    
+    @staticmethod
+    async def apply_delta(
+        db: AsyncSession,
+        base_file_id: uuid.UUID,
+        delta: Union[bytes, AsyncIterator[bytes]],
+        filename: str,
+        user_id: uuid.UUID,
+        mime_type: Optional[str] = None
+    ) -> File:
+        """
+        Create a new file from an existing one and an rsync-style delta
+        
+        The delta is applied as it streams in: COPY ops are copied from the
+        base file and literal data is written as received, all hashed on
+        the way. The result must match the size and SHA-256 declared in
+        the delta header. The base file is left untouched. Disk space is
+        checked against upload reservations before writing, but is not
+        reserved for the duration of the transfer. The revision gets a chunk
+        manifest at the chunk size a fresh upload of it would use, hashed
+        as it is written.
+        
+        Returns:
+            File record of the new revision
+        """
+        base = await FileService.get_file(db, base_file_id)
+        if not base or base.is_deleted:
+            raise ValueError("File not found")
+        if not os.path.exists(base.filepath):
+            raise ValueError("File not found on disk")
+        base_path = base.filepath
+        base_size = base.size
+        base_codec = await FileService.get_storage_codec(db, base)
+        mime_type = mime_type or base.mime_type
+        
+        reader = DeltaReader(delta, settings.UPLOAD_BLOCK_SIZE)
+        block_size, target_size, target_checksum = await reader.read_header()
+        if block_size <= 0:
+            raise ValueError("Invalid delta block size")
+        if target_size > settings.MAX_UPLOAD_SIZE:
+            raise ValueError("File exceeds maximum upload size")
+        base_blocks = -(-base_size // block_size)
+        
+        await FileService.reserve_disk_space(db, target_size)
+        
+        # Release the lock and the connection while the delta streams in
+        await db.commit()
+        
+        output_path = os.path.join(settings.TEMP_FILES_PATH, f"{uuid.uuid4()}.delta")
+        try:
+            try:
+                await preallocate_file(output_path, target_size)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise InsufficientStorageError("Not enough disk space for this upload")
+                raise
+            
+            sha256 = hashlib.sha256()
+            crc32 = Crc32()
+            chunk_size = FileService.choose_chunk_size(target_size)
+            chunks = _ChunkDigests(chunk_size)
+            written = 0
+            base_reader = await io_pool.run(open_stored_file, base_path, base_codec)
+            output_fd = os.open(output_path, os.O_WRONLY)
+            try:
+                while True:
+                    op, first, count = await reader.read_op()
+                    if op == OP_END:
+                        break
+                    
+                    if op == OP_COPY:
+                        if count == 0 or first + count > base_blocks:
+                            raise ValueError("Delta references blocks outside the base file")
+                        offset = first * block_size
+                        length = min(count * block_size, base_size - offset)
+                        if written + length > target_size:
+                            raise ValueError("Delta exceeds declared size")
+                        await copy_range(base_reader, output_fd, offset, length, written, (sha256, crc32, chunks))
+                        written += length
+                    elif op == OP_LITERAL:
+                        if written + first > target_size:
+                            raise ValueError("Delta exceeds declared size")
+                        async for piece in reader.iter_literal(first, settings.UPLOAD_BLOCK_SIZE):
+                            await write_at(output_fd, piece, written, (sha256, crc32, chunks))
+                            written += len(piece)
+            finally:
+                base_reader.close()
+                os.close(output_fd)
+            
+            if not await reader.at_end():
+                raise ValueError("Unexpected data after end of delta")
+            if written != target_size:
+                raise ValueError(f"Delta size mismatch: expected {target_size} bytes, got {written}")
+            checksum = sha256.hexdigest()
+            if checksum != target_checksum:
+                raise ValueError("Delta result checksum mismatch")
+            
+            await fsync_file(output_path)
+            blob_id, final_path = await FileService.store_blob(
+                db, output_path, checksum, target_size
+            )
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        
+        file_id = uuid.uuid4()
+        chunk_checksums = chunks.finish()
+        file_record = File(
+            id=file_id,
+            filename=filename,
+            filepath=final_path,
+            size=target_size,
+            checksum=checksum,
+            crc32=crc32.value,
+            checksum_verified=True,
+            mime_type=mime_type,
+            blob_id=blob_id,
+            uploaded_by=user_id,
+            upload_date=datetime.utcnow(),
+            is_deleted=False,
+            sync_status=SyncStatus.PENDING
+        )
+        db.add(file_record)
+        db.add(FileManifest(
+            file_id=file_id,
+            chunk_size=chunk_size,
+            chunk_checksums=chunk_checksums,
+            tree_hash=compute_tree_hash(chunk_checksums)
+        ))
+        await db.commit()
+        await db.refresh(file_record)
+        
+        return file_record
+    
+    @staticmethod
+    async def verify_checksum(
+        db: AsyncSession,
+        file_id: uuid.UUID
+    ) -> bool:
+        """
+        Verify a file's stored SHA-256 against its content
+        
+        Used for uploads whose full-file checksum could not be computed
+        while their chunks arrived. A mismatch marks the file's sync status
+        as error so it is not synced with a wrong checksum.
+        
+        Returns:
+            True if the checksum matches
+        """
+        file_record = await FileService.get_file(db, file_id)
+        if not file_record or file_record.checksum_verified:
+            return True
+        
+        actual_checksum, crc32 = await calculate_checksum_and_crc32(file_record.filepath)
+        if actual_checksum == file_record.checksum:
+            file_record.checksum_verified = True
+            file_record.crc32 = crc32
+            if file_record.blob_id is None:
+                # Move the content into the blob store, deduplicating it
+                file_record.blob_id, file_record.filepath = await FileService.store_blob(
+                    db, file_record.filepath, file_record.checksum, file_record.size
+                )
+        else:
+            file_record.sync_status = SyncStatus.ERROR
+        
+        await db.commit()
+        return file_record.checksum_verified
+    
+    @staticmethod
+    async def list_unverified_files(db: AsyncSession) -> List[uuid.UUID]:
+        """IDs of files still awaiting full checksum verification"""
+        result = await db.execute(
+            select(File.id).where(
+                and_(
+                    File.checksum_verified == False,
+                    File.sync_status != SyncStatus.ERROR
+                )
+            )
+        )
+        return list(result.scalars().all())
     
     @staticmethod
     async def list_files(
@@ -294,28 +1370,33 @@ class FileService:
         if file_record.is_deleted:
             raise ValueError("File already deleted")
         
-        # Move file to deleted directory
         now = datetime.utcnow()
-        year_month = now.strftime("%Y/%m")
-        deleted_dir = os.path.join(settings.DELETED_FILES_PATH, year_month)
-        await ensure_directory_exists(deleted_dir)
-        
-        # Get filename from path
-        filename_on_disk = os.path.basename(file_record.filepath)
-        new_path = os.path.join(deleted_dir, filename_on_disk)
         
-        # Move file
-        if os.path.exists(file_record.filepath):
-            shutil.move(file_record.filepath, new_path)
+        # Blob content is shared and keeps its place; the file's reference
+        # is only dropped when the file is purged
+        if file_record.blob_id is None:
+            # Move file to deleted directory
+            year_month = now.strftime("%Y/%m")
+            deleted_dir = os.path.join(settings.DELETED_FILES_PATH, year_month)
+            await ensure_directory_exists(deleted_dir)
+            
+            # Get filename from path
+            filename_on_disk = os.path.basename(file_record.filepath)
+            new_path = os.path.join(deleted_dir, filename_on_disk)
+            
+            # Move file
+            if os.path.exists(file_record.filepath):
+                shutil.move(file_record.filepath, new_path)
+            file_record.filepath = new_path
         
         # Update record
         file_record.is_deleted = True
         file_record.deleted_at = now
         file_record.deleted_by = user_id
-        file_record.filepath = new_path
         
         await db.commit()
         await db.refresh(file_record)
+        invalidate_file(file_id)
         
         return file_record
     
@@ -332,28 +1413,30 @@ class FileService:
         if not file_record.is_deleted:
             raise ValueError("File is not deleted")
         
-        # Move file back to active directory
-        now = datetime.utcnow()
-        year_month = now.strftime("%Y/%m")
-        active_dir = os.path.join(settings.ACTIVE_FILES_PATH, year_month)
-        await ensure_directory_exists(active_dir)
-        
-        # Get filename from path
-        filename_on_disk = os.path.basename(file_record.filepath)
-        new_path = os.path.join(active_dir, filename_on_disk)
-        
-        # Move file
-        if os.path.exists(file_record.filepath):
-            shutil.move(file_record.filepath, new_path)
+        if file_record.blob_id is None:
+            # Move file back to active directory
+            now = datetime.utcnow()
+            year_month = now.strftime("%Y/%m")
+            active_dir = os.path.join(settings.ACTIVE_FILES_PATH, year_month)
+            await ensure_directory_exists(active_dir)
+            
+            # Get filename from path
+            filename_on_disk = os.path.basename(file_record.filepath)
+            new_path = os.path.join(active_dir, filename_on_disk)
+            
+            # Move file
+            if os.path.exists(file_record.filepath):
+                shutil.move(file_record.filepath, new_path)
+            file_record.filepath = new_path
         
         # Update record
         file_record.is_deleted = False
         file_record.deleted_at = None
         file_record.deleted_by = None
-        file_record.filepath = new_path
         
         await db.commit()
         await db.refresh(file_record)
+        invalidate_file(file_id)
         
         return file_record
     
@@ -373,6 +1456,7 @@ class FileService:
         
         await db.commit()
         await db.refresh(file_record)
+        invalidate_file(file_id)
         
         return file_record
     
@@ -393,29 +1477,51 @@ class FileService:
     
     @staticmethod
     async def cleanup_expired_chunks(db: AsyncSession) -> int:
-        """Clean up expired upload chunks"""
-        result = await db.execute(
-            select(UploadChunk).where(UploadChunk.expires_at < datetime.utcnow())
-        )
-        expired_chunks = result.scalars().all()
+        """
+        Clean up expired upload sessions and their partially written files
         
-        count = 0
-        upload_ids_to_clean = set()
+        Returns:
+            Number of expired uploads removed
+        """
+        now = datetime.utcnow()
         
-        for chunk in expired_chunks:
-            upload_ids_to_clean.add(chunk.upload_id)
-            await db.delete(chunk)
-            count += 1
+        # Set-based delete driven by the expires_at index
+        result = await db.execute(
+            delete(UploadSession)
+            .where(UploadSession.expires_at < now)
+            .returning(UploadSession.id)
+            .execution_options(synchronize_session=False)
+        )
+        expired_ids = set(result.scalars().all())
         
-        # Clean up temp directories
-        for upload_id in upload_ids_to_clean:
-            upload_dir = os.path.join(settings.TEMP_FILES_PATH, str(upload_id))
-            if os.path.exists(upload_dir):
-                shutil.rmtree(upload_dir)
+        result = await db.execute(select(UploadSession.id))
+        live_ids = set(result.scalars().all())
         
         await db.commit()
         
-        return count
+        for upload_id in expired_ids:
+            _running_digests.pop(upload_id, None)
+        
+        # Remove upload files without a live session: expired ones, and any
+        # orphaned by a crash that are older than the session TTL
+        if os.path.isdir(settings.TEMP_FILES_PATH):
+            cutoff = (now - UPLOAD_SESSION_TTL).timestamp()
+            for entry in os.scandir(settings.TEMP_FILES_PATH):
+                name, ext = os.path.splitext(entry.name)
+                try:
+                    upload_id = uuid.UUID(name)
+                except ValueError:
+                    continue
+                if upload_id in live_ids:
+                    continue
+                if upload_id in expired_ids or entry.stat().st_mtime < cutoff:
+                    if entry.is_dir():
+                        # Per-upload chunk directories from before uploads were preallocated
+                        shutil.rmtree(entry.path)
+                    elif ext == ".part":
+                        os.remove(entry.path)
+        
+        return len(expired_ids)
     
     @staticmethod
     async def cleanup_old_deleted_files(db: AsyncSession) -> int:
@@ -434,12 +1540,18 @@ class FileService:
         
         count = 0
         for file_record in old_files:
-            # Delete physical file
-            if os.path.exists(file_record.filepath):
+            blob_id = file_record.blob_id
+            
+            # Delete physical file unless it is shared blob content
+            if blob_id is None and os.path.exists(file_record.filepath):
                 os.remove(file_record.filepath)
             
             # Delete record
+            invalidate_file(file_record.id)
             await db.delete(file_record)
+            if blob_id is not None:
+                await db.flush()
+                await FileService.release_blob(db, blob_id)
             count += 1
         
         await db.commit()
@@ -0,0 +1,146 @@
+"""Admission control for upload and download requests"""
+import asyncio
+import math
+import uuid
+from typing import Dict
+
+from app.config import settings
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within the wait limit"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """A granted admission; release it once the request body or response is done"""
+
+    def __init__(self, controller: "AdmissionController", user_id: uuid.UUID, nbytes: int):
+        self.controller = controller
+        self.user_id = user_id
+        self.nbytes = nbytes
+        self.released = False
+
+    async def release(self) -> None:
+        """Return the slot; safe to call more than once"""
+        if not self.released:
+            self.released = True
+            await self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Per-user and global concurrency limits plus a byte budget for in-flight bodies
+
+    Requests that do not fit wait in a short queue; when the queue is full
+    or the wait times out they are rejected with ``AdmissionRejected`` so the
+    caller can answer 429 instead of piling up work. A single request larger
+    than the whole byte budget is admitted only when nothing else holds bytes.
+
+    Limits are per process: with several workers each enforces its own share.
+    """
+
+    def __init__(
+        self,
+        per_user_limit: int,
+        global_limit: int,
+        byte_budget: int,
+        max_waiters: int,
+        max_wait: float
+    ):
+        self.per_user_limit = per_user_limit
+        self.global_limit = global_limit
+        self.byte_budget = byte_budget
+        self.max_waiters = max_waiters
+        self.max_wait = max_wait
+        self._per_user: Dict[uuid.UUID, int] = {}
+        self._active = 0
+        self._bytes = 0
+        self._waiters = 0
+        self._condition = asyncio.Condition()
+
+    def _fits(self, user_id: uuid.UUID, nbytes: int) -> bool:
+        if self._per_user.get(user_id, 0) >= self.per_user_limit:
+            return False
+        if self._active >= self.global_limit:
+            return False
+        return self._bytes == 0 or self._bytes + nbytes <= self.byte_budget
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.max_wait))
+
+    async def acquire(self, user_id: uuid.UUID, nbytes: int = 0) -> AdmissionSlot:
+        """
+        Admit a request, waiting up to ``max_wait`` seconds for capacity
+
+        Args:
+            user_id: User making the request
+            nbytes: Bytes the request holds in flight (body or buffered response)
+
+        Raises:
+            AdmissionRejected: If the request was not admitted
+        """
+        async with self._condition:
+            if not self._fits(user_id, nbytes):
+                if self._waiters >= self.max_waiters:
+                    raise AdmissionRejected(self._retry_after())
+
+                self._waiters += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._fits(user_id, nbytes)),
+                        timeout=self.max_wait
+                    )
+                except asyncio.TimeoutError:
+                    raise AdmissionRejected(self._retry_after())
+                finally:
+                    self._waiters -= 1
+
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self._active += 1
+            self._bytes += nbytes
+
+        return AdmissionSlot(self, user_id, nbytes)
+
+    async def _release(self, slot: AdmissionSlot) -> None:
+        async with self._condition:
+            remaining = self._per_user[slot.user_id] - 1
+            if remaining:
+                self._per_user[slot.user_id] = remaining
+            else:
+                del self._per_user[slot.user_id]
+            self._active -= 1
+            self._bytes -= slot.nbytes
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Current usage, for monitoring"""
+        return {
+            "active": self._active,
+            "active_users": len(self._per_user),
+            "bytes_in_flight": self._bytes,
+            "waiting": self._waiters,
+            "global_limit": self.global_limit,
+            "per_user_limit": self.per_user_limit,
+            "byte_budget": self.byte_budget
+        }
+
+
+upload_admission = AdmissionController(
+    per_user_limit=settings.MAX_CONCURRENT_UPLOADS,
+    global_limit=settings.MAX_GLOBAL_UPLOADS,
+    byte_budget=settings.MAX_INFLIGHT_UPLOAD_BYTES,
+    max_waiters=settings.ADMISSION_QUEUE_LENGTH,
+    max_wait=settings.ADMISSION_WAIT_SECONDS
+)
+
+download_admission = AdmissionController(
+    per_user_limit=settings.MAX_CONCURRENT_DOWNLOADS,
+    global_limit=settings.MAX_GLOBAL_DOWNLOADS,
+    byte_budget=settings.MAX_INFLIGHT_DOWNLOAD_BYTES,
+    max_waiters=settings.ADMISSION_QUEUE_LENGTH,
+    max_wait=settings.ADMISSION_WAIT_SECONDS
+)
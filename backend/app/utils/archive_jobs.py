@@ -0,0 +1,477 @@
+"""Background archive builds with an on-disk LRU cache of finished archives"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.utils.compression import is_compressible_type, iter_stored_file
+from app.utils.io_pool import io_pool
+from app.utils.zip_stream import ZipMember, stream_zip
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".zip"
+PARTIAL_SUFFIX = ".partial"
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Headers, data descriptor and central directory entry of a ZIP64 member,
+# besides its name, which appears twice
+MEMBER_OVERHEAD = 200
+END_OVERHEAD = 200
+
+
+@dataclass
+class ArchiveSource:
+    """A file to archive, resolved while the request still holds its session"""
+    name: str
+    modified: datetime
+    path: str
+    codec: str
+    size: int
+    checksum: str
+    mime_type: Optional[str] = None
+
+
+def archive_key(sources: List[ArchiveSource]) -> str:
+    """
+    Cache key of an archive: a digest of its members' checksums, names and times
+
+    Sources are sorted first, so the same files requested in any order
+    share one archive.
+    """
+    digest = hashlib.sha256()
+    for source in sorted(sources, key=lambda s: (s.checksum, s.name, s.modified)):
+        digest.update(f"{source.checksum}\0{source.name}\0{source.modified.isoformat()}\n".encode())
+    return digest.hexdigest()
+
+
+def archive_size_bound(sources: List[ArchiveSource]) -> int:
+    """
+    Most bytes an archive of the sources can take on disk
+
+    Members found incompressible are stored, but a deflated member can
+    still grow slightly where its later blocks do not compress; a tenth of
+    a percent covers deflate's worst case.
+    """
+    return END_OVERHEAD + sum(
+        source.size + source.size // 1000 + MEMBER_OVERHEAD + 2 * len(source.name.encode())
+        for source in sources
+    )
+
+
+class ArchiveBuildRejected(Exception):
+    """Raised when a new archive build would exceed a concurrency cap"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many archives being built, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class ArchiveSpaceExhausted(Exception):
+    """Raised when a new archive build may not fit in the space left on disk"""
+
+
+class ArchiveCache:
+    """
+    Finished archives on disk, evicted least recently used beyond a size budget
+
+    The index is rebuilt from file modification times on first use, and a
+    hit touches the file, so recency survives restarts. Archives being
+    served are pinned and never evicted; the newest archive is kept even
+    when it alone exceeds the budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._pins: Dict[str, int] = {}
+        self._bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ARCHIVE_SUFFIX)
+
+    def partial_path(self, key: str) -> str:
+        """Unique path to write an archive to before ``add``"""
+        self._load()
+        return os.path.join(self.directory, f"{key}.{uuid.uuid4().hex}{PARTIAL_SUFFIX}")
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                # Left behind by a build interrupted by a restart
+                os.remove(entry.path)
+            elif entry.name.endswith(ARCHIVE_SUFFIX):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len(ARCHIVE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        self._loaded = True
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of a cached archive, marking it recently used"""
+        self._load()
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._bytes -= self._entries.pop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return path
+
+    def add(self, key: str, partial_path: str) -> str:
+        """Move a finished archive into the cache and evict to fit the budget"""
+        self._load()
+        path = self.path(key)
+        os.replace(partial_path, path)
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)
+        size = os.path.getsize(path)
+        self._entries[key] = size
+        self._bytes += size
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        # The newest archive is never evicted
+        for key in list(self._entries)[:-1]:
+            if self._bytes <= self.max_bytes:
+                break
+            if self._pins.get(key):
+                continue
+            self._bytes -= self._entries.pop(key)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def pin(self, key: str) -> None:
+        """Keep an archive from eviction while it is being sent"""
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        remaining = self._pins.get(key, 0) - 1
+        if remaining > 0:
+            self._pins[key] = remaining
+        else:
+            self._pins.pop(key, None)
+            self._evict()
+
+    def stats(self) -> dict:
+        """Usage and hit counts, for monitoring"""
+        return {
+            "archives": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class ArchiveBuild:
+    """One archive being written, shared by every job asking for the same files"""
+
+    def __init__(self, key: str, sources: List[ArchiveSource], user_id: Optional[uuid.UUID] = None):
+        self.key = key
+        self.sources = sources
+        self.user_id = user_id
+        self.total_bytes = sum(source.size for source in sources)
+        self.processed_bytes = 0
+        self.size_bound = archive_size_bound(sources)
+        self.written_bytes = 0
+        self.status = JOB_PENDING
+        self.error: Optional[str] = None
+        self.archive_size: Optional[int] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_changed(self, timeout: float) -> None:
+        """Wait until progress is made or the build finishes"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+@dataclass
+class ArchiveJob:
+    """A user's request for an archive"""
+    id: uuid.UUID
+    user_id: uuid.UUID
+    build: ArchiveBuild
+    cached: bool
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def key(self) -> str:
+        return self.build.key
+
+    @property
+    def status(self) -> str:
+        return self.build.status
+
+    @property
+    def finished(self) -> bool:
+        return self.build.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self) -> dict:
+        build = self.build
+        if build.status == JOB_COMPLETED:
+            progress = 100.0
+        elif build.total_bytes:
+            progress = round(build.processed_bytes / build.total_bytes * 100, 2)
+        else:
+            progress = 0.0
+        return {
+            "job_id": self.id,
+            "status": build.status,
+            "file_count": len(build.sources),
+            "total_bytes": build.total_bytes,
+            "processed_bytes": build.total_bytes if build.status == JOB_COMPLETED else build.processed_bytes,
+            "progress": progress,
+            "archive_size": build.archive_size,
+            "cached": self.cached,
+            "error": build.error,
+            "created_at": self.created_at,
+            "finished_at": build.finished_at
+        }
+
+
+class ArchiveJobManager:
+    """
+    Builds bulk-download archives in the background
+
+    A request only resolves its files and gets a job ID back; the archive
+    is written to the cache by a task holding no database session.
+    Concurrent jobs for the same files share a single build, and later
+    ones are completed from the cache straight away.
+
+    Jobs are kept in memory, per process, until ``job_ttl`` after they
+    finish.
+
+    Only new builds count towards the per-user and global caps; joining a
+    running build or a cache hit writes nothing. A running build reserves
+    the space its archive may still grow into until it finishes.
+    """
+
+    def __init__(
+        self,
+        cache: ArchiveCache,
+        job_ttl: timedelta,
+        per_user_limit: int,
+        global_limit: int,
+        retry_after: int
+    ):
+        self.cache = cache
+        self.job_ttl = job_ttl
+        self.per_user_limit = per_user_limit
+        self.global_limit = global_limit
+        self.retry_after = retry_after
+        self._jobs: Dict[uuid.UUID, ArchiveJob] = {}
+        self._builds: Dict[str, ArchiveBuild] = {}
+        self.rejected = 0
+
+    def reserved_bytes(self) -> int:
+        """Disk space running builds may still write to"""
+        return sum(max(build.size_bound - build.written_bytes, 0) for build in self._builds.values())
+
+    def submit(
+        self,
+        user_id: uuid.UUID,
+        sources: List[ArchiveSource],
+        space_available: Optional[int] = None
+    ) -> ArchiveJob:
+        """
+        Start (or join, or complete from cache) an archive of the given files
+
+        Args:
+            user_id: User asking for the archive
+            sources: Files to archive
+            space_available: Bytes a new build may take on disk, if limited
+
+        Raises:
+            ArchiveBuildRejected: If a new build would exceed a concurrency cap
+            ArchiveSpaceExhausted: If a new build may not fit in ``space_available``
+        """
+        self._expire()
+        sources = sorted(sources, key=lambda s: (s.name, s.checksum))
+        key = archive_key(sources)
+
+        build = self._builds.get(key)
+        cached = False
+        if build is None:
+            build = ArchiveBuild(key, sources, user_id)
+            path = self.cache.get(key)
+            if path is not None:
+                build.status = JOB_COMPLETED
+                build.archive_size = os.path.getsize(path)
+                build.finished_at = datetime.utcnow()
+                cached = True
+            else:
+                self._admit(build, space_available)
+                self._builds[key] = build
+                build.task = asyncio.create_task(self._run(build))
+
+        job = ArchiveJob(id=uuid.uuid4(), user_id=user_id, build=build, cached=cached)
+        self._jobs[job.id] = job
+        return job
+
+    def _admit(self, build: ArchiveBuild, space_available: Optional[int]) -> None:
+        user_builds = sum(1 for running in self._builds.values() if running.user_id == build.user_id)
+        if user_builds >= self.per_user_limit or len(self._builds) >= self.global_limit:
+            self.rejected += 1
+            raise ArchiveBuildRejected(self.retry_after)
+        if space_available is not None and build.size_bound + self.reserved_bytes() > space_available:
+            self.rejected += 1
+            raise ArchiveSpaceExhausted("Not enough disk space for this archive")
+
+    def get(self, job_id: uuid.UUID, user_id: uuid.UUID) -> Optional[ArchiveJob]:
+        """A job, if it exists and belongs to the user"""
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def open_archive(self, job: ArchiveJob) -> Optional[str]:
+        """
+        Path of a completed job's archive, pinned until ``release`` is called
+
+        Returns None if the job is not completed or its archive was evicted.
+        """
+        if job.status != JOB_COMPLETED:
+            return None
+        path = self.cache.get(job.key)
+        if path is not None:
+            self.cache.pin(job.key)
+        return path
+
+    def release(self, job: ArchiveJob) -> None:
+        self.cache.unpin(job.key)
+
+    def _expire(self) -> None:
+        cutoff = datetime.utcnow() - self.job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.build.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def _members(self, build: ArchiveBuild) -> List[ZipMember]:
+        def counted(read: Callable[[], AsyncIterator[bytes]]):
+            async def read_counted():
+                async for piece in read():
+                    build.processed_bytes += len(piece)
+                    yield piece
+            return read_counted
+
+        return [
+            ZipMember(
+                name=source.name,
+                modified=source.modified,
+                read=counted(partial(
+                    iter_stored_file,
+                    source.path,
+                    source.codec,
+                    block_size=settings.COMPRESSION_FRAME_SIZE
+                )),
+                compress=is_compressible_type(source.mime_type)
+            )
+            for source in build.sources
+        ]
+
+    async def _run(self, build: ArchiveBuild) -> None:
+        build.status = JOB_RUNNING
+        partial_path = None
+        try:
+            partial_path = self.cache.partial_path(build.key)
+            archive = stream_zip(
+                self._members(build),
+                level=settings.ARCHIVE_COMPRESSION_LEVEL,
+                max_ratio=settings.COMPRESSION_MAX_RATIO,
+                depth=settings.ARCHIVE_PARALLEL_BLOCKS or io_pool.max_workers
+            )
+            out = await io_pool.run(open, partial_path, "wb")
+            try:
+                reported = 0
+                async for piece in archive:
+                    await io_pool.run(out.write, piece)
+                    build.written_bytes += len(piece)
+                    # Wake subscribers about once per percent
+                    if build.processed_bytes - reported >= max(1, build.total_bytes // 100):
+                        reported = build.processed_bytes
+                        await build.notify()
+            finally:
+                await io_pool.run(out.close)
+
+            path = self.cache.add(build.key, partial_path)
+            build.archive_size = os.path.getsize(path)
+            build.status = JOB_COMPLETED
+        except Exception as e:
+            logger.error(f"Error building archive {build.key}: {e}")
+            build.status = JOB_FAILED
+            build.error = str(e)
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
+        except asyncio.CancelledError:
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        finally:
+            build.finished_at = datetime.utcnow()
+            self._builds.pop(build.key, None)
+            await build.notify()
+
+    async def shutdown(self) -> None:
+        """Cancel builds still running"""
+        tasks = [build.task for build in self._builds.values() if build.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "building": len(self._builds),
+            "reserved_bytes": self.reserved_bytes(),
+            "rejected": self.rejected,
+            "cache": self.cache.stats()
+        }
+
+
+archive_jobs = ArchiveJobManager(
+    ArchiveCache(os.path.join(settings.TEMP_FILES_PATH, "archives"), settings.ARCHIVE_CACHE_SIZE),
+    timedelta(minutes=settings.ARCHIVE_JOB_TTL_MINUTES),
+    per_user_limit=settings.MAX_CONCURRENT_ARCHIVE_BUILDS,
+    global_limit=settings.MAX_GLOBAL_ARCHIVE_BUILDS,
+    retry_after=settings.ARCHIVE_RETRY_AFTER_SECONDS
+)
@@ -0,0 +1,180 @@
+"""Fair-share bandwidth shaping for download responses"""
+import asyncio
+import itertools
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+
+# Smallest piece a shaped chunk is cut into, so low rates still send steadily
+MIN_SLICE = 16 * 1024
+
+# Period over which a transfer's measured rate is averaged
+SAMPLE_SECONDS = 1.0
+
+
+class Transfer:
+    """
+    One shaped response stream with its own token bucket
+
+    Tokens accrue at the transfer's allocated rate up to ``burst_seconds``
+    worth; sending more than is available waits off the debt. A rate of 0
+    means unlimited.
+    """
+
+    def __init__(self, transfer_id: int, user_id: uuid.UUID, label: str, burst_seconds: float):
+        self.id = transfer_id
+        self.user_id = user_id
+        self.label = label
+        self.burst_seconds = burst_seconds
+        self.rate = 0.0
+        self.bytes_sent = 0
+        self.started_at = time.monotonic()
+        # Starts with a full burst once a rate is set
+        self._tokens = float("inf")
+        self._updated = self.started_at
+        self._sample_start = self.started_at
+        self._sample_bytes = 0
+        self.measured_rate = 0.0
+
+    def set_rate(self, rate: float) -> None:
+        self._refill()
+        self.rate = rate
+        self._tokens = min(self._tokens, rate * self.burst_seconds)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate * self.burst_seconds, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def slice_size(self) -> Optional[int]:
+        """Largest piece to send at once, or None when unlimited"""
+        if not self.rate:
+            return None
+        return max(MIN_SLICE, int(self.rate * self.burst_seconds))
+
+    async def throttle(self, nbytes: int) -> None:
+        """Account for ``nbytes`` about to be sent, waiting if over the rate"""
+        now = time.monotonic()
+        self.bytes_sent += nbytes
+        self._sample_bytes += nbytes
+        if now - self._sample_start >= SAMPLE_SECONDS:
+            self.measured_rate = self._sample_bytes / (now - self._sample_start)
+            self._sample_start = now
+            self._sample_bytes = 0
+
+        if not self.rate:
+            return
+        self._refill()
+        self._tokens -= nbytes
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "user_id": str(self.user_id),
+            "label": self.label,
+            "allocated_rate": round(self.rate),
+            "measured_rate": round(self.measured_rate),
+            "bytes_sent": self.bytes_sent,
+            "seconds": round(time.monotonic() - self.started_at, 3)
+        }
+
+
+class BandwidthShaper:
+    """
+    Global and per-user download rate limits shared fairly between transfers
+
+    The global rate is split equally between users with active transfers,
+    capped at the per-user rate, and each user's share is split equally
+    between their transfers. Shares are recomputed whenever a transfer
+    starts or finishes or the limits change. Bandwidth a slow client
+    leaves unused is not lent to others.
+
+    Limits are per process: with several workers each enforces its own.
+    """
+
+    def __init__(self, global_rate: int, user_rate: int, burst_seconds: float):
+        self.global_rate = global_rate
+        self.user_rate = user_rate
+        self.burst_seconds = burst_seconds
+        self._transfers: Dict[int, Transfer] = {}
+        self._ids = itertools.count(1)
+
+    def set_limits(self, global_rate: int, user_rate: int) -> None:
+        """Change the limits (bytes per second, 0 for unlimited) of current and future transfers"""
+        self.global_rate = global_rate
+        self.user_rate = user_rate
+        self._rebalance()
+
+    def _user_share(self, users: int) -> float:
+        share = self.global_rate / users if self.global_rate else 0.0
+        if self.user_rate:
+            share = min(share, self.user_rate) if share else float(self.user_rate)
+        return share
+
+    def _rebalance(self) -> None:
+        by_user: Dict[uuid.UUID, List[Transfer]] = {}
+        for transfer in self._transfers.values():
+            by_user.setdefault(transfer.user_id, []).append(transfer)
+        if not by_user:
+            return
+        share = self._user_share(len(by_user))
+        for transfers in by_user.values():
+            for transfer in transfers:
+                transfer.set_rate(share / len(transfers))
+
+    def fair_rate(self, user_id: uuid.UUID) -> int:
+        """Rate a new transfer by the user would get now, or 0 if unlimited"""
+        users = {transfer.user_id for transfer in self._transfers.values()} | {user_id}
+        own = sum(1 for transfer in self._transfers.values() if transfer.user_id == user_id) + 1
+        return int(self._user_share(len(users)) / own)
+
+    @asynccontextmanager
+    async def transfer(self, user_id: uuid.UUID, label: str = "") -> AsyncIterator[Transfer]:
+        """Register a transfer for the duration of the block"""
+        transfer = Transfer(next(self._ids), user_id, label, self.burst_seconds)
+        self._transfers[transfer.id] = transfer
+        self._rebalance()
+        try:
+            yield transfer
+        finally:
+            del self._transfers[transfer.id]
+            self._rebalance()
+
+    async def shape(self, body: AsyncIterable[bytes], user_id: uuid.UUID, label: str = "") -> AsyncIterator[bytes]:
+        """Yield ``body`` no faster than the user's fair share"""
+        async with self.transfer(user_id, label) as transfer:
+            async for chunk in body:
+                size = transfer.slice_size
+                if size is None or len(chunk) <= size:
+                    await transfer.throttle(len(chunk))
+                    yield chunk
+                    continue
+                view = memoryview(chunk)
+                for start in range(0, len(chunk), size):
+                    piece = view[start:start + size]
+                    await transfer.throttle(len(piece))
+                    yield bytes(piece)
+
+    def stats(self) -> dict:
+        """Limits and the current rate of each transfer, for monitoring"""
+        return {
+            "global_rate": self.global_rate,
+            "user_rate": self.user_rate,
+            "active_transfers": len(self._transfers),
+            "active_users": len({transfer.user_id for transfer in self._transfers.values()}),
+            "transfers": [transfer.stats() for transfer in self._transfers.values()]
+        }
+
+
+download_bandwidth = BandwidthShaper(
+    global_rate=settings.DOWNLOAD_RATE_LIMIT,
+    user_rate=settings.DOWNLOAD_USER_RATE_LIMIT,
+    burst_seconds=settings.DOWNLOAD_BURST_SECONDS
+)
@@ -0,0 +1,69 @@
+"""Compact bitmaps for tracking received upload chunks
+
+Bit ``n`` lives in byte ``n // 8`` at position ``n % 8`` (least significant
+bit first), the same layout PostgreSQL's ``get_bit``/``set_bit`` use for
+``bytea`` values.
+"""
+from typing import List, Tuple
+
+
+def new_bitmap(size: int) -> bytes:
+    """
+    Create an all-zero bitmap
+    
+    Args:
+        size: Number of bits
+        
+    Returns:
+        Bitmap bytes
+    """
+    return bytes((size + 7) // 8)
+
+
+def is_bit_set(bitmap: bytes, n: int) -> bool:
+    """Check whether bit ``n`` is set"""
+    return bool(bitmap[n // 8] & (1 << (n % 8)))
+
+
+def set_bit(bitmap: bytes, n: int) -> bytes:
+    """
+    Set bit ``n``
+    
+    Returns:
+        New bitmap bytes
+    """
+    data = bytearray(bitmap)
+    data[n // 8] |= 1 << (n % 8)
+    return bytes(data)
+
+
+def count_bits(bitmap: bytes) -> int:
+    """Count the set bits"""
+    return sum(bin(byte).count("1") for byte in bitmap)
+
+
+def missing_ranges(bitmap: bytes, size: int) -> List[Tuple[int, int]]:
+    """
+    List the runs of unset bits
+    
+    Args:
+        bitmap: Bitmap bytes
+        size: Number of meaningful bits
+        
+    Returns:
+        Inclusive (first, last) index pairs of each run of unset bits
+    """
+    ranges = []
+    start = None
+    for n in range(size):
+        if is_bit_set(bitmap, n):
+            if start is not None:
+                ranges.append((start, n - 1))
+                start = None
+        elif start is None:
+            start = n
+    
+    if start is not None:
+        ranges.append((start, size - 1))
+    
+    return ranges
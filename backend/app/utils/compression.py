@@ -0,0 +1,288 @@
+"""Framed, seekable compression of stored file content
+
+Content is split into fixed-size frames compressed independently with
+zlib, so any byte range is read by decompressing only the frames covering
+it. A frame that does not shrink is kept as is.
+
+Layout (big-endian)::
+
+    frames   flag u8 (0 stored, 1 deflated) | length u32 | data   (frame_count times)
+    index    frame offset u64                                 (frame_count times)
+    footer   "FZF1" | frame_size u32 | original size u64 | frame_count u32
+"""
+import os
+import struct
+import time
+import zlib
+from typing import AsyncIterator, Optional, Tuple
+
+from app.utils.io_pool import io_pool
+
+CODEC_IDENTITY = "identity"
+CODEC_ZLIB = "zlib-frames"
+
+FRAMED_MAGIC = b"FZF1"
+FRAME_HEADER = struct.Struct(">BI")
+FRAME_OFFSET = struct.Struct(">Q")
+FOOTER = struct.Struct(">4sIQI")
+
+FRAME_STORED = 0
+FRAME_DEFLATED = 1
+
+# Frames spread through a file that are test-compressed before committing to it
+SAMPLE_FRAMES = 3
+
+# Media types that are compressed already, except the few raw formats below
+_COMPRESSED_MEDIA = ("image/", "video/", "audio/")
+_RAW_MEDIA = {
+    "image/bmp",
+    "image/x-ms-bmp",
+    "image/svg+xml",
+    "image/tiff",
+    "audio/wav",
+    "audio/x-wav"
+}
+_COMPRESSED_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/zstd",
+    "application/java-archive",
+    "application/epub+zip",
+    "application/pdf"
+}
+# Office Open XML and OpenDocument files are ZIP archives
+_COMPRESSED_TYPE_PREFIXES = (
+    "application/vnd.openxmlformats-officedocument.",
+    "application/vnd.oasis.opendocument."
+)
+
+
+def is_compressible_type(mime_type: Optional[str]) -> bool:
+    """False for MIME types whose content is already compressed"""
+    if not mime_type:
+        return True
+    mime_type = mime_type.split(";")[0].strip().lower()
+    if mime_type in _RAW_MEDIA:
+        return True
+    if mime_type.startswith(_COMPRESSED_MEDIA) or mime_type.startswith(_COMPRESSED_TYPE_PREFIXES):
+        return False
+    return mime_type not in _COMPRESSED_TYPES
+
+
+def _sample_ratio(fd: int, size: int, frame_size: int, level: int) -> float:
+    """Compressed/original size of a few frames spread through the file"""
+    last = max(0, size - frame_size)
+    offsets = sorted({last * i // (SAMPLE_FRAMES - 1) for i in range(SAMPLE_FRAMES)})
+    original = compressed = 0
+    for offset in offsets:
+        data = os.pread(fd, frame_size, offset)
+        original += len(data)
+        compressed += len(zlib.compress(data, level))
+    return compressed / original if original else 1.0
+
+
+def compress_file(
+    source_path: str,
+    dest_path: str,
+    frame_size: int,
+    level: int,
+    max_ratio: float
+) -> Optional[Tuple[int, float]]:
+    """
+    Write a framed, compressed copy of a file
+
+    Blocking; run it in the I/O pool. Gives up early when sampled frames
+    compress poorly, and discards the result when the whole file does.
+
+    Args:
+        source_path: File to compress
+        dest_path: Path of the framed copy
+        frame_size: Original bytes per frame
+        level: zlib compression level
+        max_ratio: Largest stored/original size worth keeping
+
+    Returns:
+        Tuple of (stored size, CPU seconds spent), or None if the file is
+        not worth compressing and ``dest_path`` was not kept
+    """
+    started = time.thread_time()
+    with open(source_path, "rb") as src:
+        size = os.fstat(src.fileno()).st_size
+        if _sample_ratio(src.fileno(), size, frame_size, level) > max_ratio:
+            return None
+
+        offsets = []
+        position = 0
+        try:
+            with open(dest_path, "wb") as dst:
+                while True:
+                    data = src.read(frame_size)
+                    if not data:
+                        break
+                    compressed = zlib.compress(data, level)
+                    if len(compressed) < len(data):
+                        flag, payload = FRAME_DEFLATED, compressed
+                    else:
+                        flag, payload = FRAME_STORED, data
+                    offsets.append(position)
+                    dst.write(FRAME_HEADER.pack(flag, len(payload)))
+                    dst.write(payload)
+                    position += FRAME_HEADER.size + len(payload)
+
+                dst.write(b"".join(FRAME_OFFSET.pack(offset) for offset in offsets))
+                dst.write(FOOTER.pack(FRAMED_MAGIC, frame_size, size, len(offsets)))
+                stored_size = dst.tell()
+                dst.flush()
+                os.fsync(dst.fileno())
+        except BaseException:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
+
+    if stored_size > size * max_ratio:
+        os.remove(dest_path)
+        return None
+    return stored_size, time.thread_time() - started
+
+
+class StoredFileReader:
+    """
+    Random access to the original content of a stored file
+
+    Not safe for concurrent calls; await each read before the next.
+    """
+
+    size: int
+
+    def pread(self, length: int, offset: int) -> bytes:
+        """Read up to ``length`` original bytes at ``offset``"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self) -> "StoredFileReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RawFileReader(StoredFileReader):
+    """Reader for content stored as is"""
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self._fd).st_size
+
+    def pread(self, length: int, offset: int) -> bytes:
+        return os.pread(self._fd, length, offset)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class FramedFileReader(StoredFileReader):
+    """Reader for framed content, decompressing one frame at a time"""
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            stored_size = os.fstat(self._fd).st_size
+            if stored_size < FOOTER.size:
+                raise ValueError("Not a framed file")
+            magic, self.frame_size, self.size, frame_count = FOOTER.unpack(
+                os.pread(self._fd, FOOTER.size, stored_size - FOOTER.size)
+            )
+            index_start = stored_size - FOOTER.size - frame_count * FRAME_OFFSET.size
+            if magic != FRAMED_MAGIC or index_start < 0:
+                raise ValueError("Not a framed file")
+            index = os.pread(self._fd, frame_count * FRAME_OFFSET.size, index_start)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+        # Each frame ends where the next one (or the index) starts
+        self._offsets = [offset for (offset,) in FRAME_OFFSET.iter_unpack(index)] + [index_start]
+        self._cached_index = -1
+        self._cached_frame = b""
+
+    def _frame(self, index: int) -> bytes:
+        if index != self._cached_index:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            raw = memoryview(os.pread(self._fd, end - start, start))
+            flag, length = FRAME_HEADER.unpack_from(raw)
+            payload = raw[FRAME_HEADER.size:FRAME_HEADER.size + length]
+            self._cached_frame = zlib.decompress(payload) if flag == FRAME_DEFLATED else bytes(payload)
+            self._cached_index = index
+        return self._cached_frame
+
+    def pread(self, length: int, offset: int) -> bytes:
+        end = min(offset + length, self.size)
+        parts = []
+        while offset < end:
+            index = offset // self.frame_size
+            start = offset - index * self.frame_size
+            piece = self._frame(index)[start:start + end - offset]
+            if not piece:
+                raise ValueError("Corrupt framed file")
+            parts.append(piece)
+            offset += len(piece)
+        return b"".join(parts)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_stored_file(path: str, codec: str = CODEC_IDENTITY) -> StoredFileReader:
+    """Open stored content for reading its original bytes"""
+    if codec == CODEC_ZLIB:
+        return FramedFileReader(path)
+    if codec == CODEC_IDENTITY:
+        return RawFileReader(path)
+    raise ValueError(f"Unknown storage codec {codec}")
+
+
+def crc32_stored_file(path: str, codec: str = CODEC_IDENTITY, block_size: int = 1024 * 1024) -> int:
+    """CRC-32 of the original bytes of stored content; blocking"""
+    crc = 0
+    with open_stored_file(path, codec) as reader:
+        for offset in range(0, reader.size, block_size):
+            crc = zlib.crc32(reader.pread(block_size, offset), crc)
+    return crc
+
+
+async def iter_stored_file(
+    path: str,
+    codec: str = CODEC_IDENTITY,
+    start: int = 0,
+    end: Optional[int] = None,
+    block_size: int = 1024 * 1024
+) -> AsyncIterator[bytes]:
+    """
+    Stream the original bytes ``[start, end)`` of stored content
+
+    Reads and decompresses in the shared I/O pool, one block per job.
+    """
+    reader = await io_pool.run(open_stored_file, path, codec)
+    try:
+        end = reader.size if end is None else min(end, reader.size)
+        offset = start
+        while offset < end:
+            data = await io_pool.run(reader.pread, min(block_size, end - offset), offset)
+            if not data:
+                break
+            offset += len(data)
+            yield data
+    finally:
+        reader.close()
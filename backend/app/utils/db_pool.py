@@ -0,0 +1,106 @@
+"""Connection pool with checkout wait and hold time statistics"""
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+# Checkouts slower than this had to wait for a connection (or open one)
+WAIT_THRESHOLD_SECONDS = 0.001
+
+
+class PoolMonitor:
+    """
+    Counters for how long requests wait for, and hold, pooled connections
+
+    Long holds show requests keeping a connection across slow work such as
+    streaming a response body; rising waits show the pool running dry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool: Optional["InstrumentedPool"] = None
+        self._checked_out_at: Dict[int, float] = {}
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._checkins = 0
+        self._hold_seconds = 0.0
+        self._max_hold_seconds = 0.0
+
+    def attach(self, pool: "InstrumentedPool") -> None:
+        # A disposed engine replaces its pool; report on the newest
+        self._pool = pool
+
+    def checked_out(self, record: ConnectionPoolEntry, waited: float) -> None:
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            if waited > WAIT_THRESHOLD_SECONDS:
+                self._waits += 1
+            self._checked_out_at[id(record)] = time.monotonic()
+
+    def timed_out(self, waited: float) -> None:
+        with self._lock:
+            self._timeouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+
+    def checked_in(self, record: ConnectionPoolEntry) -> None:
+        with self._lock:
+            checked_out_at = self._checked_out_at.pop(id(record), None)
+            if checked_out_at is None:
+                return
+            held = time.monotonic() - checked_out_at
+            self._checkins += 1
+            self._hold_seconds += held
+            self._max_hold_seconds = max(self._max_hold_seconds, held)
+
+    def stats(self) -> dict:
+        """Pool usage and checkout wait/hold times since startup, for monitoring"""
+        pool = self._pool
+        with self._lock:
+            return {
+                "size": pool.size() if pool else 0,
+                "checked_out": pool.checkedout() if pool else 0,
+                "overflow": max(pool.overflow(), 0) if pool else 0,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_seconds / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 3),
+                "avg_hold_ms": round(self._hold_seconds / self._checkins * 1000, 3) if self._checkins else 0.0,
+                "max_hold_ms": round(self._max_hold_seconds * 1000, 3)
+            }
+
+
+db_pool_monitor = PoolMonitor()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Async queue pool reporting checkouts and checkins to ``monitor``"""
+
+    monitor = db_pool_monitor
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitor.attach(self)
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started_at = time.monotonic()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.monitor.timed_out(time.monotonic() - started_at)
+            raise
+        self.monitor.checked_out(record, time.monotonic() - started_at)
+        return record
+
+    def _do_return_conn(self, record: ConnectionPoolEntry) -> None:
+        self.monitor.checked_in(record)
+        super()._do_return_conn(record)
+
@@ -0,0 +1,238 @@
+"""rsync-style block signatures and deltas for uploading new file revisions
+
+A signature describes an existing file as fixed-size blocks, each with a
+weak rolling checksum (Adler-32, as computed by ``zlib.adler32``) and a
+truncated SHA-256. A client rolls the weak checksum over its new revision,
+confirms candidate matches with the strong hash, and sends a delta made of
+references to base blocks and literal data for everything else.
+
+Signature format (big-endian)::
+
+    header   "FSG1" | block_size u32 | file_size u64 | block_count u32
+    blocks   weak u32 | strong 16 bytes          (block_count times)
+
+Delta format (big-endian)::
+
+    header   "FDL1" | block_size u32 | target_size u64 | target SHA-256 (32 bytes)
+    ops      0x01 COPY    | first_block u32 | block_count u32
+             0x02 LITERAL | length u32 | data
+             0x00 END
+
+COPY covers ``block_count`` consecutive base blocks; the last base block
+may be shorter than ``block_size``.
+"""
+import hashlib
+import math
+import struct
+import zlib
+from typing import AsyncIterator, Dict, List, Tuple, Union
+
+from app.utils.compression import CODEC_IDENTITY, open_stored_file
+from app.utils.file_utils import iter_blocks
+
+SIGNATURE_MAGIC = b"FSG1"
+DELTA_MAGIC = b"FDL1"
+STRONG_HASH_SIZE = 16
+
+SIGNATURE_HEADER = struct.Struct(">4sIQI")
+BLOCK_SIGNATURE = struct.Struct(">I16s")
+DELTA_HEADER = struct.Struct(">4sIQ32s")
+COPY_OP = struct.Struct(">II")
+LITERAL_OP = struct.Struct(">I")
+
+OP_END = 0
+OP_COPY = 1
+OP_LITERAL = 2
+
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+
+_ADLER_MOD = 65521
+
+
+def choose_block_size(file_size: int) -> int:
+    """Block size of about the square root of the file size, in whole KB"""
+    block_size = -(-math.isqrt(file_size) // 1024) * 1024
+    return max(MIN_BLOCK_SIZE, min(block_size, MAX_BLOCK_SIZE))
+
+
+def strong_hash(data) -> bytes:
+    """Truncated SHA-256 confirming a weak checksum match"""
+    return hashlib.sha256(data).digest()[:STRONG_HASH_SIZE]
+
+
+def build_signature(file_path: str, block_size: int, codec: str = CODEC_IDENTITY) -> bytes:
+    """
+    Compute the block signature of a file
+
+    Blocking; run it in the I/O pool.
+
+    Args:
+        file_path: Path to the stored file
+        block_size: Bytes per block
+        codec: Storage codec of the file (see ``app.utils.compression``)
+
+    Returns:
+        Signature in the format described in the module docstring
+    """
+    with open_stored_file(file_path, codec) as reader:
+        file_size = reader.size
+        block_count = -(-file_size // block_size)
+        parts = [SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, block_size, file_size, block_count)]
+        for start in range(0, file_size, block_size):
+            block = reader.pread(block_size, start)
+            parts.append(BLOCK_SIGNATURE.pack(zlib.adler32(block), strong_hash(block)))
+
+    return b"".join(parts)
+
+
+def parse_signature(signature: bytes) -> Tuple[int, int, List[Tuple[int, bytes]]]:
+    """
+    Parse a signature
+
+    Returns:
+        Tuple of (block_size, file_size, [(weak, strong), ...])
+    """
+    magic, block_size, file_size, block_count = SIGNATURE_HEADER.unpack_from(signature)
+    if magic != SIGNATURE_MAGIC:
+        raise ValueError("Not a file signature")
+    blocks = [
+        BLOCK_SIGNATURE.unpack_from(signature, SIGNATURE_HEADER.size + i * BLOCK_SIGNATURE.size)
+        for i in range(block_count)
+    ]
+    return block_size, file_size, blocks
+
+
+def compute_delta(signature: bytes, data: bytes) -> bytes:
+    """
+    Encode ``data`` as a delta against the file described by ``signature``
+
+    Reference encoder for the delta format; clients implement the same
+    rolling search.
+    """
+    block_size, _, blocks = parse_signature(signature)
+    by_weak: Dict[int, List[int]] = {}
+    for index, (weak, _strong) in enumerate(blocks):
+        by_weak.setdefault(weak, []).append(index)
+
+    ops: List[bytes] = []
+    copy: List[int] = []  # [first_block, block_count] of the pending COPY
+
+    def flush_copy() -> None:
+        if copy:
+            ops.append(bytes([OP_COPY]) + COPY_OP.pack(*copy))
+            copy.clear()
+
+    def emit_literal(start: int, end: int) -> None:
+        if end > start:
+            flush_copy()
+            ops.append(bytes([OP_LITERAL]) + LITERAL_OP.pack(end - start) + data[start:end])
+
+    n = len(data)
+    pos = literal_start = 0
+    a = b = None
+    while pos + block_size <= n:
+        if a is None:
+            checksum = zlib.adler32(data[pos:pos + block_size])
+            a, b = checksum & 0xFFFF, checksum >> 16
+
+        match = None
+        for index in by_weak.get((b << 16) | a, ()):
+            if blocks[index][1] == strong_hash(data[pos:pos + block_size]):
+                match = index
+                break
+
+        if match is not None:
+            emit_literal(literal_start, pos)
+            if copy and copy[0] + copy[1] == match:
+                copy[1] += 1
+            else:
+                flush_copy()
+                copy.extend([match, 1])
+            pos += block_size
+            literal_start = pos
+            a = b = None
+            continue
+
+        # Roll the window one byte forward
+        if pos + block_size < n:
+            out_byte, in_byte = data[pos], data[pos + block_size]
+            a = (a - out_byte + in_byte) % _ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+        pos += 1
+
+    emit_literal(literal_start, n)
+    flush_copy()
+
+    header = DELTA_HEADER.pack(DELTA_MAGIC, block_size, n, hashlib.sha256(data).digest())
+    return header + b"".join(ops) + bytes([OP_END])
+
+
+class DeltaReader:
+    """Incremental parser for a delta arriving as a stream of byte strings"""
+
+    def __init__(self, source: Union[bytes, AsyncIterator[bytes]], block_size: int = 1024 * 1024):
+        self._pieces = iter_blocks(source, block_size).__aiter__()
+        self._buffer = bytearray()
+
+    async def _fill(self, size: int) -> None:
+        while len(self._buffer) < size:
+            try:
+                self._buffer += await self._pieces.__anext__()
+            except StopAsyncIteration:
+                raise ValueError("Truncated delta")
+
+    async def read(self, size: int) -> bytes:
+        """Read exactly ``size`` bytes"""
+        await self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read_header(self) -> Tuple[int, int, str]:
+        """
+        Returns:
+            Tuple of (block_size, target_size, target SHA-256 hex digest)
+        """
+        magic, block_size, target_size, digest = DELTA_HEADER.unpack(await self.read(DELTA_HEADER.size))
+        if magic != DELTA_MAGIC:
+            raise ValueError("Not a delta")
+        return block_size, target_size, digest.hex()
+
+    async def read_op(self) -> Tuple[int, int, int]:
+        """
+        Returns:
+            ``(OP_COPY, first_block, block_count)``, ``(OP_LITERAL, length, 0)``
+            or ``(OP_END, 0, 0)``
+        """
+        op = (await self.read(1))[0]
+        if op == OP_COPY:
+            first_block, block_count = COPY_OP.unpack(await self.read(COPY_OP.size))
+            return op, first_block, block_count
+        if op == OP_LITERAL:
+            (length,) = LITERAL_OP.unpack(await self.read(LITERAL_OP.size))
+            return op, length, 0
+        if op == OP_END:
+            return op, 0, 0
+        raise ValueError(f"Unknown delta op {op}")
+
+    async def iter_literal(self, length: int, block_size: int) -> AsyncIterator[bytes]:
+        """Yield a literal's ``length`` bytes in pieces of at most ``block_size``"""
+        while length:
+            if not self._buffer:
+                await self._fill(1)
+            size = min(length, block_size, len(self._buffer))
+            piece = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            length -= size
+            yield piece
+
+    async def at_end(self) -> bool:
+        """True if nothing follows the END op"""
+        if self._buffer:
+            return False
+        try:
+            await self._fill(1)
+        except ValueError:
+            return True
+        return False
@@ -0,0 +1,245 @@
+"""In-memory cache of small, frequently downloaded files"""
+import heapq
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.compression import CODEC_IDENTITY, open_stored_file
+
+
+@dataclass
+class CachedFile:
+    """A file's download metadata and whole content"""
+    file_id: uuid.UUID
+    checksum: str
+    filename: str
+    mime_type: Optional[str]
+    upload_date: datetime
+    content: bytes
+    frequency: int = 0
+    priority: float = 0.0
+    cached_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+
+@dataclass
+class FileLocation:
+    """Where a file's content is stored, with the metadata sent alongside it"""
+    file_id: uuid.UUID
+    filepath: str
+    codec: str
+    filename: str
+    mime_type: Optional[str]
+    checksum: str
+    size: int
+    upload_date: datetime
+    cached_at: float = field(default_factory=time.monotonic)
+
+
+def load_file(path: str, codec: str = CODEC_IDENTITY) -> bytes:
+    """
+    Read a stored file whole for caching; blocking
+
+    Raw files are then dropped from the kernel page cache, since their
+    bytes now live in the application cache and keeping both only
+    crowds out other files.
+    """
+    with open_stored_file(path, codec) as reader:
+        content = reader.pread(reader.size, 0)
+    if codec == CODEC_IDENTITY and hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return content
+
+
+class SmallFileCache:
+    """
+    Bounded byte cache of small files with Greedy-Dual-Size-Frequency eviction
+
+    Each entry's priority is the cache's inflation value plus its hit
+    count divided by its size, so small, popular files stay while large or
+    rarely used ones go first; evicting an entry raises the inflation
+    value to its priority, letting old favourites age out.
+
+    Entries are per process. Changes made through this process invalidate
+    them at once; ``ttl`` bounds how long another worker's change can go
+    unseen.
+    """
+
+    def __init__(self, max_bytes: int, max_file_size: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.ttl = ttl
+        self._entries: Dict[uuid.UUID, CachedFile] = {}
+        self._heap: List[Tuple[float, int, uuid.UUID]] = []
+        self._sequence = itertools.count()
+        self._inflation = 0.0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def admits(self, size: int) -> bool:
+        """Whether a file of ``size`` bytes is small enough to cache"""
+        return 0 < size <= self.max_file_size and size <= self.max_bytes
+
+    def _touch(self, entry: CachedFile) -> None:
+        entry.frequency += 1
+        entry.priority = self._inflation + entry.frequency / entry.size
+        heapq.heappush(self._heap, (entry.priority, next(self._sequence), entry.file_id))
+        # Superseded heap items are skipped lazily; compact when they pile up
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._heap = [
+                (entry.priority, next(self._sequence), entry.file_id)
+                for entry in self._entries.values()
+            ]
+            heapq.heapify(self._heap)
+
+    def get(self, file_id: uuid.UUID) -> Optional[CachedFile]:
+        """A cached file, counting the lookup as a hit or a miss"""
+        entry = self._entries.get(file_id)
+        if entry is not None and time.monotonic() - entry.cached_at > self.ttl:
+            self._remove(file_id)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(entry)
+        return entry
+
+    def put(self, entry: CachedFile) -> None:
+        """Cache a file, evicting the lowest-priority entries to make room"""
+        if not self.admits(entry.size):
+            return
+        self._remove(entry.file_id)
+        while self._bytes + entry.size > self.max_bytes and self._evict():
+            pass
+        self._entries[entry.file_id] = entry
+        self._bytes += entry.size
+        self._touch(entry)
+
+    def _evict(self) -> bool:
+        while self._heap:
+            priority, _, file_id = heapq.heappop(self._heap)
+            entry = self._entries.get(file_id)
+            if entry is not None and entry.priority == priority:
+                self._inflation = priority
+                self._remove(file_id)
+                self.evictions += 1
+                return True
+        return False
+
+    def _remove(self, file_id: uuid.UUID) -> bool:
+        entry = self._entries.pop(file_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        return True
+
+    def invalidate(self, file_id: uuid.UUID) -> None:
+        """Drop a file after it is deleted, restored, renamed or its content replaced"""
+        if self._remove(file_id):
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._heap.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """Size and hit ratio, for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_file_size": self.max_file_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+class FileLocationCache:
+    """
+    LRU of file locations, so downloads can skip the file lookup
+
+    Invalidated like ``SmallFileCache``, with the same per-process caveat.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[uuid.UUID, FileLocation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_id: uuid.UUID) -> Optional[FileLocation]:
+        location = self._entries.get(file_id)
+        if location is not None and time.monotonic() - location.cached_at > self.ttl:
+            del self._entries[file_id]
+            location = None
+        if location is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(file_id)
+        return location
+
+    def put(self, location: FileLocation) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[location.file_id] = location
+        self._entries.move_to_end(location.file_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, file_id: uuid.UUID) -> None:
+        self._entries.pop(file_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+small_file_cache = SmallFileCache(
+    max_bytes=settings.SMALL_FILE_CACHE_SIZE,
+    max_file_size=settings.SMALL_FILE_CACHE_MAX_FILE_SIZE,
+    ttl=settings.SMALL_FILE_CACHE_TTL_SECONDS
+)
+
+file_locations = FileLocationCache(
+    max_entries=settings.FILE_LOCATION_CACHE_ENTRIES,
+    ttl=settings.SMALL_FILE_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_file(file_id: uuid.UUID) -> None:
+    """Drop a file from the in-memory caches after it changes"""
+    small_file_cache.invalidate(file_id)
+    file_locations.invalidate(file_id)
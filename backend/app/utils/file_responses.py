@@ -0,0 +1,153 @@
+"""Responses that send stored files without copying them through Python"""
+import os
+import uuid
+from contextlib import AsyncExitStack
+from functools import partial
+from typing import Awaitable, Callable, Mapping, Optional
+from urllib.parse import quote
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.utils.bandwidth import download_bandwidth
+from app.utils.io_pool import io_pool
+
+OFFLOAD_ACCEL_REDIRECT = "x-accel-redirect"
+OFFLOAD_SENDFILE = "x-sendfile"
+
+# ASGI extension for servers that can sendfile() a descriptor themselves
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def offload_headers(path: str) -> Optional[dict]:
+    """
+    Headers handing a stored file to the reverse proxy, per ``DOWNLOAD_OFFLOAD``
+
+    Returns:
+        The internal-redirect header, or None if offloading is off or the
+        file is not under ``ACTIVE_FILES_PATH``
+    """
+    mode = settings.DOWNLOAD_OFFLOAD.lower()
+    if not mode:
+        return None
+
+    root = os.path.realpath(settings.ACTIVE_FILES_PATH)
+    path = os.path.realpath(path)
+    if os.path.commonpath([root, path]) != root:
+        return None
+
+    if mode == OFFLOAD_ACCEL_REDIRECT:
+        relative = os.path.relpath(path, root).replace(os.sep, "/")
+        return {"X-Accel-Redirect": f"{settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip('/')}/{quote(relative)}"}
+    if mode == OFFLOAD_SENDFILE:
+        return {"X-Sendfile": path}
+    raise ValueError(f"Unknown download offload mode {settings.DOWNLOAD_OFFLOAD}")
+
+
+def _advise_sequential(fd: int, offset: int, length: int) -> None:
+    # Widen kernel readahead and start reading the first window early
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, offset, min(length, settings.HASH_WINDOW_SIZE), os.POSIX_FADV_WILLNEED)
+
+
+class SendfileResponse(Response):
+    """
+    Bytes ``[start, end)`` of a raw stored file
+
+    Uses the server's zero-copy sendfile extension when it offers one and
+    otherwise reads in the I/O pool, with sequential-access hints to the
+    kernel either way. ``Content-Length`` is set from the range. Given a
+    ``user_id``, blocks are paced by the user's share of download bandwidth.
+
+    Like ``StreamingResponse``, sending stops as soon as the client
+    disconnects, so an aborted download does not go on reading the file
+    and holding its admission slot and bandwidth share.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+        block_size: int = 1024 * 1024,
+        user_id: Optional[uuid.UUID] = None,
+        label: str = ""
+    ):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.block_size = block_size
+        self.user_id = user_id
+        self.label = label
+        super().__init__(
+            status_code=status_code,
+            headers={**(headers or {}), "Content-Length": str(end - start)},
+            media_type=media_type,
+            background=background
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with anyio.create_task_group() as task_group:
+
+            async def wrap(func: Callable[[], Awaitable[None]]) -> None:
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(wrap, partial(self._send_file, scope, send))
+            await wrap(partial(self._listen_for_disconnect, receive))
+
+        if self.background is not None:
+            await self.background()
+
+    async def _listen_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def _send_file(self, scope: Scope, send: Send) -> None:
+        async with AsyncExitStack() as stack:
+            file = await io_pool.run(open, self.path, "rb", 0)
+            stack.callback(file.close)
+            transfer = None
+            if self.user_id is not None:
+                transfer = await stack.enter_async_context(download_bandwidth.transfer(self.user_id, self.label))
+
+            fd = file.fileno()
+            await io_pool.run(_advise_sequential, fd, self.start, self.end - self.start)
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+            zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+            if self.start == self.end:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            offset = self.start
+            while offset < self.end:
+                length = min(self.block_size, self.end - offset)
+                if transfer is not None:
+                    length = min(length, transfer.slice_size or length)
+                    await transfer.throttle(length)
+                if zerocopy:
+                    offset += length
+                    await send({
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": offset - length,
+                        "count": length,
+                        "more_body": offset < self.end
+                    })
+                    continue
+                data = await io_pool.run(os.pread, fd, length, offset)
+                offset += len(data)
+                # A file truncated underneath us ends the body early
+                more_body = bool(data) and offset < self.end
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                if not more_body:
+                    break
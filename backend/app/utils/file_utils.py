@@ -1,14 +1,55 @@
 """File utilities for checksums and file operations"""
+import errno
 import hashlib
+import mmap
 import os
-import aiofiles
-from typing import BinaryIO
+import shutil
+import uuid
+import zlib
+from typing import AsyncIterator, BinaryIO, List, Sequence, Tuple, Union
+
+from app.config import settings
+from app.utils.io_pool import io_pool
+
+
+class Crc32:
+    """CRC-32 with a hashlib-style ``update``, for use alongside SHA-256 hashers"""
+    
+    def __init__(self, value: int = 0):
+        self.value = value
+    
+    def update(self, data) -> None:
+        self.value = zlib.crc32(data, self.value)
+    
+    def copy(self) -> "Crc32":
+        return Crc32(self.value)
+
+
+def _hash_file(file_path: str, window_size: int, hashers: Sequence) -> None:
+    """Feed a file to hashers through a memory map, one window at a time"""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, size, window_size):
+                    window = view[start:start + window_size]
+                    for hasher in hashers:
+                        hasher.update(window)
+                    window.release()
 
 
 async def calculate_checksum(file_path: str) -> str:
     """
     Calculate SHA-256 checksum of a file
     
+    Runs in the shared I/O pool, hashing ``HASH_WINDOW_SIZE`` windows of a
+    memory map so large files cost one thread hop and no read copies.
+    
     Args:
         file_path: Path to the file
         
@@ -16,17 +57,23 @@ async def calculate_checksum(file_path: str) -> str:
         Hexadecimal checksum string
     """
     sha256 = hashlib.sha256()
-    
-    async with aiofiles.open(file_path, 'rb') as f:
-        while True:
-            chunk = await f.read(8192)
-            if not chunk:
-                break
-            sha256.update(chunk)
-    
+    await io_pool.run(_hash_file, file_path, settings.HASH_WINDOW_SIZE, (sha256,))
     return sha256.hexdigest()
 
 
+async def calculate_checksum_and_crc32(file_path: str) -> Tuple[str, int]:
+    """
+    Calculate the SHA-256 and CRC-32 of a file in one pass
+    
+    Returns:
+        Tuple of (hexadecimal SHA-256, CRC-32)
+    """
+    sha256 = hashlib.sha256()
+    crc32 = Crc32()
+    await io_pool.run(_hash_file, file_path, settings.HASH_WINDOW_SIZE, (sha256, crc32))
+    return sha256.hexdigest(), crc32.value
+
+
 async def calculate_checksum_from_stream(stream: BinaryIO, chunk_size: int = 8192) -> str:
     """
     Calculate SHA-256 checksum from a stream
@@ -49,6 +96,76 @@ async def calculate_checksum_from_stream(stream: BinaryIO, chunk_size: int = 819
     return sha256.hexdigest()
 
 
+def compute_tree_hash(chunk_checksums: List[str]) -> str:
+    """
+    Calculate the tree hash of an ordered list of chunk checksums
+    
+    The leaves are the raw SHA-256 digests of the chunks. Each level pairs
+    neighbours and hashes ``0x01 || left || right``; an unpaired node is
+    promoted to the next level unchanged. The root of a single chunk is
+    its own digest.
+    
+    Args:
+        chunk_checksums: Hexadecimal SHA-256 digests in chunk order
+        
+    Returns:
+        Hexadecimal root digest
+    """
+    if not chunk_checksums:
+        return hashlib.sha256(b"").hexdigest()
+    
+    level = [bytes.fromhex(checksum) for checksum in chunk_checksums]
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            next_level.append(hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest())
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    
+    return level[0].hex()
+
+
+async def iter_blocks(
+    source: Union[bytes, bytearray, memoryview, object],
+    block_size: int
+) -> AsyncIterator[bytes]:
+    """
+    Iterate over a chunk body in bounded blocks
+    
+    Args:
+        source: Raw bytes, an object with an async ``read(size)`` method
+            (e.g. ``UploadFile``) or an async iterable of byte strings
+        block_size: Maximum number of bytes held per block
+        
+    Yields:
+        Blocks of at most ``block_size`` bytes; small pieces from an async
+        iterable (e.g. ``Request.stream()``) are coalesced into full blocks
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), block_size):
+            yield bytes(view[start:start + block_size])
+        return
+    
+    if hasattr(source, "read"):
+        while True:
+            block = await source.read(block_size)
+            if not block:
+                break
+            yield block
+        return
+    
+    buffer = bytearray()
+    async for piece in source:
+        buffer += piece
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
+
+
 def get_file_extension(filename: str) -> str:
     """Get file extension from filename"""
     return os.path.splitext(filename)[1].lower()
@@ -81,3 +198,190 @@ async def ensure_directory_exists(directory: str) -> None:
         directory: Directory path
     """
     os.makedirs(directory, exist_ok=True)
+
+
+async def preallocate_file(path: str, size: int) -> bool:
+    """
+    Create a file and reserve ``size`` bytes for it
+    
+    Uses ``posix_fallocate`` where the platform and filesystem support it,
+    otherwise falls back to a sparse ``ftruncate``.
+    
+    Args:
+        path: Path of the file to create
+        size: Final size of the file in bytes
+        
+    Returns:
+        True if the blocks were physically allocated, False if sparse
+    """
+    def _preallocate() -> bool:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+        try:
+            if size > 0 and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                    return True
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                        raise
+            os.ftruncate(fd, size)
+            return False
+        finally:
+            os.close(fd)
+    
+    return await io_pool.run(_preallocate)
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int, hashers: Sequence = ()) -> None:
+    """Write all of ``data`` at ``offset``, retrying short writes"""
+    for hasher in hashers:
+        hasher.update(data)
+    
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def write_at(fd: int, data: bytes, offset: int, hashers: Sequence = ()) -> None:
+    """
+    Positional write that does not move the file offset
+    
+    Runs in the shared I/O pool. Any ``hashers`` are updated with ``data``
+    in the same job, so hashing never blocks the event loop.
+    
+    Args:
+        fd: Open file descriptor
+        data: Bytes to write
+        offset: Absolute position in the file
+        hashers: hashlib objects to feed with ``data``
+    """
+    await io_pool.run(_pwrite_all, fd, data, offset, hashers)
+
+
+def _copy_window(src, dst_fd: int, src_offset: int, length: int, dst_offset: int, hashers: Sequence) -> None:
+    """Copy one window between files with positional I/O, feeding hashers"""
+    data = src.pread(length, src_offset)
+    if len(data) != length:
+        raise ValueError("Source file is shorter than expected")
+    _pwrite_all(dst_fd, data, dst_offset, hashers)
+
+
+async def copy_range(
+    src,
+    dst_fd: int,
+    src_offset: int,
+    length: int,
+    dst_offset: int,
+    hashers: Sequence = ()
+) -> None:
+    """
+    Copy a byte range into an open file in the shared I/O pool
+    
+    Copies ``UPLOAD_BLOCK_SIZE`` windows, one pool job each, updating
+    ``hashers`` with the copied data.
+    
+    Args:
+        src: Stored file reader (``app.utils.compression``) to read from
+        dst_fd: File descriptor to write to
+        src_offset: Position of the range in the source
+        length: Bytes to copy
+        dst_offset: Position to write the range at
+        hashers: hashlib objects to feed with the copied data
+    """
+    window = settings.UPLOAD_BLOCK_SIZE
+    for start in range(0, length, window):
+        size = min(window, length - start)
+        await io_pool.run(_copy_window, src, dst_fd, src_offset + start, size, dst_offset + start, hashers)
+
+
+async def fsync_file(path: str) -> None:
+    """
+    Flush a file's data to stable storage
+    
+    Args:
+        path: Path to the file
+    """
+    def _fsync() -> None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    await io_pool.run(_fsync)
+
+
+async def move_file(src: str, dst: str) -> None:
+    """
+    Move a file, atomically when both paths are on the same filesystem
+    
+    Across filesystems the file is copied to a uniquely named temporary
+    file next to ``dst`` in the I/O pool, flushed, and renamed into place,
+    so ``dst`` only ever appears complete; ``src`` is removed afterwards.
+    
+    Args:
+        src: Source path
+        dst: Destination path
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        await io_pool.run(_copy_synced, src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    os.remove(src)
+
+
+def _copy_synced(src: str, dst: str) -> None:
+    """Copy a file and flush the copy to stable storage; blocking"""
+    shutil.copyfile(src, dst)
+    fd = os.open(dst, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+async def link_file(src: str, dst: str) -> bool:
+    """
+    Hard-link a file to a new path without ever replacing an existing one
+    
+    Falls back to copying through a uniquely named temporary file next to
+    ``dst`` in the I/O pool when the paths are on different filesystems.
+    
+    Args:
+        src: Source path
+        dst: Destination path
+    
+    Returns:
+        False if ``dst`` already existed
+    """
+    try:
+        os.link(src, dst)
+        return True
+    except FileExistsError:
+        return False
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        await io_pool.run(_copy_synced, src, tmp_path)
+        os.link(tmp_path, dst)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
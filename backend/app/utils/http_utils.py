@@ -0,0 +1,207 @@
+"""HTTP helpers for file download responses"""
+import hashlib
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+# Ranges honoured in one request; more are served as a single covering range
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when no requested range overlaps the representation"""
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    """Content-Disposition header value, RFC 5987-encoded for non-ASCII names"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def http_date(value: datetime) -> str:
+    """Format a datetime, naive meaning UTC, as an HTTP date"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.replace(microsecond=0), usegmt=True)
+
+
+def weak_etag(body: bytes) -> str:
+    """Weak entity tag of a serialized representation"""
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an ``If-None-Match`` list names ``etag``, by weak comparison"""
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> bool:
+    """
+    Whether a conditional GET or HEAD can be answered with 304 Not Modified
+
+    ``If-None-Match`` takes precedence; ``If-Modified-Since`` is only
+    consulted without it, and only when the last-modified time is known.
+    """
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        date = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return last_modified.replace(microsecond=0, tzinfo=None) <= date.replace(tzinfo=None)
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a ``Range: bytes=...`` header against a representation's size
+
+    Overlapping and adjacent ranges are merged; more than ``MAX_RANGES``
+    collapse into one range covering them all.
+
+    Returns:
+        Sorted list of inclusive ``(first, last)`` byte positions, or None
+        if the header is malformed or not in bytes and must be ignored
+
+    Raises:
+        RangeNotSatisfiable: If no range overlaps the representation
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+            return None
+        if first == "":
+            # Suffix range: the last N bytes
+            if last == "":
+                return None
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(first)
+        end = size - 1 if last == "" else int(last)
+        if last != "" and end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return [(merged[0][0], max(end for _, end in merged))]
+    return merged
+
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: datetime) -> bool:
+    """
+    Whether a Range request's ``If-Range`` precondition allows a partial response
+
+    An entity tag must match ``etag`` exactly (strong comparison); a date
+    must equal the last-modified time. Absent ``If-Range`` always matches.
+    """
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag and not etag.startswith("W/")
+    try:
+        date = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    return date.replace(tzinfo=None) == last_modified.replace(microsecond=0, tzinfo=None)
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    """Content-Range header value for inclusive positions"""
+    return f"bytes {start}-{end}/{size}"
+
+
+class MultipartByteranges:
+    """
+    A ``multipart/byteranges`` body streamed from a range reader
+
+    Args:
+        ranges: Inclusive ``(first, last)`` positions
+        size: Size of the full representation
+        content_type: Content type of each part
+        read_range: Returns an async iterator over bytes ``[start, end)``
+    """
+
+    def __init__(
+        self,
+        ranges: List[Tuple[int, int]],
+        size: int,
+        content_type: str,
+        read_range: Callable[[int, int], AsyncIterator[bytes]]
+    ):
+        self.ranges = ranges
+        self.boundary = secrets.token_hex(16)
+        self.read_range = read_range
+        self._headers = [
+            (
+                f"--{self.boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: {content_range(start, end, size)}\r\n\r\n"
+            ).encode()
+            for start, end in ranges
+        ]
+        self._closing = f"--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/byteranges; boundary={self.boundary}"
+
+    @property
+    def content_length(self) -> int:
+        body = sum(end - start + 1 for start, end in self.ranges)
+        framing = sum(len(header) + 2 for header in self._headers)
+        return body + framing + len(self._closing)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for header, (start, end) in zip(self._headers, self.ranges):
+            yield header
+            async for piece in self.read_range(start, end + 1):
+                yield piece
+            yield b"\r\n"
+        yield self._closing
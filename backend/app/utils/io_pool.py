@@ -0,0 +1,92 @@
+"""Shared worker pool for hashing and blocking file I/O"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+
+class IOPool:
+    """
+    Bounded thread pool for CPU-heavy hashing and blocking file I/O
+
+    Keeps this work off the event loop without competing for the default
+    executor. hashlib and file syscalls release the GIL, so jobs run in
+    parallel across cores. Tracks queue depth and wait/busy time so
+    saturation is visible.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._max_queue_depth = 0
+        self._wait_seconds = 0.0
+        self._busy_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="io-pool"
+                )
+            return self._executor
+
+    def _job(self, queued_at: float, fn: Callable[..., Any], args: tuple) -> Any:
+        started_at = time.monotonic()
+        with self._lock:
+            self._started += 1
+            self._wait_seconds += started_at - queued_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._completed += 1
+                self._busy_seconds += time.monotonic() - started_at
+
+    def _on_done(self, future: Future) -> None:
+        # A job cancelled while still queued never ran
+        if future.cancelled():
+            with self._lock:
+                self._started += 1
+                self._completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` in the pool and await its result"""
+        executor = self._get_executor()
+        with self._lock:
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._submitted - self._started)
+        future = executor.submit(self._job, time.monotonic(), fn, args)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """Queue depth and utilisation since startup, for monitoring"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self._submitted - self._started,
+                "active": self._started - self._completed,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "avg_wait_ms": round(self._wait_seconds / self._completed * 1000, 3) if self._completed else 0.0,
+                "busy_seconds": round(self._busy_seconds, 3)
+            }
+
+    def shutdown(self) -> None:
+        """Stop the worker threads after running queued jobs"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+io_pool = IOPool(settings.IO_POOL_WORKERS or min(32, (os.cpu_count() or 1) + 4))
@@ -1,6 +1,10 @@
 """Security utilities for password hashing and token generation"""
 import secrets
 import base64
+import hashlib
+import hmac
+import time
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from passlib.context import CryptContext
@@ -50,6 +54,51 @@ def verify_token(token: str) -> Optional[dict]:
         return None
 
 
+def _download_signature(
+    file_id: uuid.UUID,
+    checksum: str,
+    user_id: uuid.UUID,
+    expires: int,
+    ip: Optional[str]
+) -> str:
+    message = f"download\n{file_id}\n{checksum}\n{user_id}\n{expires}\n{ip or ''}".encode()
+    digest = hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def sign_download(
+    file_id: uuid.UUID,
+    checksum: str,
+    user_id: uuid.UUID,
+    expires: int,
+    ip: Optional[str] = None
+) -> str:
+    """
+    HMAC signature for a download URL
+    
+    Covers the file's content by its checksum, the user the download is
+    made on behalf of, the Unix expiry time and, if given, the only client
+    IP allowed to use it.
+    """
+    return _download_signature(file_id, checksum, user_id, expires, ip)
+
+
+def verify_download_signature(
+    signature: str,
+    file_id: uuid.UUID,
+    checksum: str,
+    user_id: uuid.UUID,
+    expires: int,
+    ip: Optional[str],
+    client_ip: str
+) -> bool:
+    """Verify a download URL's signature, expiry and IP binding"""
+    if expires < time.time() or (ip and ip != client_ip):
+        return False
+    expected = _download_signature(file_id, checksum, user_id, expires, ip)
+    return hmac.compare_digest(expected, signature)
+
+
 def validate_password_strength(password: str) -> tuple[bool, str]:
     """
     Validate password strength according to requirements
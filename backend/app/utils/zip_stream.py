@@ -0,0 +1,336 @@
+"""Streaming ZIP64 archive writer
+
+Produces an archive as a sequence of byte strings without seeking: each
+member's local header is sent before its data, and its CRC-32 and sizes
+follow in a ZIP64 data descriptor. Memory use is bounded by the blocks in
+flight, whatever the size of the archive.
+
+Members are deflated in parallel the way pigz does it: every read block is
+compressed independently in the I/O pool, primed with the last 32 KB of
+the block before it, and ends on a sync flush so the outputs concatenate
+into a single deflate stream.
+
+``StoredZipLayout`` is the resumable alternative: an uncompressed archive
+laid out from member sizes and CRCs known upfront, so its length is known
+before sending and any byte range maps back onto the member files.
+"""
+import asyncio
+import bisect
+import struct
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Callable, Deque, Iterable, List, Optional, Tuple, Union
+
+from app.utils.io_pool import io_pool
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DATA_DESCRIPTOR = struct.Struct("<IIQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+EXTRA_HEADER = struct.Struct("<HH")
+
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+ZIP64_END_SIGNATURE = 0x06064B50
+ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+END_SIGNATURE = 0x06054B50
+ZIP64_EXTRA_ID = 0x0001
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+ZIP64_VERSION = 45
+MADE_BY_UNIX = 3 << 8
+# Sizes follow the data in a descriptor; names are UTF-8
+FLAGS = 0x0008 | 0x0800
+# Sizes in the headers; names are UTF-8
+STORED_FLAGS = 0x0800
+FILE_ATTRIBUTES = 0o100644 << 16
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+# Deflate window: the history a block is primed with
+DEFLATE_WINDOW = 32 * 1024
+# Empty final fixed-Huffman block closing a stream of sync-flushed blocks
+DEFLATE_END = b"\x03\x00"
+
+
+@dataclass
+class ZipMember:
+    """A file to add to a streamed archive"""
+    name: str
+    modified: datetime
+    read: Callable[[], AsyncIterator[bytes]]  # Yields the member's content
+    compress: bool = True
+
+
+def dos_datetime(value: datetime) -> Tuple[int, int]:
+    """MS-DOS (time, date) fields of a timestamp, clamped to the 1980 epoch"""
+    if value.year < 1980:
+        value = datetime(1980, 1, 1)
+    dos_time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    dos_date = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    return dos_time, dos_date
+
+
+def zip64_extra(*values: int) -> bytes:
+    """ZIP64 extended information extra field holding 8-byte values"""
+    return EXTRA_HEADER.pack(ZIP64_EXTRA_ID, 8 * len(values)) + b"".join(
+        struct.pack("<Q", value) for value in values
+    )
+
+
+def deflate_block(data: bytes, history: bytes, level: int) -> bytes:
+    """
+    Raw-deflate one block so that consecutive outputs concatenate
+
+    The block is primed with ``history`` (the end of the previous block)
+    and ends on a sync flush without the final-block bit.
+    """
+    if history:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=history)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+async def _parallel_deflate(
+    first: bytes,
+    first_deflated: bytes,
+    blocks: AsyncIterator[bytes],
+    level: int,
+    depth: int
+) -> AsyncIterator[Tuple[bytes, bytes]]:
+    """
+    Deflate blocks in the I/O pool, up to ``depth`` at a time
+
+    Yields ``(block, deflated)`` pairs in input order.
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    done.set_result(first_deflated)
+    pending: Deque[Tuple[bytes, asyncio.Future]] = deque([(first, done)])
+    previous = first
+    try:
+        async for data in blocks:
+            job = asyncio.ensure_future(io_pool.run(deflate_block, data, previous[-DEFLATE_WINDOW:], level))
+            pending.append((data, job))
+            previous = data
+            while pending and (len(pending) > depth or pending[0][1].done()):
+                data, job = pending.popleft()
+                yield data, await job
+        while pending:
+            data, job = pending.popleft()
+            yield data, await job
+    finally:
+        for _, job in pending:
+            job.cancel()
+
+
+@dataclass
+class _CentralEntry:
+    name: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+    flags: int = FLAGS
+
+
+def local_header(name: bytes, method: int, dos_time: int, dos_date: int) -> bytes:
+    """Local file header for a member whose CRC and sizes follow in a data descriptor"""
+    return LOCAL_HEADER.pack(
+        LOCAL_HEADER_SIGNATURE, ZIP64_VERSION, FLAGS, method, dos_time, dos_date,
+        0, ZIP32_LIMIT, ZIP32_LIMIT, len(name), 20
+    ) + name + zip64_extra(0, 0)
+
+
+def central_directory(entries: List["_CentralEntry"], offset: int) -> bytes:
+    """Central directory and end records for members, starting at ``offset``"""
+    records = []
+    for entry in entries:
+        # Values that do not fit move to the ZIP64 extra field, in this order
+        large = [
+            value for value in (entry.size, entry.compressed_size, entry.offset)
+            if value >= ZIP32_LIMIT
+        ]
+        extra = zip64_extra(*large) if large else b""
+        records.append(CENTRAL_HEADER.pack(
+            CENTRAL_HEADER_SIGNATURE, MADE_BY_UNIX | ZIP64_VERSION, ZIP64_VERSION, entry.flags,
+            entry.method, entry.dos_time, entry.dos_date, entry.crc,
+            min(entry.compressed_size, ZIP32_LIMIT), min(entry.size, ZIP32_LIMIT),
+            len(entry.name), len(extra), 0, 0, 0, FILE_ATTRIBUTES, min(entry.offset, ZIP32_LIMIT)
+        ) + entry.name + extra)
+
+    directory = b"".join(records)
+    count = len(entries)
+    end = b""
+    if count >= ZIP32_MAX_ENTRIES or len(directory) >= ZIP32_LIMIT or offset >= ZIP32_LIMIT:
+        zip64_end_offset = offset + len(directory)
+        end += ZIP64_END.pack(
+            ZIP64_END_SIGNATURE, ZIP64_END.size - 12, MADE_BY_UNIX | ZIP64_VERSION, ZIP64_VERSION,
+            0, 0, count, count, len(directory), offset
+        )
+        end += ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1)
+    end += END_OF_CENTRAL_DIRECTORY.pack(
+        END_SIGNATURE, 0, 0,
+        min(count, ZIP32_MAX_ENTRIES), min(count, ZIP32_MAX_ENTRIES),
+        min(len(directory), ZIP32_LIMIT), min(offset, ZIP32_LIMIT), 0
+    )
+    return directory + end
+
+
+async def stream_zip(
+    members: Iterable[ZipMember],
+    level: Optional[int] = None,
+    max_ratio: float = 0.9,
+    depth: int = 4
+) -> AsyncIterator[bytes]:
+    """
+    Stream a ZIP64 archive of ``members``
+
+    A member marked for compression is deflated only if its first block
+    shrinks to ``max_ratio`` of its size or less; otherwise it is stored.
+    Deflate and CRC-32 run in the shared I/O pool.
+
+    Args:
+        members: Files to archive, read in order
+        level: zlib level for deflated members (zlib default if None)
+        max_ratio: Largest sampled deflated/original size worth deflating
+        depth: Blocks per member compressed in parallel
+    """
+    level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+    offset = 0
+    entries: List[_CentralEntry] = []
+
+    for member in members:
+        name = member.name.encode("utf-8")
+        blocks = member.read().__aiter__()
+        first = await anext(blocks, b"")
+
+        # The first block decides between deflate and store
+        compress = member.compress and bool(first)
+        if compress:
+            first_deflated = await io_pool.run(deflate_block, first, b"", level)
+            compress = len(first_deflated) <= len(first) * max_ratio
+
+        method = METHOD_DEFLATED if compress else METHOD_STORED
+        dos_time, dos_date = dos_datetime(member.modified)
+        header = local_header(name, method, dos_time, dos_date)
+        entry = _CentralEntry(name, method, dos_time, dos_date, 0, 0, 0, offset)
+        offset += len(header)
+        yield header
+
+        if compress:
+            async for data, deflated in _parallel_deflate(first, first_deflated, blocks, level, depth):
+                entry.size += len(data)
+                entry.crc = await io_pool.run(zlib.crc32, data, entry.crc)
+                entry.compressed_size += len(deflated)
+                offset += len(deflated)
+                yield deflated
+            entry.compressed_size += len(DEFLATE_END)
+            offset += len(DEFLATE_END)
+            yield DEFLATE_END
+        else:
+            data = first
+            while data:
+                entry.size += len(data)
+                entry.crc = await io_pool.run(zlib.crc32, data, entry.crc)
+                entry.compressed_size += len(data)
+                offset += len(data)
+                yield data
+                data = await anext(blocks, b"")
+
+        descriptor = DATA_DESCRIPTOR.pack(
+            DATA_DESCRIPTOR_SIGNATURE, entry.crc, entry.compressed_size, entry.size
+        )
+        offset += len(descriptor)
+        yield descriptor
+        entries.append(entry)
+
+    yield central_directory(entries, offset)
+
+
+@dataclass
+class StoredMember:
+    """A file of known size and CRC-32 for a precomputed uncompressed archive"""
+    name: str
+    modified: datetime
+    size: int
+    crc32: int
+    read_range: Callable[[int, int], AsyncIterator[bytes]]  # Yields member bytes [start, end)
+
+
+def stored_local_header(name: bytes, dos_time: int, dos_date: int, crc: int, size: int) -> bytes:
+    """Local file header of an uncompressed member with its CRC and size upfront"""
+    if size >= ZIP32_LIMIT:
+        extra = zip64_extra(size, size)
+        header_size = ZIP32_LIMIT
+    else:
+        extra = b""
+        header_size = size
+    return LOCAL_HEADER.pack(
+        LOCAL_HEADER_SIGNATURE, ZIP64_VERSION, STORED_FLAGS, METHOD_STORED, dos_time, dos_date,
+        crc, header_size, header_size, len(name), len(extra)
+    ) + name + extra
+
+
+class StoredZipLayout:
+    """
+    Uncompressed ZIP64 archive with every byte known before sending
+
+    The layout depends only on member names, timestamps, sizes and CRCs,
+    so identical inputs always give an identical archive: its size is
+    known upfront and a byte range is served by mapping it onto headers
+    and member files, which makes resumed and segmented downloads safe.
+    """
+
+    def __init__(self, members: Iterable[StoredMember]):
+        # (start offset, header bytes or member) in archive order
+        self._segments: List[Tuple[int, Union[bytes, StoredMember]]] = []
+        entries: List[_CentralEntry] = []
+        offset = 0
+        for member in members:
+            name = member.name.encode("utf-8")
+            dos_time, dos_date = dos_datetime(member.modified)
+            entries.append(_CentralEntry(
+                name, METHOD_STORED, dos_time, dos_date, member.crc32,
+                member.size, member.size, offset, STORED_FLAGS
+            ))
+            header = stored_local_header(name, dos_time, dos_date, member.crc32, member.size)
+            self._segments.append((offset, header))
+            offset += len(header)
+            if member.size:
+                self._segments.append((offset, member))
+                offset += member.size
+
+        directory = central_directory(entries, offset)
+        self._segments.append((offset, directory))
+        self.size = offset + len(directory)
+        self._starts = [start for start, _ in self._segments]
+
+    async def iter_range(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield archive bytes ``[start, end)``"""
+        end = self.size if end is None else min(end, self.size)
+        index = bisect.bisect_right(self._starts, start) - 1
+        while start < end:
+            segment_start, content = self._segments[index]
+            length = len(content) if isinstance(content, bytes) else content.size
+            first = start - segment_start
+            last = min(end - segment_start, length)
+            if isinstance(content, bytes):
+                yield content[first:last]
+            else:
+                async for piece in content.read_range(first, last):
+                    yield piece
+            start = segment_start + last
+            index += 1
@@ -0,0 +1,175 @@
+"""
+Tests for upload and download admission control
+
+Tests cover:
+- Per-user and global concurrency limits
+- In-flight byte budget
+- Waiting for a released slot
+- Rejection when the wait queue is full
+- Refused downloads neither audited nor read into the cache
+- Downloads charged for the bytes they buffer
+"""
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.audit import AuditLog
+from app.models.file import File
+from app.utils.admission import AdmissionController, AdmissionRejected, download_admission
+from app.utils.file_cache import small_file_cache
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_controller(**overrides) -> AdmissionController:
+    limits = dict(
+        per_user_limit=2,
+        global_limit=3,
+        byte_budget=100,
+        max_waiters=1,
+        max_wait=0.05
+    )
+    limits.update(overrides)
+    return AdmissionController(**limits)
+
+
+class TestAdmissionController:
+    """Test admission control"""
+
+    async def test_per_user_limit(self):
+        """Test a user cannot exceed their own concurrency limit"""
+        controller = make_controller()
+        user_id = uuid.uuid4()
+
+        await controller.acquire(user_id)
+        await controller.acquire(user_id)
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await controller.acquire(user_id)
+        assert exc_info.value.retry_after >= 1
+
+        # Other users are still admitted
+        await controller.acquire(uuid.uuid4())
+
+    async def test_global_limit(self):
+        """Test the global concurrency limit spans users"""
+        controller = make_controller(max_waiters=0)
+
+        for _ in range(3):
+            await controller.acquire(uuid.uuid4())
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(uuid.uuid4())
+
+    async def test_byte_budget(self):
+        """Test in-flight bytes are limited, but one oversized request may run alone"""
+        controller = make_controller(max_waiters=0)
+
+        slot = await controller.acquire(uuid.uuid4(), 80)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(uuid.uuid4(), 30)
+        await controller.acquire(uuid.uuid4(), 20)
+
+        await slot.release()
+        assert controller.stats()["bytes_in_flight"] == 20
+
+        # Only admitted once nothing else holds bytes
+        empty = make_controller(max_waiters=0)
+        await empty.acquire(uuid.uuid4(), 500)
+
+    async def test_waits_for_released_slot(self):
+        """Test a queued request is admitted when a slot is released"""
+        controller = make_controller(max_wait=1.0)
+        user_id = uuid.uuid4()
+
+        first = await controller.acquire(user_id)
+        await controller.acquire(user_id)
+
+        waiter = asyncio.create_task(controller.acquire(user_id))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["waiting"] == 1
+
+        # The queue holds a single waiter
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(user_id)
+
+        await first.release()
+        await first.release()  # Releasing twice is a no-op
+        slot = await waiter
+        assert slot.user_id == user_id
+        assert controller.stats()["active"] == 2
+
+
+class TestDownloadAdmission:
+    """Test downloads are admitted before they are audited or read"""
+
+    async def test_refused_download(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        db_session: AsyncSession,
+        test_file: File,
+        monkeypatch
+    ):
+        """Test a 429 leaves no audit record and no cached content"""
+        small_file_cache.clear()
+        file_id = test_file.id
+        url = f"/api/v1/files/{file_id}/download"
+        downloads = select(func.count(AuditLog.id)).where(AuditLog.action == "download")
+        monkeypatch.setattr(download_admission, "per_user_limit", 0)
+        monkeypatch.setattr(download_admission, "max_wait", 0.01)
+
+        response = await client.get(url, headers=auth_headers)
+        assert response.status_code == 429
+        assert "retry-after" in response.headers
+        assert (await db_session.execute(downloads)).scalar() == 0
+        assert small_file_cache.get(file_id) is None
+
+        response = await client.post(
+            "/api/v1/files/download/bulk",
+            json={"file_ids": [str(file_id)]},
+            headers=auth_headers
+        )
+        assert response.status_code == 429
+        bulk = select(func.count(AuditLog.id)).where(AuditLog.action == "bulk_download")
+        assert (await db_session.execute(bulk)).scalar() == 0
+
+        monkeypatch.setattr(download_admission, "per_user_limit", 5)
+        response = await client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        assert (await db_session.execute(downloads)).scalar() == 1
+        assert small_file_cache.get(file_id) is not None
+
+    async def test_download_bytes_charged(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        monkeypatch
+    ):
+        """Test cache loads charge the file size, cache hits nothing and streamed reads one frame"""
+        small_file_cache.clear()
+        url = f"/api/v1/files/{test_file.id}/download"
+        size = test_file.size
+        acquire = download_admission.acquire
+        charged = []
+
+        async def recording(user_id, nbytes=0):
+            charged.append(nbytes)
+            return await acquire(user_id, nbytes)
+
+        monkeypatch.setattr(download_admission, "acquire", recording)
+
+        await client.get(url, headers=auth_headers)
+        await client.get(url, headers=auth_headers)
+        small_file_cache.clear()
+        monkeypatch.setattr(small_file_cache, "max_file_size", 0)
+        monkeypatch.setattr(settings, "COMPRESSION_FRAME_SIZE", 8)
+        await client.get(url, headers={**auth_headers, "Range": "bytes=0-3,5-8"})
+
+        assert charged == [size, 0, 8]
+        assert download_admission.stats()["bytes_in_flight"] == 0
@@ -0,0 +1,290 @@
+"""
+Tests for background archive jobs and the archive cache
+
+Tests cover:
+- LRU eviction by size, pinning and recency across restarts
+- Builds shared by concurrent jobs and completed from the cache
+- Failed builds leaving no partial archive
+- Per-user and global build caps and disk space reserved by running builds
+- Submitting, polling and downloading archive jobs through the API
+- Refused builds answered with 429 and Retry-After, or 507
+"""
+import asyncio
+import io
+import os
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.models.file import File
+from app.utils.archive_jobs import (
+    JOB_COMPLETED,
+    JOB_FAILED,
+    ArchiveBuildRejected,
+    ArchiveCache,
+    ArchiveJobManager,
+    ArchiveSource,
+    ArchiveSpaceExhausted,
+    archive_jobs,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def write_archive(cache: ArchiveCache, key: str, size: int) -> str:
+    """Add an archive of ``size`` bytes to the cache"""
+    partial_path = cache.partial_path(key)
+    with open(partial_path, "wb") as f:
+        f.write(b"x" * size)
+    return cache.add(key, partial_path)
+
+
+def make_manager(directory, per_user_limit: int = 2, global_limit: int = 4) -> ArchiveJobManager:
+    return ArchiveJobManager(
+        ArchiveCache(str(directory), 10 ** 9),
+        timedelta(hours=1),
+        per_user_limit=per_user_limit,
+        global_limit=global_limit,
+        retry_after=30
+    )
+
+
+def make_source(tmp_path, name: str, data: bytes) -> ArchiveSource:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return ArchiveSource(
+        name=name,
+        modified=datetime(2026, 2, 3, 4, 5, 6),
+        path=str(path),
+        codec="identity",
+        size=len(data),
+        checksum=name + "-checksum"
+    )
+
+
+class TestArchiveCache:
+    """Test the on-disk archive cache"""
+
+    async def test_lru_eviction(self, tmp_path):
+        """Test the least recently used archives are evicted past the budget"""
+        cache = ArchiveCache(str(tmp_path / "archives"), max_bytes=250)
+        write_archive(cache, "a", 100)
+        write_archive(cache, "b", 100)
+        assert cache.get("a") is not None  # b is now least recently used
+
+        write_archive(cache, "c", 100)
+
+        assert cache.get("b") is None
+        assert not os.path.exists(cache.path("b"))
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["bytes"] == 200
+
+    async def test_pinned_archive_kept(self, tmp_path):
+        """Test an archive being served survives eviction until unpinned"""
+        cache = ArchiveCache(str(tmp_path / "archives"), max_bytes=150)
+        write_archive(cache, "a", 100)
+        cache.pin("a")
+
+        write_archive(cache, "b", 100)
+        assert os.path.exists(cache.path("a"))
+
+        cache.unpin("a")
+        assert not os.path.exists(cache.path("a"))
+        assert cache.get("b") is not None
+
+    async def test_index_rebuilt_from_disk(self, tmp_path):
+        """Test a new cache picks up archives by modification time and drops partial ones"""
+        directory = tmp_path / "archives"
+        cache = ArchiveCache(str(directory), max_bytes=1000)
+        write_archive(cache, "old", 10)
+        write_archive(cache, "new", 10)
+        os.utime(cache.path("old"), (1, 1))
+        (directory / "stale.0123.partial").write_bytes(b"x")
+
+        reloaded = ArchiveCache(str(directory), max_bytes=15)
+        write_archive(reloaded, "newest", 5)
+
+        assert reloaded.get("old") is None
+        assert reloaded.get("new") is not None
+        assert not (directory / "stale.0123.partial").exists()
+
+
+class TestArchiveJobManager:
+    """Test archive builds"""
+
+    async def test_build_and_cache(self, tmp_path):
+        """Test concurrent jobs share one build and later ones hit the cache"""
+        manager = make_manager(tmp_path / "archives")
+        sources = [
+            make_source(tmp_path, "one.txt", b"first\n" * 1000),
+            make_source(tmp_path, "two.bin", os.urandom(5000)),
+        ]
+        user_id = uuid.uuid4()
+
+        first = manager.submit(user_id, sources)
+        second = manager.submit(user_id, list(reversed(sources)))
+        assert first.build is second.build
+        await first.build.task
+
+        assert first.status == JOB_COMPLETED
+        assert first.to_dict()["processed_bytes"] == first.build.total_bytes
+        archive = zipfile.ZipFile(manager.open_archive(first))
+        manager.release(first)
+        assert archive.read("one.txt") == b"first\n" * 1000
+        assert archive.read("two.bin") == open(sources[1].path, "rb").read()
+
+        third = manager.submit(user_id, sources)
+        assert third.cached is True
+        assert third.status == JOB_COMPLETED
+        assert third.key == first.key
+        assert manager.get(third.id, uuid.uuid4()) is None
+
+    async def test_failed_build(self, tmp_path):
+        """Test a build with an unreadable member fails without leaving files"""
+        directory = tmp_path / "archives"
+        manager = make_manager(directory)
+        source = make_source(tmp_path, "gone.txt", b"data")
+        os.remove(source.path)
+
+        job = manager.submit(uuid.uuid4(), [source])
+        await job.build.task
+
+        assert job.status == JOB_FAILED
+        assert job.to_dict()["error"]
+        assert os.listdir(directory) == []
+        assert manager.open_archive(job) is None
+
+    async def test_build_caps(self, tmp_path):
+        """Test new builds past a cap are refused, while joins and cache hits are not"""
+        manager = make_manager(tmp_path / "archives", per_user_limit=1, global_limit=2)
+        first_user, second_user = uuid.uuid4(), uuid.uuid4()
+        sources = [make_source(tmp_path, f"{i}.txt", b"data %d" % i) for i in range(4)]
+
+        first = manager.submit(first_user, [sources[0]])
+        assert manager.submit(second_user, [sources[0]]).build is first.build
+        with pytest.raises(ArchiveBuildRejected) as rejected:
+            manager.submit(first_user, [sources[1]])
+        assert rejected.value.retry_after == 30
+
+        second = manager.submit(second_user, [sources[1]])
+        with pytest.raises(ArchiveBuildRejected):
+            manager.submit(uuid.uuid4(), [sources[2]])
+        assert manager.stats()["rejected"] == 2
+
+        await asyncio.gather(first.build.task, second.build.task)
+        assert manager.submit(first_user, [sources[0]]).cached is True
+        third = manager.submit(first_user, [sources[2]])
+        await third.build.task
+        assert third.status == JOB_COMPLETED
+
+    async def test_build_space(self, tmp_path):
+        """Test running builds reserve their archive's size until they finish"""
+        manager = make_manager(tmp_path / "archives")
+        first = make_source(tmp_path, "first.bin", os.urandom(10000))
+        second = make_source(tmp_path, "second.bin", os.urandom(10000))
+
+        with pytest.raises(ArchiveSpaceExhausted):
+            manager.submit(uuid.uuid4(), [first], space_available=10000)
+
+        job = manager.submit(uuid.uuid4(), [first], space_available=15000)
+        reserved = manager.reserved_bytes()
+        assert 10000 < reserved <= 15000
+        with pytest.raises(ArchiveSpaceExhausted):
+            manager.submit(uuid.uuid4(), [second], space_available=15000)
+
+        await job.build.task
+        assert manager.reserved_bytes() == 0
+        assert job.build.written_bytes == job.build.archive_size <= reserved
+
+
+class TestArchiveEndpoints:
+    """Test archive jobs through the API"""
+
+    async def test_archive_job_download(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        tmp_path,
+        monkeypatch
+    ):
+        """Test submitting, polling and downloading an archive"""
+        monkeypatch.setattr(archive_jobs, "cache", ArchiveCache(str(tmp_path / "archives"), 10 ** 9))
+
+        response = await client.post(
+            "/api/v1/files/archives",
+            json={"file_ids": [str(test_file.id)]},
+            headers=auth_headers
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        for _ in range(50):
+            response = await client.get(f"/api/v1/files/archives/{job_id}", headers=auth_headers)
+            if response.json()["status"] == JOB_COMPLETED:
+                break
+            await asyncio.sleep(0.05)
+        assert response.json()["status"] == JOB_COMPLETED
+        assert response.json()["progress"] == 100.0
+
+        response = await client.get(f"/api/v1/files/archives/{job_id}/download", headers=auth_headers)
+        assert response.status_code == 200
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.read(test_file.filename) == b"This is a test file content"
+
+        partial = await client.get(
+            f"/api/v1/files/archives/{job_id}/download",
+            headers={**auth_headers, "Range": "bytes=10-19"}
+        )
+        assert partial.status_code == 206
+        assert partial.content == response.content[10:20]
+
+        # The same files again come straight from the cache
+        response = await client.post(
+            "/api/v1/files/archives",
+            json={"file_ids": [str(test_file.id)]},
+            headers=auth_headers
+        )
+        assert response.json()["status"] == JOB_COMPLETED
+        assert response.json()["cached"] is True
+
+    async def test_archive_build_refused(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        tmp_path,
+        monkeypatch
+    ):
+        """Test a build past the user's cap is 429 and one that cannot fit is 507"""
+        monkeypatch.setattr(archive_jobs, "cache", ArchiveCache(str(tmp_path / "archives"), 10 ** 9))
+        monkeypatch.setattr(archive_jobs, "per_user_limit", 0)
+
+        response = await client.post(
+            "/api/v1/files/archives",
+            json={"file_ids": [str(test_file.id)]},
+            headers=auth_headers
+        )
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == str(archive_jobs.retry_after)
+
+        monkeypatch.setattr(archive_jobs, "per_user_limit", 2)
+        monkeypatch.setattr(settings, "UPLOAD_DISK_HEADROOM", 10 ** 18)
+        response = await client.post(
+            "/api/v1/files/archives",
+            json={"file_ids": [str(test_file.id)]},
+            headers=auth_headers
+        )
+        assert response.status_code == 507
+
+    async def test_archive_job_not_found(self, client: AsyncClient, auth_headers: dict):
+        """Test unknown jobs are 404"""
+        response = await client.get(f"/api/v1/files/archives/{uuid.uuid4()}", headers=auth_headers)
+
+        assert response.status_code == 404
@@ -0,0 +1,100 @@
+"""
+Tests for download bandwidth shaping
+
+Tests cover:
+- Fair shares across users and transfers, rebalanced as transfers come and go
+- Token-bucket pacing of shaped streams
+- Shaped sendfile responses
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from app.utils.bandwidth import MIN_SLICE, BandwidthShaper, download_bandwidth
+from app.utils.file_responses import SendfileResponse
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestBandwidthShaper:
+    """Test fair-share token buckets"""
+
+    async def test_fair_shares(self):
+        """Test the global rate splits by user, then by each user's transfers"""
+        shaper = BandwidthShaper(global_rate=1000, user_rate=300, burst_seconds=1)
+        alice, bob = uuid.uuid4(), uuid.uuid4()
+
+        async with shaper.transfer(alice) as first:
+            assert first.rate == 300  # Capped by the per-user rate
+            async with shaper.transfer(alice) as second, shaper.transfer(bob) as third:
+                assert first.rate == second.rate == 150
+                assert third.rate == 300
+                assert shaper.fair_rate(bob) == 150
+
+                shaper.set_limits(global_rate=400, user_rate=0)
+                assert first.rate == 100
+                assert third.rate == 200
+                assert shaper.stats()["active_users"] == 2
+
+            assert first.rate == 400
+        assert shaper.stats()["transfers"] == []
+
+    async def test_unlimited(self):
+        """Test zero limits leave transfers unthrottled"""
+        shaper = BandwidthShaper(global_rate=0, user_rate=0, burst_seconds=1)
+        data = os.urandom(100000)
+
+        pieces = [piece async for piece in shaper.shape(chunks(data, 50000), uuid.uuid4())]
+
+        assert pieces == [data[:50000], data[50000:]]
+        assert shaper.fair_rate(uuid.uuid4()) == 0
+
+    async def test_shape_paces_stream(self):
+        """Test a shaped stream is sliced and held to its rate after the burst"""
+        shaper = BandwidthShaper(global_rate=200000, user_rate=0, burst_seconds=0.1)
+        data = os.urandom(80000)
+
+        started = time.monotonic()
+        pieces = [piece async for piece in shaper.shape(chunks(data, 80000), uuid.uuid4())]
+        elapsed = time.monotonic() - started
+
+        assert b"".join(pieces) == data
+        assert max(len(piece) for piece in pieces) == max(MIN_SLICE, 20000)
+        # 20 KB of burst, then 60 KB at 200 KB/s
+        assert elapsed >= 0.25
+
+    async def test_shaped_sendfile(self, tmp_path, monkeypatch):
+        """Test sendfile responses are cut into paced blocks for a user"""
+        monkeypatch.setattr(download_bandwidth, "global_rate", 1000000)
+        monkeypatch.setattr(download_bandwidth, "burst_seconds", 0.05)
+        data = os.urandom(300000)
+        path = tmp_path / "data.bin"
+        path.write_bytes(data)
+        user_id = uuid.uuid4()
+        messages = []
+        seen = []
+
+        async def send(message):
+            messages.append(message)
+            seen.append(download_bandwidth.stats()["active_transfers"])
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        response = SendfileResponse(str(path), 0, len(data), user_id=user_id, label="data.bin")
+        await response({"type": "http", "method": "GET"}, receive, send)
+
+        bodies = [message["body"] for message in messages[1:]]
+        assert b"".join(bodies) == data
+        assert max(len(body) for body in bodies) == 50000
+        assert seen[0] == 1
+        assert download_bandwidth.stats()["active_transfers"] == 0
@@ -0,0 +1,90 @@
+"""
+Tests for framed storage compression
+
+Tests cover:
+- MIME type compression policy
+- Framed compression and random-access reads
+- Skipping content that compresses poorly
+- Streaming original bytes of stored content
+"""
+import os
+
+import pytest
+
+from app.utils.compression import (
+    CODEC_IDENTITY,
+    CODEC_ZLIB,
+    compress_file,
+    is_compressible_type,
+    iter_stored_file,
+    open_stored_file,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def text_data(size: int) -> bytes:
+    """Compressible, non-repeating text"""
+    lines = b"".join(b"%08d,sensor-%d,%d.%02d\n" % (i, i % 17, i % 1000, i % 100) for i in range(size // 20 + 1))
+    return lines[:size]
+
+
+class TestCompression:
+    """Test framed compression of stored content"""
+
+    async def test_is_compressible_type(self):
+        """Test already-compressed formats are skipped"""
+        assert is_compressible_type(None)
+        assert is_compressible_type("text/csv; charset=utf-8")
+        assert is_compressible_type("application/vnd.ms-excel")
+        assert is_compressible_type("image/bmp")
+        assert not is_compressible_type("image/jpeg")
+        assert not is_compressible_type("application/zip")
+        assert not is_compressible_type("application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+
+    async def test_compress_file_random_access(self, tmp_path):
+        """Test framed content reads back any range without reading the whole file"""
+        data = text_data(300_000)
+        source = tmp_path / "data.csv"
+        source.write_bytes(data)
+        stored = tmp_path / "data.fz"
+
+        stored_size, cpu_seconds = compress_file(str(source), str(stored), 64 * 1024, 3, 0.9)
+
+        assert stored_size == os.path.getsize(stored)
+        assert stored_size < len(data) // 2
+        assert cpu_seconds >= 0
+        with open_stored_file(str(stored), CODEC_ZLIB) as reader:
+            assert reader.size == len(data)
+            assert reader.pread(len(data), 0) == data
+            # Ranges crossing frame boundaries and running past the end
+            assert reader.pread(1000, 65_000) == data[65_000:66_000]
+            assert reader.pread(200_000, 70_000) == data[70_000:270_000]
+            assert reader.pread(100, len(data) - 10) == data[-10:]
+            assert reader.pread(100, len(data)) == b""
+
+    async def test_compress_file_skips_incompressible(self, tmp_path):
+        """Test random content is left uncompressed"""
+        source = tmp_path / "random.bin"
+        source.write_bytes(os.urandom(200_000))
+        stored = tmp_path / "random.fz"
+
+        assert compress_file(str(source), str(stored), 64 * 1024, 3, 0.9) is None
+        assert not stored.exists()
+
+    async def test_iter_stored_file(self, tmp_path):
+        """Test stored content streams back as its original bytes"""
+        data = text_data(150_000)
+        source = tmp_path / "log.txt"
+        source.write_bytes(data)
+        stored = tmp_path / "log.fz"
+        compress_file(str(source), str(stored), 32 * 1024, 1, 0.9)
+
+        compressed = b"".join([piece async for piece in iter_stored_file(str(stored), CODEC_ZLIB, block_size=10_000)])
+        ranged = b"".join([piece async for piece in iter_stored_file(str(stored), CODEC_ZLIB, 40_000, 90_000)])
+        raw = b"".join([piece async for piece in iter_stored_file(str(source), CODEC_IDENTITY)])
+
+        assert compressed == data
+        assert ranged == data[40_000:90_000]
+        assert raw == data
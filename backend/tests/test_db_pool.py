@@ -0,0 +1,107 @@
+"""
+Tests for database connection pool instrumentation
+
+Tests cover:
+- Checkout wait, timeout and hold time statistics
+- Downloads handing their connection back before the body is streamed
+"""
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.database import get_db
+from app.main import app
+from app.models.file import File
+from app.utils.bandwidth import download_bandwidth
+from app.utils.db_pool import InstrumentedPool, PoolMonitor
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestInstrumentedPool:
+    """Test pool checkout statistics"""
+
+    async def test_checkout_stats(self, test_settings):
+        """Test waits, timeouts and holds are counted against a one-connection pool"""
+        monitor = PoolMonitor()
+
+        class MonitoredPool(InstrumentedPool):
+            pass
+
+        MonitoredPool.monitor = monitor
+        engine = create_async_engine(
+            test_settings.DATABASE_URL,
+            poolclass=MonitoredPool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.2
+        )
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                assert monitor.stats()["checked_out"] == 1
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        finally:
+            await engine.dispose()
+
+        stats = monitor.stats()
+        assert stats["size"] == 1
+        assert stats["checked_out"] == 0
+        assert stats["checkouts"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["max_wait_ms"] >= 200
+        assert stats["max_hold_ms"] >= 200
+
+
+class TestConnectionRelease:
+    """Test file-serving endpoints release their connection before streaming"""
+
+    async def test_download_releases_connection(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        test_settings,
+        monkeypatch
+    ):
+        """Test no pooled connection is checked out while the body is sent"""
+        monitor = PoolMonitor()
+
+        class MonitoredPool(InstrumentedPool):
+            pass
+
+        MonitoredPool.monitor = monitor
+        engine = create_async_engine(test_settings.DATABASE_URL, poolclass=MonitoredPool)
+        session = AsyncSession(engine, expire_on_commit=False)
+
+        async def override_get_db():
+            yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+
+        shape = download_bandwidth.shape
+        checked_out = []
+
+        async def watched(body, user_id, label=""):
+            checked_out.append(monitor.stats()["checked_out"])
+            async for chunk in shape(body, user_id, label):
+                yield chunk
+
+        monkeypatch.setattr(download_bandwidth, "shape", watched)
+
+        try:
+            response = await client.get(f"/api/v1/files/{test_file.id}/download", headers=auth_headers)
+        finally:
+            await session.close()
+            await engine.dispose()
+
+        assert response.content == b"This is a test file content"
+        assert monitor.stats()["checkouts"] >= 1
+        assert checked_out == [0]
@@ -0,0 +1,103 @@
+"""
+Tests for rsync-style signatures and deltas
+
+Tests cover:
+- Block size selection
+- Signature building and parsing
+- Delta encoding against shifted and edited data
+- Incremental delta parsing
+"""
+import hashlib
+import os
+import random
+
+import pytest
+
+from app.utils.delta import (
+    DeltaReader,
+    OP_COPY,
+    OP_END,
+    OP_LITERAL,
+    build_signature,
+    choose_block_size,
+    compute_delta,
+    parse_signature,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def apply(delta: bytes, base: bytes) -> bytes:
+    """Apply a delta in memory, mirroring FileService.apply_delta"""
+    reader = DeltaReader(delta, block_size=7)
+    block_size, target_size, checksum = await reader.read_header()
+    output = bytearray()
+    while True:
+        op, first, count = await reader.read_op()
+        if op == OP_END:
+            break
+        if op == OP_COPY:
+            output += base[first * block_size:(first + count) * block_size]
+        elif op == OP_LITERAL:
+            async for piece in reader.iter_literal(first, 5):
+                output += piece
+    assert await reader.at_end()
+    assert len(output) == target_size
+    assert hashlib.sha256(output).hexdigest() == checksum
+    return bytes(output)
+
+
+class TestDelta:
+    """Test delta signatures and encoding"""
+
+    async def test_choose_block_size(self):
+        """Test block sizes follow the square root of the file size within bounds"""
+        assert choose_block_size(0) == 2048
+        assert choose_block_size(4 * 1024 ** 3) == 65536
+        assert choose_block_size(1024 ** 4) == 128 * 1024
+
+    async def test_build_signature(self, tmp_path):
+        """Test signatures describe every block including a short last one"""
+        data = os.urandom(2048 * 3 + 100)
+        path = tmp_path / "base.bin"
+        path.write_bytes(data)
+
+        block_size, file_size, blocks = parse_signature(build_signature(str(path), 2048))
+
+        assert block_size == 2048
+        assert file_size == len(data)
+        assert len(blocks) == 4
+        assert blocks[3][1] == hashlib.sha256(data[6144:]).digest()[:16]
+
+    async def test_delta_reuses_shifted_blocks(self, tmp_path):
+        """Test an insertion only costs its literal bytes"""
+        rng = random.Random(1)
+        base = bytes(rng.getrandbits(8) for _ in range(2048 * 20))
+        path = tmp_path / "base.bin"
+        path.write_bytes(base)
+        signature = build_signature(str(path), 2048)
+
+        # Insert bytes mid-file so later blocks are no longer aligned
+        target = base[:10000] + b"inserted!" + base[10000:]
+        delta = compute_delta(signature, target)
+
+        assert len(delta) < 2048 * 3
+        assert await apply(delta, base) == target
+
+    async def test_delta_of_unrelated_data(self, tmp_path):
+        """Test data sharing nothing with the base is sent as literals"""
+        path = tmp_path / "base.bin"
+        path.write_bytes(os.urandom(4096))
+        target = os.urandom(5000)
+
+        delta = compute_delta(build_signature(str(path), 2048), target)
+
+        assert len(delta) > len(target)
+        assert await apply(delta, b"") == target
+
+    async def test_truncated_delta(self):
+        """Test a delta cut short is rejected"""
+        reader = DeltaReader(b"FDL1\x00", block_size=4)
+        with pytest.raises(ValueError, match="Truncated delta"):
+            await reader.read_header()
@@ -0,0 +1,142 @@
+"""
+Tests for the small file cache
+
+Tests cover:
+- Greedy-Dual-Size-Frequency eviction keeping small, popular files
+- TTL expiry, invalidation and hit ratio statistics
+- Downloads served from the cache and invalidated by renames
+- Cached locations whose file has moved looked up again
+"""
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+
+from app.models.file import File
+from app.utils.file_cache import (
+    CachedFile,
+    FileLocation,
+    SmallFileCache,
+    file_locations,
+    load_file,
+    small_file_cache,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def cached(size: int) -> CachedFile:
+    return CachedFile(uuid.uuid4(), "0" * 64, "f.bin", None, datetime.utcnow(), b"x" * size)
+
+
+class TestSmallFileCache:
+    """Test cache admission, eviction and statistics"""
+
+    async def test_evicts_large_and_unpopular(self):
+        """Test a new entry evicts the lowest frequency-per-byte entries first"""
+        cache = SmallFileCache(max_bytes=1000, max_file_size=600, ttl=60)
+        small, large, popular = cached(100), cached(500), cached(300)
+        for entry in (small, large, popular):
+            cache.put(entry)
+        for _ in range(3):
+            cache.get(popular.file_id)
+
+        assert not cache.admits(700)
+        cache.put(cached(400))
+
+        assert cache.get(large.file_id) is None
+        assert cache.get(small.file_id) is small
+        assert cache.get(popular.file_id) is popular
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 800
+
+    async def test_expiry_and_invalidation(self, monkeypatch):
+        """Test expired and invalidated entries miss and the hit ratio counts both"""
+        cache = SmallFileCache(max_bytes=1000, max_file_size=1000, ttl=60)
+        first, second = cached(10), cached(10)
+        cache.put(first)
+        cache.put(second)
+
+        assert cache.get(first.file_id) is first
+        cache.invalidate(first.file_id)
+        assert cache.get(first.file_id) is None
+
+        monkeypatch.setattr(time, "monotonic", lambda: second.cached_at + 61)
+        assert cache.get(second.file_id) is None
+
+        stats = cache.stats()
+        assert stats["entries"] == 0
+        assert stats["hit_ratio"] == round(1 / 3, 4)
+        assert stats["invalidations"] == 1
+
+    async def test_load_file(self, tmp_path):
+        """Test a raw stored file is read whole"""
+        path = tmp_path / "data.bin"
+        path.write_bytes(b"cached content")
+
+        assert load_file(str(path)) == b"cached content"
+
+
+class TestCachedDownloads:
+    """Test downloads through the small file cache"""
+
+    async def test_download_cached(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File
+    ):
+        """Test repeat downloads hit the cache until the file is renamed"""
+        small_file_cache.clear()
+        file_id = test_file.id
+        url = f"/api/v1/files/{file_id}/download"
+
+        first = await client.get(url, headers=auth_headers)
+        hits = small_file_cache.hits
+        second = await client.get(url, headers={**auth_headers, "Range": "bytes=8-13"})
+
+        assert first.content == b"This is a test file content"
+        assert second.status_code == 206
+        assert second.content == b"a test"
+        assert small_file_cache.hits == hits + 1
+
+        response = await client.put(
+            f"/api/v1/files/{file_id}/rename",
+            json={"new_filename": "renamed.txt"},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert small_file_cache.get(file_id) is None
+
+        response = await client.get(url, headers=auth_headers)
+        assert response.headers["content-disposition"] == 'attachment; filename="renamed.txt"'
+
+    async def test_moved_location_looked_up(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        tmp_path
+    ):
+        """Test a cached location whose file moved, as blob compression does, is looked up again"""
+        small_file_cache.clear()
+        file_id = test_file.id
+        file_locations.put(FileLocation(
+            file_id=file_id,
+            filepath=str(tmp_path / "moved.txt"),
+            codec="identity",
+            filename=test_file.filename,
+            mime_type=test_file.mime_type,
+            checksum=test_file.checksum,
+            size=test_file.size,
+            upload_date=test_file.upload_date
+        ))
+
+        response = await client.get(f"/api/v1/files/{file_id}/download", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.content == b"This is a test file content"
+        assert file_locations.get(file_id).filepath == test_file.filepath
@@ -0,0 +1,147 @@
+"""
+Tests for offloaded and sendfile download responses
+
+Tests cover:
+- Internal-redirect headers for nginx and Apache, only under the active files path
+- Zero-copy sendfile through the ASGI extension, and the pool-read fallback
+- Sending stops and the admission slot is released when the client disconnects
+- Offloaded downloads still authorized and audited
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+
+from app.config import settings
+from app.models.audit import AuditLog
+from app.models.file import File
+from app.utils.admission import download_admission
+from app.utils.bandwidth import download_bandwidth
+from app.utils.file_responses import ZEROCOPY_EXTENSION, SendfileResponse, offload_headers
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def run_response(response, extensions=None):
+    """Call an ASGI response and collect the messages it sends"""
+    messages = []
+
+    async def receive():
+        # The client stays connected until the response is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            # Stand in for the server's sendfile() of the descriptor
+            message = {**message, "data": os.pread(message["file"].fileno(), message["count"], message["offset"])}
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": extensions or {}}
+    await response(scope, receive, send)
+    return messages
+
+
+class TestFileResponses:
+    """Test download offload headers and sendfile responses"""
+
+    async def test_offload_headers(self, tmp_path, monkeypatch):
+        """Test stored paths map onto the proxy's internal location"""
+        monkeypatch.setattr(settings, "ACTIVE_FILES_PATH", str(tmp_path / "active"))
+        monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD_PREFIX", "/protected-files/")
+        path = str(tmp_path / "active" / "blobs" / "ab" / "cd" / "a b")
+
+        monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "")
+        assert offload_headers(path) is None
+
+        monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+        assert offload_headers(path) == {"X-Accel-Redirect": "/protected-files/blobs/ab/cd/a%20b"}
+        assert offload_headers(str(tmp_path / "active" / ".." / "secret")) is None
+
+        monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-sendfile")
+        assert offload_headers(path) == {"X-Sendfile": path}
+
+    async def test_sendfile_response(self, tmp_path):
+        """Test byte ranges go through zero-copy sendfile or pool reads alike"""
+        data = os.urandom(10000)
+        path = tmp_path / "data.bin"
+        path.write_bytes(data)
+
+        messages = await run_response(
+            SendfileResponse(str(path), 100, 5100, status_code=206),
+            extensions={ZEROCOPY_EXTENSION: {}}
+        )
+        assert messages[0]["status"] == 206
+        assert (b"content-length", b"5000") in messages[0]["headers"]
+        assert messages[1]["type"] == ZEROCOPY_EXTENSION
+        assert messages[1]["data"] == data[100:5100]
+
+        messages = await run_response(SendfileResponse(str(path), 100, 5100, block_size=1024))
+        assert b"".join(message["body"] for message in messages[1:]) == data[100:5100]
+        assert [message["more_body"] for message in messages[1:]] == [True] * 4 + [False]
+
+        messages = await run_response(SendfileResponse(str(path), 0, 0))
+        assert messages[1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+    async def test_sendfile_disconnect(self, tmp_path):
+        """Test an early disconnect stops reading and releases the slot and bandwidth share"""
+        data = os.urandom(100000)
+        path = tmp_path / "data.bin"
+        path.write_bytes(data)
+        user_id = uuid.uuid4()
+        slot = await download_admission.acquire(user_id)
+        disconnected = asyncio.Event()
+        bodies = []
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                bodies.append(message["body"])
+                disconnected.set()
+                # The server drops what is sent after a disconnect
+                await asyncio.sleep(0.01)
+
+        response = SendfileResponse(
+            str(path), 0, len(data), background=BackgroundTask(slot.release), block_size=1024, user_id=user_id
+        )
+        await response({"type": "http", "method": "GET"}, receive, send)
+
+        assert len(bodies) < 5
+        assert download_admission.stats()["active"] == 0
+        assert download_bandwidth.stats()["active_transfers"] == 0
+
+    async def test_download_offloaded(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        db_session: AsyncSession,
+        monkeypatch
+    ):
+        """Test an offloaded download returns only the redirect and is audited"""
+        monkeypatch.setattr(settings, "ACTIVE_FILES_PATH", os.path.dirname(test_file.filepath))
+        monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+        file_id = test_file.id
+
+        response = await client.get(
+            f"/api/v1/files/{file_id}/download",
+            headers={**auth_headers, "Range": "bytes=0-3"}
+        )
+
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["x-accel-redirect"] == "/protected-files/test_file.txt"
+        assert response.headers["content-disposition"] == 'attachment; filename="test_file.txt"'
+
+        result = await db_session.execute(select(AuditLog).where(AuditLog.action == "download"))
+        log = result.scalar_one()
+        assert log.target_file_id == file_id
+        assert log.details == {"offloaded": True, "range": "bytes=0-3"}
@@ -3,8 +3,14 @@ Tests for file service
 
 Tests cover:
 - Upload initialization
+- Disk space reserved for uploads and archive builds
 - Chunk upload with checksum verification
-- Complete upload and file assembly
+- Complete upload of the preallocated file
+- Chunk manifests, tree hashes and checksum verification
+- Content-addressed blobs shared by duplicate uploads
+- Delta uploads of new revisions
+- Compressed storage of compressible content
+- Upload sessions and resume state
 - Cancel upload and cleanup
 - List files with pagination, sorting, search
 - Soft delete files
@@ -18,14 +24,15 @@ import pytest
 import os
 import uuid
 import hashlib
+import zlib
 from datetime import datetime, timedelta
 from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 
-from app.services.file_service import FileService
-from app.models.file import File, SyncStatus
-from app.models.sync import UploadChunk
+from app.services.file_service import FileService, InsufficientStorageError
+from app.models.file import Blob, File, SyncStatus
+from app.models.sync import UploadSession, UploadStat
 from app.models.user import User
 
 
@@ -39,13 +46,11 @@ class TestFileService:
         """Test upload initialization"""
         filename = "test_document.pdf"
         file_size = 150000000  # 150 MB
-        total_chunks = 3
 
         upload_id, chunk_size = await FileService.initialize_upload(
             db=db_session,
             filename=filename,
             file_size=file_size,
-            total_chunks=total_chunks,
             user_id=test_user.id,
             mime_type="application/pdf"
         )
@@ -54,108 +59,268 @@ class TestFileService:
         assert isinstance(upload_id, uuid.UUID)
         assert chunk_size > 0
 
+    async def test_initialize_upload_reserves_disk_space(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test uploads are rejected at init when their size cannot be reserved"""
+        import shutil
+        from app.config import settings
+        from app.utils.bitmap import new_bitmap
+
+        mb = 1024 * 1024
+        user_id = test_user.id
+        os.makedirs(settings.TEMP_FILES_PATH, exist_ok=True)
+        free = shutil.disk_usage(settings.TEMP_FILES_PATH).free
+        monkeypatch.setattr(settings, "UPLOAD_DISK_HEADROOM", free - 10 * mb)
+
+        # A sparse upload file still needs its unreceived bytes
+        db_session.add(UploadSession(
+            user_id=user_id,
+            filename="sparse.bin",
+            file_size=8 * mb,
+            chunk_size=8 * mb,
+            total_chunks=1,
+            received_chunks=new_bitmap(1),
+            chunk_checksums=[None],
+            bytes_received=0,
+            preallocated=False,
+            expires_at=datetime.utcnow() + timedelta(hours=1)
+        ))
+        await db_session.commit()
+
+        with pytest.raises(InsufficientStorageError):
+            await FileService.initialize_upload(
+                db=db_session,
+                filename="too_big.bin",
+                file_size=4 * mb,
+                user_id=user_id
+            )
+        await db_session.rollback()
+
+        result = await db_session.execute(select(func.count(UploadSession.id)))
+        assert result.scalar() == 1
+
+        # Fits once the other reservation is gone
+        await db_session.execute(delete(UploadSession))
+        await db_session.commit()
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="fits.bin",
+            file_size=4 * mb,
+            user_id=user_id
+        )
+        assert os.path.exists(FileService.get_upload_path(upload_id))
+
+    async def test_reserve_disk_space_counts_archive_builds(self, db_session: AsyncSession, monkeypatch):
+        """Test archives still being built count against the space left for uploads"""
+        import shutil
+        from app.config import settings
+        from app.services.file_service import archive_jobs
+
+        mb = 1024 * 1024
+        os.makedirs(settings.TEMP_FILES_PATH, exist_ok=True)
+        free = shutil.disk_usage(settings.TEMP_FILES_PATH).free
+        monkeypatch.setattr(settings, "UPLOAD_DISK_HEADROOM", free - 10 * mb)
+        monkeypatch.setattr(archive_jobs, "reserved_bytes", lambda: 8 * mb)
+
+        with pytest.raises(InsufficientStorageError):
+            await FileService.reserve_disk_space(db_session, 4 * mb)
+        await db_session.rollback()
+
+        monkeypatch.setattr(archive_jobs, "reserved_bytes", lambda: 0)
+        await FileService.reserve_disk_space(db_session, 4 * mb)
+        assert 0 < await FileService.archive_space_available(db_session) <= 10 * mb
+
+    async def test_choose_chunk_size(self, monkeypatch):
+        """Test chunk sizes adapt to file size, link speed and load"""
+        from app.config import settings
+
+        mb = 1024 * 1024
+        monkeypatch.setattr(settings, "CHUNK_SIZE", 50 * mb)
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 1 * mb)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 256 * mb)
+        monkeypatch.setattr(settings, "UPLOAD_TARGET_CHUNKS", 32)
+        monkeypatch.setattr(settings, "UPLOAD_CHUNK_SECONDS", 30)
+        monkeypatch.setattr(settings, "UPLOAD_BUSY_SESSIONS", 20)
+
+        # Small files fit in a single chunk
+        assert FileService.choose_chunk_size(200 * 1024) == 1 * mb
+
+        # Without a throughput estimate large files are capped at CHUNK_SIZE
+        assert FileService.choose_chunk_size(10 * 1024 * mb) == 50 * mb
+
+        # A fast link allows larger chunks, up to the configured maximum
+        assert FileService.choose_chunk_size(10 * 1024 * mb, throughput=100 * mb) == 256 * mb
+        assert FileService.choose_chunk_size(1024 * mb, throughput=100 * mb) == 32 * mb
+
+        # A slow link or a busy server shrinks chunks, rounded up to whole MB
+        assert FileService.choose_chunk_size(10 * 1024 * mb, throughput=mb // 10) == 3 * mb
+        assert FileService.choose_chunk_size(10 * 1024 * mb, active_uploads=20) == 25 * mb
+
     async def test_upload_chunk(self, db_session: AsyncSession, test_user: User, temp_storage_dirs: dict):
         """Test chunk upload with checksum verification"""
+        # Create chunk data
+        chunk_data = b"This is chunk data for testing" * 1000
+        checksum = hashlib.sha256(chunk_data).hexdigest()
+
         # Initialize upload
         upload_id, _ = await FileService.initialize_upload(
             db=db_session,
             filename="test.pdf",
-            file_size=100000,
-            total_chunks=2,
+            file_size=len(chunk_data),
             user_id=test_user.id
         )
 
-        # Create chunk data
-        chunk_data = b"This is chunk data for testing" * 1000
-        checksum = hashlib.sha256(chunk_data).hexdigest()
-
         # Upload chunk
         result = await FileService.upload_chunk(
             db=db_session,
             upload_id=upload_id,
-            chunk_number=1,
+            chunk_number=0,
             chunk_data=chunk_data,
             filename="test.pdf",
-            total_chunks=2,
+            total_chunks=1,
             checksum=checksum
         )
 
         assert result is True
 
-        # Verify chunk was saved in database
-        db_result = await db_session.execute(
-            select(UploadChunk).where(UploadChunk.upload_id == upload_id)
-        )
-        chunk_record = db_result.scalar_one_or_none()
-        assert chunk_record is not None
-        assert chunk_record.chunk_number == 1
-        assert chunk_record.checksum == checksum
+        # Verify chunk was recorded in the session ledger
+        upload_session = await FileService.get_upload_session(db_session, upload_id)
+        await db_session.refresh(upload_session)
+        assert upload_session.chunk_checksums == [checksum]
+        assert upload_session.bytes_received == len(chunk_data)
 
     async def test_upload_chunk_checksum_mismatch(self, db_session: AsyncSession, test_user: User):
         """Test chunk upload fails with wrong checksum"""
+        chunk_data = b"Test chunk data"
+        wrong_checksum = "wrongchecksumvalue123"
+
         upload_id, _ = await FileService.initialize_upload(
             db=db_session,
             filename="test.pdf",
-            file_size=100000,
-            total_chunks=2,
+            file_size=len(chunk_data),
             user_id=test_user.id
         )
 
-        chunk_data = b"Test chunk data"
-        wrong_checksum = "wrongchecksumvalue123"
-
         with pytest.raises(ValueError, match="checksum mismatch"):
             await FileService.upload_chunk(
                 db=db_session,
                 upload_id=upload_id,
-                chunk_number=1,
+                chunk_number=0,
                 chunk_data=chunk_data,
                 filename="test.pdf",
-                total_chunks=2,
+                total_chunks=1,
                 checksum=wrong_checksum
             )
 
-    async def test_complete_upload(self, db_session: AsyncSession, test_user: User, temp_storage_dirs: dict):
-        """Test complete upload assembles chunks correctly"""
-        filename = "complete_test.txt"
+    async def test_upload_chunk_streams_upload_file(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test chunk upload consumes an UploadFile in bounded blocks"""
+        import io
+        from fastapi import UploadFile
+        from app.config import settings
+
+        # Several blocks worth of data in a single chunk
+        monkeypatch.setattr(settings, "UPLOAD_BLOCK_SIZE", 64 * 1024)
+        chunk_data = os.urandom(settings.UPLOAD_BLOCK_SIZE * 2 + 123)
+        checksum = hashlib.sha256(chunk_data).hexdigest()
 
-        # Initialize upload
         upload_id, _ = await FileService.initialize_upload(
             db=db_session,
-            filename=filename,
-            file_size=60,
-            total_chunks=2,
-            user_id=test_user.id,
-            mime_type="text/plain"
+            filename="stream.bin",
+            file_size=len(chunk_data),
+            user_id=test_user.id
         )
 
-        # Upload chunks
-        chunk1_data = b"First chunk content"
-        chunk1_checksum = hashlib.sha256(chunk1_data).hexdigest()
-        await FileService.upload_chunk(
+        result = await FileService.upload_chunk(
             db=db_session,
             upload_id=upload_id,
             chunk_number=0,
-            chunk_data=chunk1_data,
-            filename=filename,
-            total_chunks=2,
-            checksum=chunk1_checksum
+            chunk_data=UploadFile(file=io.BytesIO(chunk_data), filename="blob"),
+            filename="stream.bin",
+            total_chunks=1,
+            checksum=checksum
         )
 
-        chunk2_data = b"Second chunk content"
-        chunk2_checksum = hashlib.sha256(chunk2_data).hexdigest()
-        await FileService.upload_chunk(
+        assert result is True
+
+        upload_session = await FileService.get_upload_session(db_session, upload_id)
+        await db_session.refresh(upload_session)
+        assert upload_session.bytes_received == len(chunk_data)
+        assert Path(FileService.get_upload_path(upload_id)).read_bytes() == chunk_data
+
+    async def test_upload_chunk_from_request_stream(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test chunk upload consumes a raw body stream, coalescing small pieces"""
+        from app.config import settings
+        from app.utils import file_utils
+
+        chunk_data = os.urandom(10000)
+        checksum = hashlib.sha256(chunk_data).hexdigest()
+        monkeypatch.setattr(settings, "UPLOAD_BLOCK_SIZE", 4096)
+
+        writes = []
+        write_at = file_utils.write_at
+
+        async def recording_write_at(fd, data, offset, hashers=()):
+            writes.append(len(data))
+            await write_at(fd, data, offset, hashers)
+
+        monkeypatch.setattr("app.services.file_service.write_at", recording_write_at)
+
+        async def body():
+            for start in range(0, len(chunk_data), 1000):
+                yield chunk_data[start:start + 1000]
+
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="raw.bin",
+            file_size=len(chunk_data),
+            user_id=test_user.id
+        )
+
+        result = await FileService.upload_chunk(
             db=db_session,
             upload_id=upload_id,
-            chunk_number=1,
-            chunk_data=chunk2_data,
+            chunk_number=0,
+            chunk_data=body(),
+            filename=None,
+            total_chunks=None,
+            checksum=checksum
+        )
+
+        assert result is True
+        assert writes == [4096, 4096, 1808]
+        assert Path(FileService.get_upload_path(upload_id)).read_bytes() == chunk_data
+
+    async def test_complete_upload(self, db_session: AsyncSession, test_user: User, temp_storage_dirs: dict, monkeypatch):
+        """Test complete upload moves the preallocated file into place"""
+        from app.config import settings
+
+        filename = "complete_test.txt"
+        final_data = b"First chunk content!" + b"Second chunk content"
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 20)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 20)
+
+        # Initialize upload
+        upload_id, chunk_size = await FileService.initialize_upload(
+            db=db_session,
             filename=filename,
-            total_chunks=2,
-            checksum=chunk2_checksum
+            file_size=len(final_data),
+            user_id=test_user.id,
+            mime_type="text/plain"
         )
 
+        # Upload chunks out of order
+        for chunk_number in (1, 0):
+            chunk_data = final_data[chunk_number * chunk_size:(chunk_number + 1) * chunk_size]
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=chunk_number,
+                chunk_data=chunk_data,
+                filename=filename,
+                total_chunks=2,
+                checksum=hashlib.sha256(chunk_data).hexdigest()
+            )
+
         # Calculate final checksum
-        final_data = chunk1_data + chunk2_data
         final_checksum = hashlib.sha256(final_data).hexdigest()
 
         # Complete upload
@@ -172,36 +337,701 @@ class TestFileService:
         assert file_record.filename == filename
         assert file_record.uploaded_by == test_user.id
         assert file_record.checksum == final_checksum
+        assert file_record.size == len(final_data)
         assert file_record.is_deleted is False
         assert file_record.sync_status == SyncStatus.PENDING
+        assert Path(file_record.filepath).read_bytes() == final_data
+        assert not os.path.exists(FileService.get_upload_path(upload_id))
 
-        # Verify chunks were cleaned up
-        result = await db_session.execute(
-            select(UploadChunk).where(UploadChunk.upload_id == upload_id)
+        # Out-of-order chunks leave the full checksum to background verification
+        assert file_record.checksum_verified is False
+        assert await FileService.verify_checksum(db_session, file_record.id) is True
+        await db_session.refresh(file_record)
+        assert file_record.checksum_verified is True
+
+        # Verified content is adopted into the blob store
+        assert file_record.blob_id is not None
+        assert file_record.filepath == FileService.get_blob_path(final_checksum)
+        assert Path(file_record.filepath).read_bytes() == final_data
+
+        # Verify the upload session was cleaned up
+        assert await FileService.get_upload_session(db_session, upload_id) is None
+
+    async def test_complete_upload_in_order_verifies_checksum(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test in-order chunks verify the full checksum without re-reading the file"""
+        from app.config import settings
+        from app.utils.file_utils import compute_tree_hash
+
+        final_data = os.urandom(50)
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 20)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 20)
+
+        upload_id, chunk_size = await FileService.initialize_upload(
+            db=db_session,
+            filename="ordered.bin",
+            file_size=len(final_data),
+            user_id=test_user.id
+        )
+
+        chunk_checksums = []
+        for chunk_number in range(3):
+            chunk_data = final_data[chunk_number * chunk_size:(chunk_number + 1) * chunk_size]
+            chunk_checksums.append(hashlib.sha256(chunk_data).hexdigest())
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=chunk_number,
+                chunk_data=chunk_data,
+                filename="ordered.bin",
+                total_chunks=3,
+                checksum=chunk_checksums[-1]
+            )
+
+        file_record = await FileService.complete_upload(
+            db=db_session,
+            upload_id=upload_id,
+            filename="ordered.bin",
+            final_checksum=hashlib.sha256(final_data).hexdigest(),
+            user_id=test_user.id,
+            tree_hash=compute_tree_hash(chunk_checksums)
+        )
+
+        assert file_record.checksum_verified is True
+        # The CRC-32 for stored archives is kept alongside the digest
+        assert file_record.crc32 == zlib.crc32(final_data)
+
+        # Throughput is recorded for tuning chunk sizes
+        result = await db_session.execute(select(UploadStat))
+        stat = result.scalar_one()
+        assert stat.file_size == len(final_data)
+        assert stat.chunk_size == chunk_size
+        assert stat.total_chunks == 3
+
+        manifest = await FileService.get_manifest(db_session, file_record.id)
+        assert manifest.chunk_checksums == chunk_checksums
+        assert manifest.tree_hash == compute_tree_hash(chunk_checksums)
+
+    async def test_complete_upload_after_resent_chunk(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test re-sending a chunk the running digest has taken in leaves the checksum to background verification"""
+        from app.config import settings
+
+        original = os.urandom(40)
+        swapped = os.urandom(20)
+        user_id = test_user.id
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 20)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 20)
+
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="resent.bin",
+            file_size=len(original),
+            user_id=user_id
+        )
+        for chunk_number, chunk_data in enumerate([original[:20], original[20:], swapped]):
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=chunk_number % 2,
+                chunk_data=chunk_data,
+                filename="resent.bin",
+                total_chunks=2,
+                checksum=hashlib.sha256(chunk_data).hexdigest()
+            )
+
+        # A failed re-send overwrote the chunk, so it must be sent again
+        with pytest.raises(ValueError, match="checksum mismatch"):
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=1,
+                chunk_data=os.urandom(20),
+                filename="resent.bin",
+                total_chunks=2,
+                checksum=hashlib.sha256(original[20:]).hexdigest()
+            )
+        with pytest.raises(ValueError, match="Expected 2 chunks, found 1"):
+            await FileService.complete_upload(
+                db=db_session,
+                upload_id=upload_id,
+                final_checksum=hashlib.sha256(original).hexdigest(),
+                user_id=user_id
+            )
+        await db_session.rollback()
+        await FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=1,
+            chunk_data=original[20:],
+            filename="resent.bin",
+            total_chunks=2,
+            checksum=hashlib.sha256(original[20:]).hexdigest()
+        )
+
+        file_record = await FileService.complete_upload(
+            db=db_session,
+            upload_id=upload_id,
+            final_checksum=hashlib.sha256(original).hexdigest(),
+            user_id=user_id
         )
-        chunks = result.scalars().all()
-        assert len(chunks) == 0
+        file_id = file_record.id
+
+        assert file_record.checksum_verified is False
+        assert file_record.blob_id is None
+        assert await FileService.verify_checksum(db_session, file_id) is False
+
+    async def test_duplicate_uploads_share_blob(self, db_session: AsyncSession, test_user: User):
+        """Test identical uploads reference one blob until the last is purged"""
+        data = os.urandom(64)
+        checksum = hashlib.sha256(data).hexdigest()
+
+        file_records = []
+        for filename in ("first.bin", "second.bin"):
+            upload_id, _ = await FileService.initialize_upload(
+                db=db_session,
+                filename=filename,
+                file_size=len(data),
+                user_id=test_user.id
+            )
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=0,
+                chunk_data=data,
+                filename=filename,
+                total_chunks=1,
+                checksum=checksum
+            )
+            file_records.append(await FileService.complete_upload(
+                db=db_session,
+                upload_id=upload_id,
+                final_checksum=checksum,
+                user_id=test_user.id
+            ))
+
+        first, second = file_records
+        assert first.blob_id == second.blob_id
+        assert first.filepath == second.filepath == FileService.get_blob_path(checksum)
+        blob = await db_session.get(Blob, first.blob_id)
+        assert blob.ref_count == 2
+
+        # Soft delete and restore leave shared content in place
+        await FileService.soft_delete_file(db_session, first.id, test_user.id)
+        await FileService.restore_file(db_session, first.id)
+        await FileService.soft_delete_file(db_session, first.id, test_user.id)
+        assert first.filepath == blob.storage_path
+        assert os.path.exists(blob.storage_path)
+
+        # Purging one reference keeps the blob
+        first.deleted_at = datetime.utcnow() - timedelta(days=365)
+        await db_session.commit()
+        assert await FileService.cleanup_old_deleted_files(db_session) == 1
+        await db_session.refresh(blob)
+        assert blob.ref_count == 1
+        assert Path(blob.storage_path).read_bytes() == data
+
+        # Purging the last reference removes the blob and its content
+        await FileService.soft_delete_file(db_session, second.id, test_user.id)
+        second.deleted_at = datetime.utcnow() - timedelta(days=365)
+        await db_session.commit()
+        assert await FileService.cleanup_old_deleted_files(db_session) == 1
+        db_session.expunge_all()
+        assert await db_session.get(Blob, blob.id) is None
+        assert not os.path.exists(FileService.get_blob_path(checksum))
+
+    async def test_instant_upload(self, db_session: AsyncSession, test_user: User):
+        """Test known content creates a file without sending chunks"""
+        data = os.urandom(32)
+        checksum = hashlib.sha256(data).hexdigest()
+
+        # Nothing stored yet
+        assert await FileService.instant_upload(
+            db_session, "copy.bin", len(data), checksum, test_user.id
+        ) is None
+
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="original.bin",
+            file_size=len(data),
+            user_id=test_user.id
+        )
+        await FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=0,
+            chunk_data=data,
+            filename="original.bin",
+            total_chunks=1,
+            checksum=checksum
+        )
+        original = await FileService.complete_upload(
+            db=db_session,
+            upload_id=upload_id,
+            final_checksum=checksum,
+            user_id=test_user.id
+        )
+
+        # A size mismatch is not a match
+        assert await FileService.instant_upload(
+            db_session, "copy.bin", len(data) + 1, checksum, test_user.id
+        ) is None
+
+        copy = await FileService.instant_upload(
+            db_session, "copy.bin", len(data), checksum, test_user.id
+        )
+        assert copy is not None
+        assert copy.filename == "copy.bin"
+        assert copy.blob_id == original.blob_id
+        assert copy.filepath == original.filepath
+        assert copy.checksum_verified is True
+
+        blob = await db_session.get(Blob, original.blob_id)
+        await db_session.refresh(blob)
+        assert blob.ref_count == 2
+
+        manifest = await FileService.get_manifest(db_session, copy.id)
+        assert manifest.chunk_checksums == [checksum]
+
+    async def test_apply_delta(self, db_session: AsyncSession, test_user: User, create_test_file, monkeypatch):
+        """Test a new revision is rebuilt from the base file and a delta, with a chunk manifest"""
+        from app.config import settings
+        from app.utils.delta import compute_delta
+        from app.utils.file_utils import compute_tree_hash
+
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 5000)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 5000)
+        base_data = os.urandom(2048 * 8 + 500)
+        base_path = create_test_file("revision.bin", base_data)
+        base = File(
+            filename="revision.bin",
+            filepath=str(base_path),
+            size=len(base_data),
+            checksum=hashlib.sha256(base_data).hexdigest(),
+            uploaded_by=test_user.id,
+            is_deleted=False
+        )
+        db_session.add(base)
+        await db_session.commit()
+        base_id, user_id = base.id, test_user.id
+
+        signature = await FileService.get_signature(db_session, base_id, block_size=2048)
+        target = base_data[:5000] + b"edited" + base_data[6000:]
+        delta = compute_delta(signature, target)
+        assert len(delta) < len(target) // 2
+
+        revision = await FileService.apply_delta(
+            db=db_session,
+            base_file_id=base_id,
+            delta=delta,
+            filename="revision.bin",
+            user_id=user_id
+        )
+
+        assert revision.id != base_id
+        assert revision.size == len(target)
+        assert revision.checksum == hashlib.sha256(target).hexdigest()
+        assert revision.checksum_verified is True
+        assert revision.blob_id is not None
+        assert Path(revision.filepath).read_bytes() == target
+        assert Path(base_path).read_bytes() == base_data
+
+        chunk_checksums = [hashlib.sha256(target[i:i + 5000]).hexdigest() for i in range(0, len(target), 5000)]
+        manifest = await FileService.get_manifest(db_session, revision.id)
+        assert manifest.chunk_size == 5000
+        assert manifest.chunk_checksums == chunk_checksums
+        assert manifest.tree_hash == compute_tree_hash(chunk_checksums)
+
+        # A delta whose result does not match its declared checksum is rejected
+        corrupt = bytearray(delta)
+        corrupt[-2] ^= 0xFF
+        with pytest.raises(ValueError, match="checksum mismatch"):
+            await FileService.apply_delta(
+                db=db_session,
+                base_file_id=base_id,
+                delta=bytes(corrupt),
+                filename="revision.bin",
+                user_id=user_id
+            )
+
+    async def test_apply_delta_disk_full(self, db_session: AsyncSession, test_file: File, test_user: User, monkeypatch):
+        """Test running out of space while preallocating a revision leaves no file behind"""
+        import errno
+        from app.config import settings
+        from app.utils.delta import compute_delta
+
+        async def preallocate_file(path, size):
+            open(path, "wb").close()
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        monkeypatch.setattr("app.services.file_service.preallocate_file", preallocate_file)
+        file_id, user_id = test_file.id, test_user.id
+        signature = await FileService.get_signature(db_session, file_id)
+
+        with pytest.raises(InsufficientStorageError):
+            await FileService.apply_delta(
+                db=db_session,
+                base_file_id=file_id,
+                delta=compute_delta(signature, b"This is a new test file content"),
+                filename="revision.txt",
+                user_id=user_id
+            )
+        assert [name for name in os.listdir(settings.TEMP_FILES_PATH) if name.endswith(".delta")] == []
+
+    async def test_compressible_upload_stored_compressed(self, db_session: AsyncSession, test_user: User):
+        """Test text content is stored raw at upload, then compressed in place and reads back unchanged"""
+        from app.utils.compression import CODEC_IDENTITY, CODEC_ZLIB, open_stored_file
+        from app.utils.delta import compute_delta
+
+        data = b"".join(b"%06d,reading,%d\n" % (i, i % 97) for i in range(20000))
+        checksum = hashlib.sha256(data).hexdigest()
+
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="readings.csv",
+            file_size=len(data),
+            user_id=test_user.id,
+            mime_type="text/csv"
+        )
+        await FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=0,
+            chunk_data=data,
+            filename="readings.csv",
+            total_chunks=1,
+            checksum=checksum
+        )
+        file_record = await FileService.complete_upload(
+            db=db_session,
+            upload_id=upload_id,
+            final_checksum=checksum,
+            user_id=test_user.id
+        )
+        file_id, user_id, blob_id, raw_path = file_record.id, test_user.id, file_record.blob_id, file_record.filepath
+
+        assert await FileService.get_storage_codec(db_session, file_record) == CODEC_IDENTITY
+        assert await FileService.list_uncompressed_blobs(db_session, 10) == [blob_id]
+
+        assert await FileService.compress_blob(db_session, blob_id) is True
+        assert await FileService.compress_blob(db_session, blob_id) is False
+        assert await FileService.list_uncompressed_blobs(db_session, 10) == []
+        assert not os.path.exists(raw_path)
+        await db_session.refresh(file_record)
+        assert file_record.filepath != raw_path
+
+        assert await FileService.get_storage_codec(db_session, file_record) == CODEC_ZLIB
+        storage = await FileService.get_storage_info(db_session, file_id)
+        assert storage["codec"] == CODEC_ZLIB
+        assert storage["size"] == len(data)
+        assert storage["stored_size"] == os.path.getsize(file_record.filepath)
+        assert storage["compression_ratio"] < 0.5
+        assert storage["compression_seconds"] is not None
+        with open_stored_file(file_record.filepath, CODEC_ZLIB) as reader:
+            assert reader.pread(len(data), 0) == data
+
+        # Delta uploads read the compressed base transparently
+        signature = await FileService.get_signature(db_session, file_id)
+        target = data[:100000] + b"inserted\n" + data[100000:]
+        revision = await FileService.apply_delta(
+            db=db_session,
+            base_file_id=file_id,
+            delta=compute_delta(signature, target),
+            filename="readings.csv",
+            user_id=user_id
+        )
+        assert revision.checksum == hashlib.sha256(target).hexdigest()
+
+        assert await FileService.get_storage_info(db_session, uuid.uuid4()) is None
+
+    async def test_incompressible_blob_stays_raw(self, db_session: AsyncSession, test_user: User):
+        """Test content not worth compressing is only marked as considered"""
+        from app.utils.compression import CODEC_IDENTITY
+
+        data = os.urandom(200000)
+        checksum = hashlib.sha256(data).hexdigest()
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="noise.txt",
+            file_size=len(data),
+            user_id=test_user.id,
+            mime_type="text/plain"
+        )
+        await FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=0,
+            chunk_data=data,
+            filename="noise.txt",
+            total_chunks=1,
+            checksum=checksum
+        )
+        file_record = await FileService.complete_upload(
+            db=db_session,
+            upload_id=upload_id,
+            final_checksum=checksum,
+            user_id=test_user.id
+        )
+        blob_id, raw_path = file_record.blob_id, file_record.filepath
+
+        assert await FileService.compress_blob(db_session, blob_id) is False
+        assert await FileService.list_uncompressed_blobs(db_session, 10) == []
+        assert await FileService.get_storage_codec(db_session, file_record) == CODEC_IDENTITY
+        assert os.path.exists(raw_path)
+        assert [name for name in os.listdir(os.path.dirname(raw_path)) if name.endswith(".tmp")] == []
+
+    async def test_complete_upload_final_checksum_mismatch(self, db_session: AsyncSession, test_user: User):
+        """Test a wrong final checksum is rejected when chunks arrived in order"""
+        chunk_data = b"Only chunk"
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="mismatch.txt",
+            file_size=len(chunk_data),
+            user_id=test_user.id
+        )
+        await FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=0,
+            chunk_data=chunk_data,
+            filename="mismatch.txt",
+            total_chunks=1,
+            checksum=hashlib.sha256(chunk_data).hexdigest()
+        )
+
+        with pytest.raises(ValueError, match="checksum mismatch"):
+            await FileService.complete_upload(
+                db=db_session,
+                upload_id=upload_id,
+                filename="mismatch.txt",
+                final_checksum="0" * 64,
+                user_id=test_user.id
+            )
+
+    async def test_link_file_across_filesystems(self, tmp_path, monkeypatch):
+        """Test a cross-device link is copied in the I/O pool and never replaces an existing file"""
+        import errno
+        from app.utils import file_utils
+
+        real_link = os.link
+        pooled = []
+
+        def link(src, dst):
+            if not src.endswith(".tmp"):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            real_link(src, dst)
+
+        async def run(fn, *args):
+            pooled.append(fn.__name__)
+            return fn(*args)
+
+        monkeypatch.setattr(os, "link", link)
+        monkeypatch.setattr(file_utils.io_pool, "run", run)
+        src = tmp_path / "src.bin"
+        src.write_bytes(b"content")
+
+        assert await file_utils.link_file(str(src), str(tmp_path / "dst.bin")) is True
+        assert (tmp_path / "dst.bin").read_bytes() == b"content"
+        assert pooled == ["_copy_synced"]
+
+        src.write_bytes(b"other")
+        assert await file_utils.link_file(str(src), str(tmp_path / "dst.bin")) is False
+        assert (tmp_path / "dst.bin").read_bytes() == b"content"
+        assert sorted(os.listdir(tmp_path)) == ["dst.bin", "src.bin"]
+
+    async def test_move_file_across_filesystems(self, tmp_path, monkeypatch):
+        """Test a cross-device move copies in the I/O pool and renames the copy into place"""
+        import errno
+        from app.utils import file_utils
+
+        real_replace = os.replace
+        pooled = []
+
+        def replace(src, dst):
+            if not src.endswith(".tmp"):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            real_replace(src, dst)
+
+        async def run(fn, *args):
+            pooled.append(fn.__name__)
+            return fn(*args)
+
+        monkeypatch.setattr(os, "replace", replace)
+        monkeypatch.setattr(file_utils.io_pool, "run", run)
+        src = tmp_path / "src.bin"
+        src.write_bytes(b"content")
+
+        await file_utils.move_file(str(src), str(tmp_path / "dst.bin"))
+
+        assert (tmp_path / "dst.bin").read_bytes() == b"content"
+        assert pooled == ["_copy_synced"]
+        assert os.listdir(tmp_path) == ["dst.bin"]
+
+    def test_compute_tree_hash(self):
+        """Test tree hash construction over chunk digests"""
+        from app.utils.file_utils import compute_tree_hash
+
+        digests = [hashlib.sha256(bytes([i])).hexdigest() for i in range(3)]
+        leaves = [bytes.fromhex(d) for d in digests]
+        left = hashlib.sha256(b"\x01" + leaves[0] + leaves[1]).digest()
+        expected = hashlib.sha256(b"\x01" + left + leaves[2]).hexdigest()
+
+        assert compute_tree_hash(digests[:1]) == digests[0]
+        assert compute_tree_hash(digests) == expected
+
+    async def test_upload_session_tracks_missing_chunks(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test the upload session bitmap records received chunks for resuming"""
+        from app.config import settings
+        from app.utils.bitmap import count_bits, missing_ranges
+
+        data = os.urandom(100)
+        monkeypatch.setattr(settings, "MIN_CHUNK_SIZE", 20)
+        monkeypatch.setattr(settings, "MAX_CHUNK_SIZE", 20)
+
+        upload_id, chunk_size = await FileService.initialize_upload(
+            db=db_session,
+            filename="resume.bin",
+            file_size=len(data),
+            user_id=test_user.id
+        )
+
+        # Chunk 2 twice: a retransmission must not be counted again
+        for chunk_number in (1, 2, 2, 4):
+            chunk_data = data[chunk_number * chunk_size:(chunk_number + 1) * chunk_size]
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=chunk_number,
+                chunk_data=chunk_data,
+                filename="resume.bin",
+                total_chunks=5,
+                checksum=hashlib.sha256(chunk_data).hexdigest(),
+                user_id=test_user.id
+            )
+
+        upload_session = await FileService.get_upload_session(db_session, upload_id, test_user.id)
+        assert upload_session.filename == "resume.bin"
+        assert count_bits(upload_session.received_chunks) == 3
+        assert upload_session.bytes_received == 3 * chunk_size
+        assert missing_ranges(upload_session.received_chunks, 5) == [(0, 0), (3, 3)]
+
+        with pytest.raises(ValueError, match="Expected 5 chunks"):
+            await FileService.complete_upload(
+                db=db_session,
+                upload_id=upload_id,
+                final_checksum=hashlib.sha256(data).hexdigest(),
+                user_id=test_user.id
+            )
+
+    async def test_upload_chunk_cancelled_mid_write(self, db_session: AsyncSession, test_user: User, monkeypatch):
+        """Test a cancelled chunk upload keeps its fd open until the pending write ends"""
+        import asyncio
+        import time
+        from app.utils.io_pool import io_pool
+
+        chunk_data = os.urandom(4096)
+        started = asyncio.Event()
+        errors = []
+
+        def slow_pwrite(fd, data, offset):
+            time.sleep(0.2)
+            try:
+                os.pwrite(fd, data, offset)
+            except OSError as e:
+                errors.append(e)
+
+        async def slow_write_at(fd, data, offset, hashers=()):
+            started.set()
+            await io_pool.run(slow_pwrite, fd, data, offset)
+
+        monkeypatch.setattr("app.services.file_service.write_at", slow_write_at)
+
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="cancelled.bin",
+            file_size=len(chunk_data),
+            user_id=test_user.id
+        )
+        upload = asyncio.create_task(FileService.upload_chunk(
+            db=db_session,
+            upload_id=upload_id,
+            chunk_number=0,
+            chunk_data=chunk_data,
+            filename=None,
+            total_chunks=None,
+            checksum=hashlib.sha256(chunk_data).hexdigest()
+        ))
+        await started.wait()
+        upload.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await upload
+        await asyncio.sleep(0.4)
+
+        assert errors == []
+        assert Path(FileService.get_upload_path(upload_id)).read_bytes() == chunk_data
+
+    async def test_upload_chunk_other_user(self, db_session: AsyncSession, test_user: User, admin_user: User):
+        """Test chunks cannot be added to another user's upload"""
+        chunk_data = b"Not yours"
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="private.txt",
+            file_size=len(chunk_data),
+            user_id=test_user.id
+        )
+
+        assert await FileService.get_upload_session(db_session, upload_id, admin_user.id) is None
+
+        with pytest.raises(ValueError, match="Upload not found"):
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=0,
+                chunk_data=chunk_data,
+                filename="private.txt",
+                total_chunks=1,
+                checksum=hashlib.sha256(chunk_data).hexdigest(),
+                user_id=admin_user.id
+            )
+
+    async def test_upload_chunk_size_mismatch(self, db_session: AsyncSession, test_user: User):
+        """Test a chunk shorter than its slot of the file is rejected"""
+        upload_id, _ = await FileService.initialize_upload(
+            db=db_session,
+            filename="short.bin",
+            file_size=1000,
+            user_id=test_user.id
+        )
+
+        chunk_data = b"too short"
+        with pytest.raises(ValueError, match="size mismatch"):
+            await FileService.upload_chunk(
+                db=db_session,
+                upload_id=upload_id,
+                chunk_number=0,
+                chunk_data=chunk_data,
+                filename="short.bin",
+                total_chunks=1,
+                checksum=hashlib.sha256(chunk_data).hexdigest()
+            )
 
     async def test_cancel_upload(self, db_session: AsyncSession, test_user: User):
         """Test upload cancellation cleans up chunks"""
+        chunk_data = b"Test chunk to be cancelled"
         upload_id, _ = await FileService.initialize_upload(
             db=db_session,
             filename="cancel_test.pdf",
-            file_size=100000,
-            total_chunks=3,
+            file_size=len(chunk_data),
             user_id=test_user.id
         )
 
         # Upload a chunk
-        chunk_data = b"Test chunk to be cancelled"
         checksum = hashlib.sha256(chunk_data).hexdigest()
         await FileService.upload_chunk(
             db=db_session,
             upload_id=upload_id,
-            chunk_number=1,
+            chunk_number=0,
             chunk_data=chunk_data,
             filename="cancel_test.pdf",
-            total_chunks=3,
+            total_chunks=1,
             checksum=checksum
         )
 
@@ -213,12 +1043,8 @@ class TestFileService:
 
         assert result is True
 
-        # Verify chunks were deleted
-        db_result = await db_session.execute(
-            select(UploadChunk).where(UploadChunk.upload_id == upload_id)
-        )
-        chunks = db_result.scalars().all()
-        assert len(chunks) == 0
+        assert await FileService.get_upload_session(db_session, upload_id) is None
+        assert not os.path.exists(FileService.get_upload_path(upload_id))
 
     async def test_list_files_default(self, db_session: AsyncSession, test_file: File):
         """Test listing files with default parameters"""
@@ -457,47 +1283,43 @@ class TestFileService:
         assert duplicate is not None
         assert duplicate.id == deleted_file.id
 
-    async def test_cleanup_expired_chunks(self, db_session: AsyncSession):
-        """Test cleanup of expired upload chunks"""
-        # Create expired chunk
-        upload_id = uuid.uuid4()
-        expired_chunk = UploadChunk(
-            upload_id=upload_id,
-            filename="expired.pdf",
-            total_chunks=2,
-            chunk_number=1,
-            chunk_size=1000,
-            checksum="abc123",
-            expires_at=datetime.utcnow() - timedelta(hours=25),  # Expired
-            file_path="/tmp/chunk_1"
-        )
-        db_session.add(expired_chunk)
-
-        # Create valid chunk
-        valid_upload_id = uuid.uuid4()
-        valid_chunk = UploadChunk(
-            upload_id=valid_upload_id,
-            filename="valid.pdf",
-            total_chunks=2,
-            chunk_number=1,
-            chunk_size=1000,
-            checksum="def456",
-            expires_at=datetime.utcnow() + timedelta(hours=1),  # Still valid
-            file_path="/tmp/chunk_2"
-        )
-        db_session.add(valid_chunk)
+    async def test_cleanup_expired_chunks(self, db_session: AsyncSession, test_user: User, temp_storage_dirs: dict):
+        """Test cleanup of expired upload sessions"""
+        from app.utils.bitmap import new_bitmap
+
+        def make_session(expires_at):
+            return UploadSession(
+                id=uuid.uuid4(),
+                user_id=test_user.id,
+                filename="upload.pdf",
+                file_size=2000,
+                chunk_size=1000,
+                total_chunks=2,
+                received_chunks=new_bitmap(2),
+                chunk_checksums=[None, None],
+                bytes_received=0,
+                expires_at=expires_at
+            )
+
+        # Create expired session with a partially written file
+        expired_session = make_session(datetime.utcnow() - timedelta(hours=25))
+        valid_session = make_session(datetime.utcnow() + timedelta(hours=1))
+        db_session.add_all([expired_session, valid_session])
         await db_session.commit()
 
+        for upload_session in (expired_session, valid_session):
+            Path(FileService.get_upload_path(upload_session.id)).write_bytes(b"partial")
+
         # Run cleanup
         count = await FileService.cleanup_expired_chunks(db_session)
 
         assert count == 1
 
-        # Verify only valid chunk remains
-        result = await db_session.execute(select(UploadChunk))
-        remaining_chunks = result.scalars().all()
-        assert len(remaining_chunks) == 1
-        assert remaining_chunks[0].upload_id == valid_upload_id
+        # Verify only the valid session and its file remain
+        result = await db_session.execute(select(UploadSession.id))
+        assert result.scalars().all() == [valid_session.id]
+        assert not os.path.exists(FileService.get_upload_path(expired_session.id))
+        assert os.path.exists(FileService.get_upload_path(valid_session.id))
 
     async def test_cleanup_old_deleted_files(self, db_session: AsyncSession, test_user: User, create_test_file):
         """Test cleanup of files past retention period"""
@@ -0,0 +1,213 @@
+"""
+Tests for HTTP download helpers and ranged downloads
+
+Tests cover:
+- Range header parsing, merging and unsatisfiable ranges
+- If-Range validation by entity tag and date
+- multipart/byteranges framing and length
+- Single-range, multi-range, If-Range and 416 download responses
+- If-None-Match and If-Modified-Since evaluation
+- 304 and HEAD responses for downloads, weak ETags for metadata
+"""
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+
+from app.models.file import File
+from app.utils.http_utils import (
+    MultipartByteranges,
+    RangeNotSatisfiable,
+    etag_matches,
+    http_date,
+    if_range_matches,
+    is_not_modified,
+    parse_range_header,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestHttpUtils:
+    """Test Range and If-Range handling"""
+
+    async def test_parse_range_header(self):
+        """Test byte ranges are clamped, merged and sorted"""
+        assert parse_range_header("bytes=0-99", 1000) == [(0, 99)]
+        assert parse_range_header("bytes=900-", 1000) == [(900, 999)]
+        assert parse_range_header("bytes=-100", 1000) == [(900, 999)]
+        assert parse_range_header("bytes=-5000", 1000) == [(0, 999)]
+        assert parse_range_header("bytes=990-2000", 1000) == [(990, 999)]
+        assert parse_range_header("bytes=500-599, 0-9, 10-19, 550-700", 1000) == [(0, 19), (500, 700)]
+        # Unsatisfiable parts are dropped while others remain
+        assert parse_range_header("bytes=2000-3000, 0-0", 1000) == [(0, 0)]
+
+    async def test_parse_range_header_invalid(self):
+        """Test malformed headers are ignored and unsatisfiable ones rejected"""
+        assert parse_range_header("items=0-1", 1000) is None
+        assert parse_range_header("bytes=5-1", 1000) is None
+        assert parse_range_header("bytes=abc", 1000) is None
+        assert parse_range_header("bytes=-", 1000) is None
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header("bytes=1000-", 1000)
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header("bytes=0-10", 0)
+
+    async def test_if_range_matches(self):
+        """Test If-Range uses strong entity tag or exact date comparison"""
+        modified = datetime(2026, 1, 2, 3, 4, 5, 678)
+        assert if_range_matches(None, '"abc"', modified)
+        assert if_range_matches('"abc"', '"abc"', modified)
+        assert not if_range_matches('"abd"', '"abc"', modified)
+        assert not if_range_matches('W/"abc"', '"abc"', modified)
+        assert if_range_matches(http_date(modified), '"abc"', modified)
+        assert not if_range_matches("Fri, 02 Jan 2026 03:04:04 GMT", '"abc"', modified)
+        assert not if_range_matches("not a date", '"abc"', modified)
+
+    async def test_is_not_modified(self):
+        """Test If-None-Match wins over If-Modified-Since and compares weakly"""
+        modified = datetime(2026, 1, 2, 3, 4, 5, 678)
+        assert etag_matches('"x", W/"abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches('"abcd"', 'W/"abc"')
+        assert is_not_modified('"abc"', None, '"abc"', modified)
+        assert not is_not_modified('"old"', http_date(modified), '"abc"', modified)
+        assert is_not_modified(None, http_date(modified), '"abc"', modified)
+        assert is_not_modified(None, "Sat, 03 Jan 2026 00:00:00 GMT", '"abc"', modified)
+        assert not is_not_modified(None, "Thu, 01 Jan 2026 00:00:00 GMT", '"abc"', modified)
+        assert not is_not_modified(None, http_date(modified), '"abc"')
+        assert not is_not_modified(None, None, '"abc"', modified)
+
+    async def test_multipart_byteranges(self):
+        """Test multipart bodies frame each range and match their declared length"""
+        data = bytes(range(256)) * 4
+
+        async def read_range(start, end):
+            yield data[start:end]
+
+        body = MultipartByteranges([(0, 9), (100, 199)], len(data), "application/octet-stream", read_range)
+        content = b"".join([piece async for piece in body])
+
+        assert len(content) == body.content_length
+        assert body.content_type == f"multipart/byteranges; boundary={body.boundary}"
+        assert b"Content-Range: bytes 0-9/1024\r\n\r\n" + data[0:10] + b"\r\n" in content
+        assert b"Content-Range: bytes 100-199/1024\r\n\r\n" + data[100:200] + b"\r\n" in content
+        assert content.endswith(f"--{body.boundary}--\r\n".encode())
+
+
+class TestRangeDownloads:
+    """Test ranged downloads through the API"""
+
+    async def test_download_full_file(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test a plain download advertises ranges and its validator"""
+        response = await client.get(f"/api/v1/files/{test_file.id}/download", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.content == b"This is a test file content"
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["etag"] == f'"{test_file.checksum}"'
+
+    async def test_download_range(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test resuming a download from an offset"""
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}/download",
+            headers={**auth_headers, "Range": "bytes=10-", "If-Range": f'"{test_file.checksum}"'}
+        )
+
+        assert response.status_code == 206
+        assert response.content == b"test file content"
+        assert response.headers["content-range"] == "bytes 10-26/27"
+
+    async def test_download_multiple_ranges(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test several ranges come back as multipart/byteranges"""
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}/download",
+            headers={**auth_headers, "Range": "bytes=0-3,-7"}
+        )
+
+        assert response.status_code == 206
+        assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert b"Content-Range: bytes 0-3/27\r\n\r\nThis\r\n" in response.content
+        assert b"Content-Range: bytes 20-26/27\r\n\r\ncontent\r\n" in response.content
+
+    async def test_download_stale_if_range(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test a changed validator gets the whole file instead of a partial one"""
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}/download",
+            headers={**auth_headers, "Range": "bytes=10-", "If-Range": '"stale"'}
+        )
+
+        assert response.status_code == 200
+        assert response.content == b"This is a test file content"
+
+    async def test_download_unsatisfiable_range(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test a range past the end is rejected with the file size"""
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}/download",
+            headers={**auth_headers, "Range": "bytes=100-"}
+        )
+
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */27"
+
+
+class TestConditionalRequests:
+    """Test conditional and HEAD requests through the API"""
+
+    async def test_download_not_modified(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test a matching ETag or date gets 304 without a body"""
+        url = f"/api/v1/files/{test_file.id}/download"
+        response = await client.get(url, headers={**auth_headers, "If-None-Match": f'"{test_file.checksum}"'})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == f'"{test_file.checksum}"'
+
+        response = await client.get(
+            url,
+            headers={**auth_headers, "If-Modified-Since": http_date(test_file.upload_date)}
+        )
+        assert response.status_code == 304
+
+        response = await client.get(url, headers={**auth_headers, "If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert response.content == b"This is a test file content"
+
+    async def test_download_head(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test HEAD returns the download headers without the body"""
+        response = await client.head(f"/api/v1/files/{test_file.id}/download", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["content-length"] == "27"
+        assert response.headers["etag"] == f'"{test_file.checksum}"'
+        assert response.headers["accept-ranges"] == "bytes"
+
+    async def test_metadata_weak_etag(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test file metadata carries a weak ETag and revalidates to 304"""
+        response = await client.get(f"/api/v1/files/{test_file.id}", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["filename"] == test_file.filename
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"')
+
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}",
+            headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+
+        await client.put(
+            f"/api/v1/files/{test_file.id}/rename",
+            json={"new_filename": "renamed.txt"},
+            headers=auth_headers
+        )
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}",
+            headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
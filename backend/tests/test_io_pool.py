@@ -0,0 +1,104 @@
+"""
+Tests for the shared hashing and file I/O pool
+
+Tests cover:
+- Running jobs and reporting queue depth
+- Windowed file checksums
+- CRC-32 computed in the same pass as the digest
+- Hashing alongside positional writes
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import zlib
+
+import pytest
+
+from app.utils.io_pool import IOPool
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestIOPool:
+    """Test the I/O pool and the file utilities running on it"""
+
+    async def test_run_reports_queue_depth(self):
+        """Test jobs beyond the worker count queue up and are counted"""
+        pool = IOPool(max_workers=1)
+        gate = threading.Event()
+
+        try:
+            first = asyncio.ensure_future(pool.run(gate.wait))
+            second = asyncio.ensure_future(pool.run(lambda x: x * 2, 21))
+            await asyncio.sleep(0.05)
+
+            stats = pool.stats()
+            assert stats["active"] == 1
+            assert stats["queue_depth"] == 1
+
+            gate.set()
+            assert await second == 42
+            await first
+
+            stats = pool.stats()
+            assert stats["queue_depth"] == 0
+            assert stats["completed"] == 2
+            assert stats["max_queue_depth"] >= 1
+        finally:
+            gate.set()
+            pool.shutdown()
+
+    async def test_calculate_checksum_windows(self, tmp_path, monkeypatch):
+        """Test file checksums are identical across memory-map windows"""
+        from app.config import settings
+        from app.utils.file_utils import calculate_checksum
+
+        monkeypatch.setattr(settings, "HASH_WINDOW_SIZE", 4096)
+
+        data = os.urandom(4096 * 3 + 17)
+        path = tmp_path / "data.bin"
+        path.write_bytes(data)
+        assert await calculate_checksum(str(path)) == hashlib.sha256(data).hexdigest()
+
+        empty = tmp_path / "empty.bin"
+        empty.write_bytes(b"")
+        assert await calculate_checksum(str(empty)) == hashlib.sha256(b"").hexdigest()
+
+    async def test_calculate_checksum_and_crc32(self, tmp_path, monkeypatch):
+        """Test the digest and CRC-32 come from the same pass over the file"""
+        from app.config import settings
+        from app.utils.file_utils import Crc32, calculate_checksum_and_crc32
+
+        monkeypatch.setattr(settings, "HASH_WINDOW_SIZE", 4096)
+
+        data = os.urandom(4096 * 2 + 5)
+        path = tmp_path / "data.bin"
+        path.write_bytes(data)
+        assert await calculate_checksum_and_crc32(str(path)) == (hashlib.sha256(data).hexdigest(), zlib.crc32(data))
+
+        crc = Crc32()
+        crc.update(data[:100])
+        copy = crc.copy()
+        crc.update(data[100:])
+        assert crc.value == zlib.crc32(data)
+        assert copy.value == zlib.crc32(data[:100])
+
+    async def test_write_at_updates_hashers(self, tmp_path):
+        """Test positional writes feed hashers in the same job"""
+        from app.utils.file_utils import write_at
+
+        path = tmp_path / "out.bin"
+        path.write_bytes(b"\0" * 8)
+        sha256 = hashlib.sha256()
+
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            await write_at(fd, b"5678", 4, (sha256,))
+            await write_at(fd, b"1234", 0)
+        finally:
+            os.close(fd)
+
+        assert path.read_bytes() == b"12345678"
+        assert sha256.hexdigest() == hashlib.sha256(b"5678").hexdigest()
@@ -0,0 +1,184 @@
+"""
+Tests for signed download URLs
+
+Tests cover:
+- Signature verification, expiry and IP binding
+- Client addresses taken from X-Forwarded-For only behind trusted proxies
+- Deleted files no longer served
+- Creating signed URLs and downloading through them without authentication
+- Signed downloads served from the caches without a file lookup
+"""
+import time
+import uuid
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.models.file import File
+from app.services.file_service import FileService
+from app.utils.security import sign_download, verify_download_signature
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestDownloadSignatures:
+    """Test signing and verifying download URLs"""
+
+    async def test_verify(self):
+        """Test only the signed values, before expiry and from the bound IP, verify"""
+        file_id, user_id = uuid.uuid4(), uuid.uuid4()
+        expires = int(time.time()) + 60
+        signature = sign_download(file_id, "a" * 64, user_id, expires)
+
+        assert verify_download_signature(signature, file_id, "a" * 64, user_id, expires, None, "10.0.0.1")
+        assert not verify_download_signature(signature, file_id, "b" * 64, user_id, expires, None, "10.0.0.1")
+        assert not verify_download_signature(signature, file_id, "a" * 64, uuid.uuid4(), expires, None, "10.0.0.1")
+        assert not verify_download_signature(signature, file_id, "a" * 64, user_id, expires + 1, None, "10.0.0.1")
+
+        expired = int(time.time()) - 1
+        signature = sign_download(file_id, "a" * 64, user_id, expired)
+        assert not verify_download_signature(signature, file_id, "a" * 64, user_id, expired, None, "10.0.0.1")
+
+        signature = sign_download(file_id, "a" * 64, user_id, expires, "10.0.0.1")
+        assert verify_download_signature(signature, file_id, "a" * 64, user_id, expires, "10.0.0.1", "10.0.0.1")
+        assert not verify_download_signature(signature, file_id, "a" * 64, user_id, expires, "10.0.0.1", "10.0.0.2")
+        assert not verify_download_signature(signature, file_id, "a" * 64, user_id, expires, None, "10.0.0.1")
+
+
+class TestSignedDownloads:
+    """Test the signed URL endpoints"""
+
+    async def test_signed_download(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        monkeypatch
+    ):
+        """Test a signed URL downloads without authentication, then without a file lookup"""
+        response = await client.post(
+            f"/api/v1/files/{test_file.id}/signed-url",
+            params={"expires_in": 600},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        url = response.json()["url"]
+        assert response.json()["bound_ip"] is None
+
+        response = await client.get(url)
+        assert response.status_code == 200
+        assert response.content == b"This is a test file content"
+        assert response.headers["etag"] == f'"{test_file.checksum}"'
+
+        async def no_lookup(*args, **kwargs):
+            raise AssertionError("file looked up")
+
+        monkeypatch.setattr(FileService, "get_file", no_lookup)
+        response = await client.get(url, headers={"Range": "bytes=0-3"})
+        assert response.status_code == 206
+        assert response.content == b"This"
+
+        response = await client.get(url.replace("signature=", "signature=x"))
+        assert response.status_code == 403
+
+    async def test_signed_download_bound_ip(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File
+    ):
+        """Test an IP-bound URL is bound to the peer address, whatever X-Forwarded-For says"""
+        response = await client.post(
+            f"/api/v1/files/{test_file.id}/signed-url",
+            params={"bind_ip": True},
+            headers={**auth_headers, "X-Forwarded-For": "203.0.113.7"}
+        )
+        assert response.json()["bound_ip"] == "127.0.0.1"
+
+        response = await client.get(response.json()["url"], headers={"X-Forwarded-For": "198.51.100.1"})
+        assert response.status_code == 200
+
+    async def test_signed_download_spoofed_ip(
+        self,
+        client: AsyncClient,
+        test_file: File,
+        test_user,
+        monkeypatch
+    ):
+        """Test a spoofed X-Forwarded-For is rejected unless it comes through a trusted proxy"""
+        expires = int(time.time()) + 60
+        params = {
+            "checksum": test_file.checksum,
+            "user": str(test_user.id),
+            "expires": expires,
+            "ip": "203.0.113.7",
+            "signature": sign_download(test_file.id, test_file.checksum, test_user.id, expires, "203.0.113.7")
+        }
+        url = f"/api/v1/files/{test_file.id}/signed"
+
+        response = await client.get(url, params=params, headers={"X-Forwarded-For": "203.0.113.7"})
+        assert response.status_code == 403
+
+        monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["127.0.0.0/8", "10.0.0.0/8"])
+        response = await client.get(url, params=params, headers={"X-Forwarded-For": "203.0.113.7, 10.1.2.3"})
+        assert response.status_code == 200
+
+        # Only the right-most untrusted hop counts; the client controls everything left of it
+        response = await client.get(url, params=params, headers={"X-Forwarded-For": "203.0.113.7, 198.51.100.1"})
+        assert response.status_code == 403
+
+    async def test_signed_download_deleted(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        deleted_file: File,
+        test_user
+    ):
+        """Test signed URLs stop working once their file is deleted"""
+        response = await client.post(f"/api/v1/files/{test_file.id}/signed-url", headers=auth_headers)
+        url = response.json()["url"]
+        assert (await client.get(url)).status_code == 200
+
+        response = await client.delete(f"/api/v1/files/{test_file.id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert (await client.get(url)).status_code == 404
+
+        expires = int(time.time()) + 60
+        response = await client.get(
+            f"/api/v1/files/{deleted_file.id}/signed",
+            params={
+                "checksum": deleted_file.checksum,
+                "user": str(test_user.id),
+                "expires": expires,
+                "signature": sign_download(deleted_file.id, deleted_file.checksum, test_user.id, expires)
+            }
+        )
+        assert response.status_code == 404
+
+    async def test_signed_download_changed(
+        self,
+        client: AsyncClient,
+        test_file: File,
+        test_user
+    ):
+        """Test a URL signed for other content is gone"""
+        expires = int(time.time()) + 60
+        checksum = "0" * 64
+        response = await client.get(
+            f"/api/v1/files/{test_file.id}/signed",
+            params={
+                "checksum": checksum,
+                "user": str(test_user.id),
+                "expires": expires,
+                "signature": sign_download(test_file.id, checksum, test_user.id, expires)
+            }
+        )
+        assert response.status_code == 410
+
+    async def test_signed_url_missing_file(self, client: AsyncClient, auth_headers: dict):
+        """Test signing an unknown file is not found"""
+        response = await client.post(f"/api/v1/files/{uuid.uuid4()}/signed-url", headers=auth_headers)
+        assert response.status_code == 404
@@ -0,0 +1,240 @@
+"""
+Tests for the streaming ZIP64 writer
+
+Tests cover:
+- Archives readable by zipfile, deflated and stored
+- Parallel block deflate concatenating into one stream
+- Store-vs-deflate decisions from a sampled block
+- ZIP64 end records for offsets past 4 GB
+- Streaming bulk downloads through the API
+- Deterministic stored layouts with known size and byte ranges
+- Resumable bulk downloads with Content-Length and Range
+- Stored bulk downloads deferring members whose CRC-32 is not yet known
+"""
+import io
+import os
+import struct
+import zipfile
+import zlib
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.file import File
+from app.services.file_service import FileService
+from app.utils.zip_stream import (
+    END_OF_CENTRAL_DIRECTORY,
+    ZIP64_END,
+    ZIP64_LOCATOR,
+    StoredMember,
+    StoredZipLayout,
+    ZipMember,
+    _CentralEntry,
+    central_directory,
+    stream_zip,
+)
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def reader(data: bytes, block_size: int = 1000):
+    """Member read callable yielding ``data`` in blocks"""
+    async def read():
+        for start in range(0, len(data), block_size):
+            yield data[start:start + block_size]
+    return read
+
+
+def range_reader(data: bytes, block_size: int = 1000):
+    """Member read_range callable over ``data``"""
+    async def read_range(start, end):
+        for offset in range(start, end, block_size):
+            yield data[offset:min(offset + block_size, end)]
+    return read_range
+
+
+def stored_members(contents: dict):
+    return [
+        StoredMember(name, datetime(2026, 5, 6, 7, 8, 10), len(data), zlib.crc32(data), range_reader(data))
+        for name, data in contents.items()
+    ]
+
+
+async def collect(iterator) -> bytes:
+    return b"".join([piece async for piece in iterator])
+
+
+class TestZipStream:
+    """Test streamed archive generation"""
+
+    async def test_stream_zip_readable(self):
+        """Test a streamed archive extracts to the original files"""
+        text = b"line of text\n" * 5000
+        binary = os.urandom(12345)
+        members = [
+            ZipMember("notes.txt", datetime(2026, 3, 4, 5, 6, 8), reader(text)),
+            ZipMember("random.bin", datetime(2026, 3, 4, 5, 6, 8), reader(binary), compress=False),
+            ZipMember("empty.txt", datetime(1970, 1, 1), reader(b"")),
+            ZipMember("résumé.txt", datetime(2026, 3, 4, 5, 6, 8), reader(b"unicode name")),
+        ]
+
+        pieces = [piece async for piece in stream_zip(members)]
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(pieces)))
+
+        assert archive.testzip() is None
+        assert archive.namelist() == ["notes.txt", "random.bin", "empty.txt", "résumé.txt"]
+        assert archive.read("notes.txt") == text
+        assert archive.read("random.bin") == binary
+        assert archive.read("empty.txt") == b""
+        assert archive.read("résumé.txt") == b"unicode name"
+        assert archive.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo("notes.txt").compress_size < len(text) // 10
+        assert archive.getinfo("random.bin").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("notes.txt").date_time == (2026, 3, 4, 5, 6, 8)
+
+    async def test_parallel_deflate_matches_input(self):
+        """Test blocks deflated in parallel decompress as one stream, in order"""
+        data = b"".join(b"record %d of many, value %d\n" % (i, i * 7 % 13) for i in range(20000))
+        members = [ZipMember("records.csv", datetime(2026, 1, 1), reader(data, block_size=4096))]
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join([piece async for piece in stream_zip(members, depth=3)])))
+
+        assert archive.read("records.csv") == data
+        # Priming each block with the previous one keeps the ratio close to a single stream
+        single = len(zlib.compress(data))
+        assert archive.getinfo("records.csv").compress_size < single * 1.5
+
+    async def test_incompressible_member_stored(self):
+        """Test a member whose sampled block does not shrink is stored"""
+        noise = os.urandom(50000)
+        members = [ZipMember("noise.dat", datetime(2026, 1, 1), reader(noise, block_size=8192))]
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join([piece async for piece in stream_zip(members)])))
+
+        assert archive.getinfo("noise.dat").compress_type == zipfile.ZIP_STORED
+        assert archive.read("noise.dat") == noise
+
+    async def test_central_directory_zip64(self):
+        """Test members past 4 GB get ZIP64 extra fields and end records"""
+        entries = [
+            _CentralEntry(b"small.bin", 0, 0, 0, 1, 10, 10, 0),
+            _CentralEntry(b"large.bin", 0, 0, 0, 2, 5 * 1024 ** 3, 5 * 1024 ** 3, 100),
+        ]
+        offset = 5 * 1024 ** 3 + 200
+        records = central_directory(entries, offset)
+
+        end = END_OF_CENTRAL_DIRECTORY.unpack(records[-END_OF_CENTRAL_DIRECTORY.size:])
+        assert end[6] == 0xFFFFFFFF  # Directory offset moved to the ZIP64 record
+        locator = ZIP64_LOCATOR.unpack(
+            records[-END_OF_CENTRAL_DIRECTORY.size - ZIP64_LOCATOR.size:-END_OF_CENTRAL_DIRECTORY.size]
+        )
+        zip64_end_offset = locator[2]
+        zip64_end = ZIP64_END.unpack_from(records, zip64_end_offset - offset)
+        assert zip64_end[7] == 2
+        assert zip64_end[9] == offset
+        # Both sizes of the large member are in its extra field
+        assert struct.pack("<HH", 1, 16) + struct.pack("<QQ", 5 * 1024 ** 3, 5 * 1024 ** 3) in records
+
+    async def test_bulk_download_streams_zip(self, client: AsyncClient, auth_headers: dict, test_file: File):
+        """Test bulk downloads stream an archive of the requested files"""
+        response = await client.post(
+            "/api/v1/files/download/bulk",
+            json={"file_ids": [str(test_file.id)]},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.read(test_file.filename) == b"This is a test file content"
+
+
+class TestStoredZipLayout:
+    """Test precomputed uncompressed archives"""
+
+    async def test_layout_readable(self):
+        """Test the layout's size is exact and the archive extracts"""
+        contents = {"a.txt": b"first file\n" * 300, "empty": b"", "b.bin": os.urandom(4321)}
+        layout = StoredZipLayout(stored_members(contents))
+
+        data = await collect(layout.iter_range())
+        archive = zipfile.ZipFile(io.BytesIO(data))
+
+        assert len(data) == layout.size
+        assert archive.testzip() is None
+        for name, content in contents.items():
+            assert archive.read(name) == content
+            assert archive.getinfo(name).compress_type == zipfile.ZIP_STORED
+
+    async def test_layout_ranges(self):
+        """Test any byte range equals that slice of the whole archive"""
+        contents = {"a.txt": b"abc" * 1000, "b.txt": b"xyz" * 777}
+        layout = StoredZipLayout(stored_members(contents))
+        data = await collect(layout.iter_range())
+
+        for start, end in [(0, 1), (0, 30), (25, 3100), (3000, 5000), (layout.size - 10, layout.size), (100, 100)]:
+            assert await collect(layout.iter_range(start, end)) == data[start:end]
+
+    async def test_layout_deterministic(self):
+        """Test identical members always produce identical archives"""
+        contents = {"report.txt": b"quarterly numbers"}
+        first = await collect(StoredZipLayout(stored_members(contents)).iter_range())
+        second = await collect(StoredZipLayout(stored_members(contents)).iter_range())
+
+        assert first == second
+
+    async def test_bulk_download_ranges(
+        self,
+        client: AsyncClient,
+        auth_headers: dict,
+        test_file: File,
+        db_session: AsyncSession,
+        monkeypatch
+    ):
+        """Test stored bulk downloads declare their length and resume from an offset"""
+        file_id = test_file.id
+        backfills = []
+
+        async def backfill_crc32s(file_ids=None):
+            backfills.append(file_ids)
+
+        monkeypatch.setattr("app.routers.files.backfill_crc32s", backfill_crc32s)
+
+        # A member without a CRC-32 is not read inside the request
+        response = await client.get(
+            "/api/v1/files/download/bulk",
+            params={"file_ids": [str(file_id)]},
+            headers=auth_headers
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "60"
+        assert backfills == [[file_id]]
+
+        assert file_id in await FileService.list_files_missing_crc32(db_session, 100)
+        assert await FileService.compute_crc32(db_session, file_id) == zlib.crc32(b"This is a test file content")
+        db_session.expire_all()
+
+        response = await client.get(
+            "/api/v1/files/download/bulk",
+            params={"file_ids": [str(file_id)]},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert response.headers["accept-ranges"] == "bytes"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.read("test_file.txt") == b"This is a test file content"
+
+        resumed = await client.get(
+            "/api/v1/files/download/bulk",
+            params={"file_ids": [str(file_id)]},
+            headers={**auth_headers, "Range": "bytes=20-", "If-Range": response.headers["etag"]}
+        )
+
+        assert resumed.status_code == 206
+        assert resumed.content == response.content[20:]
+        assert resumed.headers["content-range"] == f"bytes 20-{len(response.content) - 1}/{len(response.content)}"
@@ -0,0 +1,184 @@
+import api from './api';
+import CryptoJS from 'crypto-js';
+
+// Delta format shared with the server, see backend/app/utils/delta.py
+const SIGNATURE_HEADER_SIZE = 20;
+const BLOCK_SIGNATURE_SIZE = 20;
+const OP_END = 0;
+const OP_COPY = 1;
+const OP_LITERAL = 2;
+const MAX_LITERAL = 1024 * 1024 * 1024; // Literal lengths are 32-bit
+const ADLER_MOD = 65521;
+
+// Bytes of the new file held in memory at a time while searching for matches
+const SEGMENT_SIZE = 8 * 1024 * 1024;
+
+// Truncated SHA-256 (16 bytes, hex) confirming a weak checksum match
+const strongHash = (bytes) =>
+  CryptoJS.SHA256(CryptoJS.lib.WordArray.create(bytes)).toString().slice(0, 32);
+
+const toHex = (bytes) =>
+  Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+
+class DeltaService {
+  /**
+   * Get the block signature of an existing file
+   */
+  async getSignature(fileId) {
+    const response = await api.get(`/files/${fileId}/signature`, {
+      responseType: 'arraybuffer'
+    });
+    return response.data;
+  }
+
+  /**
+   * Parse a signature into its block size and a weak checksum lookup
+   */
+  parseSignature(buffer) {
+    const view = new DataView(buffer);
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== 'FSG1') {
+      throw new Error('Not a file signature');
+    }
+
+    const blockSize = view.getUint32(4);
+    const blockCount = view.getUint32(16);
+    const blocks = new Map();
+    for (let index = 0; index < blockCount; index++) {
+      const offset = SIGNATURE_HEADER_SIZE + index * BLOCK_SIGNATURE_SIZE;
+      const weak = view.getUint32(offset);
+      const strong = toHex(new Uint8Array(buffer, offset + 4, 16));
+      if (!blocks.has(weak)) {
+        blocks.set(weak, []);
+      }
+      blocks.get(weak).push([index, strong]);
+    }
+    return { blockSize, blocks };
+  }
+
+  /**
+   * Encode a file as a delta against a signature
+   *
+   * Rolls an Adler-32 checksum over the file one byte at a time and
+   * confirms candidate matches with the strong hash. Literal data is
+   * referenced as slices of the file, so the delta is never copied.
+   */
+  async computeDelta(file, signatureBuffer, checksum) {
+    const { blockSize, blocks } = this.parseSignature(signatureBuffer);
+    const size = file.size;
+
+    const header = new DataView(new ArrayBuffer(48));
+    new Uint8Array(header.buffer).set(new TextEncoder().encode('FDL1'), 0);
+    header.setUint32(4, blockSize);
+    header.setBigUint64(8, BigInt(size));
+    for (let i = 0; i < 32; i++) {
+      header.setUint8(16 + i, parseInt(checksum.substr(i * 2, 2), 16));
+    }
+    const parts = [header.buffer];
+
+    let copyFirst = 0;
+    let copyCount = 0;
+    const flushCopy = () => {
+      if (copyCount) {
+        const op = new DataView(new ArrayBuffer(9));
+        op.setUint8(0, OP_COPY);
+        op.setUint32(1, copyFirst);
+        op.setUint32(5, copyCount);
+        parts.push(op.buffer);
+        copyCount = 0;
+      }
+    };
+    const emitLiteral = (start, end) => {
+      for (let from = start; from < end; from += MAX_LITERAL) {
+        const to = Math.min(end, from + MAX_LITERAL);
+        flushCopy();
+        const op = new DataView(new ArrayBuffer(5));
+        op.setUint8(0, OP_LITERAL);
+        op.setUint32(1, to - from);
+        parts.push(op.buffer, file.slice(from, to));
+      }
+    };
+
+    let segmentStart = 0;
+    let bytes = null;
+    let pos = 0;
+    let literalStart = 0;
+    let a = null;
+    let b = null;
+
+    while (pos + blockSize <= size) {
+      // Keep the window and the next byte in the loaded segment
+      if (bytes === null ||
+          (pos + blockSize >= segmentStart + bytes.length && segmentStart + bytes.length < size)) {
+        segmentStart = pos;
+        const end = Math.min(size, pos + SEGMENT_SIZE + blockSize);
+        bytes = new Uint8Array(await file.slice(pos, end).arrayBuffer());
+      }
+      const i = pos - segmentStart;
+
+      if (a === null) {
+        a = 1;
+        b = 0;
+        for (let j = i; j < i + blockSize; j++) {
+          a = (a + bytes[j]) % ADLER_MOD;
+          b = (b + a) % ADLER_MOD;
+        }
+      }
+
+      let match = -1;
+      const candidates = blocks.get(((b << 16) | a) >>> 0);
+      if (candidates) {
+        const strong = strongHash(bytes.subarray(i, i + blockSize));
+        const found = candidates.find(([, candidate]) => candidate === strong);
+        if (found) {
+          match = found[0];
+        }
+      }
+
+      if (match >= 0) {
+        emitLiteral(literalStart, pos);
+        if (copyCount && copyFirst + copyCount === match) {
+          copyCount++;
+        } else {
+          flushCopy();
+          copyFirst = match;
+          copyCount = 1;
+        }
+        pos += blockSize;
+        literalStart = pos;
+        a = null;
+        continue;
+      }
+
+      // Roll the window one byte forward
+      if (pos + blockSize < size) {
+        const outByte = bytes[i];
+        const inByte = bytes[i + blockSize];
+        a = (a - outByte + inByte + ADLER_MOD) % ADLER_MOD;
+        b = (((b - (blockSize * outByte) % ADLER_MOD + a - 1) % ADLER_MOD) + ADLER_MOD) % ADLER_MOD;
+      }
+      pos++;
+    }
+
+    emitLiteral(literalStart, size);
+    flushCopy();
+    parts.push(new Uint8Array([OP_END]));
+
+    return new Blob(parts, { type: 'application/octet-stream' });
+  }
+
+  /**
+   * Upload a delta, creating a new file from an existing one
+   */
+  async uploadDelta(baseFileId, delta, filename, mimeType = null) {
+    const response = await api.post(`/files/${baseFileId}/delta`, delta, {
+      params: { filename, mime_type: mimeType || undefined },
+      headers: {
+        'Content-Type': 'application/octet-stream'
+      }
+    });
+    return response.data;
+  }
+}
+
+export default new DeltaService();
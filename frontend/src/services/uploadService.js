@@ -2,13 +2,14 @@ import api from './api';
 
 class UploadService {
   /**
-   * Initialize a chunked upload
+   * Initialize a chunked upload; the server chooses the chunk size
    */
-  async initializeUpload(filename, fileSize, totalChunks) {
+  async initializeUpload(filename, fileSize, checksum = null, linkSpeed = null) {
     const response = await api.post('/files/upload/init', {
       filename,
       file_size: fileSize,
-      total_chunks: totalChunks
+      checksum,
+      link_speed: linkSpeed
     });
     return response.data;
   }
@@ -16,22 +17,29 @@ class UploadService {
   /**
    * Upload a single chunk
    */
-  async uploadChunk(uploadId, chunkIndex, chunkData, checksum, filename, totalChunks) {
-    const formData = new FormData();
-    formData.append('chunk_file', chunkData);
-    
-    const response = await api.post(
-      `/files/upload/chunk?upload_id=${uploadId}&chunk_number=${chunkIndex}&checksum=${checksum}&filename=${encodeURIComponent(filename)}&total_chunks=${totalChunks}`,
-      formData,
+  async uploadChunk(uploadId, chunkIndex, chunkData, checksum) {
+    // Raw body: the server streams it to disk without multipart parsing
+    const response = await api.put(
+      `/files/upload/${uploadId}/chunks/${chunkIndex}`,
+      chunkData,
       {
         headers: {
-          'Content-Type': 'multipart/form-data'
+          'Content-Type': 'application/octet-stream',
+          'X-Chunk-Checksum': checksum
         }
       }
     );
     return response.data;
   }
 
+  /**
+   * Get received and missing chunks of an upload, for resuming it
+   */
+  async getUploadStatus(uploadId) {
+    const response = await api.get(`/files/upload/${uploadId}`);
+    return response.data;
+  }
+
   /**
    * Complete the chunked upload
    */